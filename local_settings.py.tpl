@@ -16,11 +16,16 @@ SECURE_SSL_REDIRECT = False
 
 INSTALLED_APPS.extend(['debug_toolbar', 'django_extensions'])
 
-MIDDLEWARE.insert(2, 'debug_toolbar.middleware.DebugToolbarMiddleware')
+# Inside the compression middleware, the toolbar cannot be added to compressed responses
+MIDDLEWARE.insert(
+    MIDDLEWARE.index('harrastuspassi.middleware.CompressionMiddleware') + 1,
+    'debug_toolbar.middleware.DebugToolbarMiddleware',
+)
 
 
 DATABASES = {
     'default': {
+        # Or 'harrastuspassi.db.backends.postgis_pool' to reuse the connections
         'ENGINE': 'django.contrib.gis.db.backends.postgis',
         'HOST': 'localhost',
         'PORT': '5432',
@@ -32,5 +37,11 @@ DATABASES = {
     }
 }
 
+# Read replica for anonymous API reads. A second local database works too, for example for
+# the tests of harrastuspassi.db_router, which then has no replication lag.
+# The API opens a transaction for replica reads to set their statement timeout.
+# DATABASES['replica'] = dict(DATABASES['default'], NAME='bergenia_replica', ATOMIC_REQUESTS=False)
+# HARRASTUSPASSI_DATABASE_REPLICAS = ['replica']
+
 
 STATICFILES_STORAGE = 'django.contrib.staticfiles.storage.StaticFilesStorage'
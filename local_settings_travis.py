@@ -10,13 +10,14 @@ AUTH_PASSWORD_VALIDATORS = []
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.contrib.gis.db.backends.postgis',
+        'ENGINE': 'harrastuspassi.db.backends.postgis_pool',
         'NAME': 'harrastuspassi_travis_ci',
         'USER': 'postgres',
         'PASSWORD': '',
         'HOST': '',
         'PORT': '5432',
         'ATOMIC_REQUESTS': True,
+        'CONN_MAX_AGE': 0,
     }
 }
 
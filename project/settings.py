@@ -44,7 +44,9 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'django.middleware.gzip.GZipMiddleware',
+    'harrastuspassi.middleware.MetricsMiddleware',
+    'harrastuspassi.middleware.ProfilingMiddleware',
+    'harrastuspassi.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -81,6 +83,9 @@ SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 
 # default config?
 
+# Safe requests of anonymous users are read from HARRASTUSPASSI_DATABASE_REPLICAS when there are any
+DATABASE_ROUTERS = ['harrastuspassi.db_router.ReplicaRouter']
+
 
 #
 # Auth
@@ -151,6 +156,18 @@ REST_FRAMEWORK = {
         'rest_framework.authentication.TokenAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': ('rest_framework.permissions.IsAuthenticatedOrReadOnly',),
+    # rest_framework.renderers.JSONRenderer renders the same output slower
+    'DEFAULT_RENDERER_CLASSES': (
+        'harrastuspassi.renderers.FastJSONRenderer',
+        'harrastuspassi.renderers.MessagePackRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'rest_framework.parsers.JSONParser',
+        'harrastuspassi.parsers.MessagePackParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
     'DEFAULT_VERSIONING_CLASS': 'rest_framework.versioning.URLPathVersioning',
     'DEFAULT_VERSION': 'pre2',
 }
@@ -1,17 +1,21 @@
 # -*- coding: utf-8 -*-
+import re
 
 from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
 from django.contrib.staticfiles.urls import staticfiles_urlpatterns
-from django.urls import include, path
+from django.urls import include, path, re_path
 from django.views.generic import TemplateView
 from rest_framework.schemas import get_schema_view
 
+from harrastuspassi import settings as harrastuspassi_settings
 from harrastuspassi.urls.api import (
     internal_urlpatterns as api_internal_urlpatterns,
     public_urlpatterns as api_public_urlpatterns,
 )
+from harrastuspassi.views.media import serve_media
+from harrastuspassi.views.metrics import metrics_view
 
 schema_url_patterns = api_public_urlpatterns
 if settings.DEBUG:
@@ -36,10 +40,16 @@ app_urls = [
         template_name='redoc.html',
         extra_context={'schema_url': 'openapi-schema'}
     ), name='redoc'),
+    path('monitor/metrics', metrics_view, name='metrics'),
     path('monitor/', include('health_check.urls'))
 ]
 
-static_urls = static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+if harrastuspassi_settings.MEDIA_SERVING:
+    static_urls = [
+        re_path(r'^%s(?P<path>.*)$' % re.escape(settings.MEDIA_URL.lstrip('/')), serve_media, name='media'),
+    ]
+else:
+    static_urls = static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 static_urls += staticfiles_urlpatterns()
 
 urlpatterns = admin_urls + auth_urls + app_urls + static_urls
@@ -3,31 +3,42 @@
 import datetime
 import logging
 from collections import defaultdict
+from contextlib import ExitStack
 from itertools import chain
+from typing import NamedTuple, Optional, Tuple, Union
+
 
 from django.contrib.gis.measure import Distance
-from django.db.models import F, Q
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+from django.db.models import F, Prefetch, Q
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 from django.utils.translation import ugettext as _
 from django_filters import rest_framework as filters
 from django_filters.constants import EMPTY_VALUES
 from guardian.core import ObjectPermissionChecker
 from guardian.ctypes import get_content_type
 from guardian.shortcuts import get_objects_for_user
-from rest_framework import permissions, viewsets, serializers
+from psycopg2.extensions import QueryCanceledError
+from rest_framework import permissions, status, viewsets
 from rest_framework import filters as drf_filters
-from rest_framework.exceptions import ValidationError, APIException
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 from rest_framework.schemas.openapi import AutoSchema
 
-from harrastuspassi import settings
-from harrastuspassi.geocoding import get_coordinates_from_address
+from harrastuspassi import db_router, settings
+from harrastuspassi.geocoding import is_geocoding_enabled
+from harrastuspassi.images import store_uploaded_image
+from harrastuspassi.metrics import count_statement_timeout
 
 from harrastuspassi.models import (
     Benefit,
     Hobby,
     HobbyCategory,
     HobbyEvent,
+    HobbyEventListing,
     Location,
     Municipality,
     Organizer,
@@ -36,16 +47,22 @@ from harrastuspassi.models import (
 
 from harrastuspassi.serializers import (
     BenefitSerializer,
+    CoverImageUploadSerializer,
+    ExtraDataMixin,
     HobbyCategorySerializer,
     HobbyDetailSerializer,
     HobbyDetailSerializerPre1,
+    HobbyEventListingSerializer,
     HobbyEventSerializer,
     HobbySerializer,
     HobbySerializerPre1,
     LocationSerializer,
     LocationSerializerPre1,
     OrganizerSerializer,
-    PromotionSerializer
+    PromotionSerializer,
+    PromotionStatisticsQuerySerializer,
+    PromotionStatisticsSerializer,
+    SparseFieldset,
 )
 
 from project.pagination import DefaultPagination
@@ -74,18 +91,181 @@ class HasPermOrReadOnly(permissions.BasePermission):
 
 
 class PermissionPrefetchMixin:
-    def get_serializer_context(self):
-        context = super().get_serializer_context()
-        queryset = self.get_queryset()
-        if queryset:
+    """ Prefetches the object permissions of the user for the serialized objects """
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        instance = serializer.instance
+        if instance is None:
+            return serializer
+        # Not needed when the permissions are left out with the fields or omit parameters
+        fields = serializer.child.fields if kwargs.get('many') else serializer.fields
+        if 'permissions' not in fields:
+            return serializer
+        # Only the objects of the current page, not the whole queryset
+        objects = list(instance) if kwargs.get('many') else [instance]
+        if objects:
             prefetched_permission_checker = ObjectPermissionChecker(self.request.user)
-            prefetched_permission_checker.prefetch_perms(queryset)
-            context['prefetched_permission_checker'] = prefetched_permission_checker
-        return context
+            prefetched_permission_checker.prefetch_perms(objects)
+            serializer.context['prefetched_permission_checker'] = prefetched_permission_checker
+        return serializer
+
+
+class ReplicaReadMixin:
+    """ Reads safe requests of anonymous users from a read replica, and the requests following
+        a write from the default database, see harrastuspassi.db_router
+    """
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # The user is known only after DRF has authenticated the request
+        db_router.use_replica(db_router.get_replica_for_request(request))
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if request.method not in permissions.SAFE_METHODS and settings.DATABASE_REPLICAS:
+            db_router.stick_to_primary(response)
+        return response
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            db_router.use_primary()
+
+
+class SerializerProfilingMixin:
+    """ Times the serialization of the response data apart from the view in requests profiled by
+        middleware.ProfilingMiddleware
+    """
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        profile = getattr(self.request, '_profile', None)
+        if profile is not None:
+            serializer.to_representation = profile.time_serializer(serializer.to_representation)
+        return serializer
+
+
+class StatementTimeoutMixin:
+    """ Cancels database queries of the request running longer than the PostgreSQL statement_timeout.
+        The timeout is set with SET LOCAL in the request transaction, so the default database needs
+        ATOMIC_REQUESTS. Reads from a replica are made in a transaction of their own, and only the
+        replica gets the timeout. Requests with a cancelled query return 503 with Retry-After.
+    """
+    # Seconds by action, settings.STATEMENT_TIMEOUTS overrides these
+    statement_timeouts = {}
+
+    def get_action_name(self) -> str:
+        """ HobbyEventViewSet.list, as in the request metrics """
+        return f'{self.__class__.__name__}.{self.action or self.request.method.lower()}'
+
+    def get_statement_timeout(self) -> Optional[float]:
+        for view_name in (self.get_action_name(), self.__class__.__name__):
+            if view_name in settings.STATEMENT_TIMEOUTS:
+                return settings.STATEMENT_TIMEOUTS[view_name]
+        return self.statement_timeouts.get(self.action, settings.STATEMENT_TIMEOUT)
+
+    def dispatch(self, request, *args, **kwargs):
+        # Closes the replica transactions opened in initial() after the response
+        with ExitStack() as self.read_transactions:
+            return super().dispatch(request, *args, **kwargs)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        timeout = self.get_statement_timeout()
+        if not timeout:
+            return
+        milliseconds = max(int(timeout * 1000), 1)
+        read_database = db_router.get_read_database()
+        # Setting the timeout on the primary too would start a transaction there for every replica read
+        is_replica_read = read_database not in (None, DEFAULT_DB_ALIAS) and request.method in permissions.SAFE_METHODS
+        alias = read_database if is_replica_read else DEFAULT_DB_ALIAS
+        connection = connections[alias]
+        if connection.vendor != 'postgresql':
+            return
+        if is_replica_read and not connection.in_atomic_block:
+            # Replicas are configured without ATOMIC_REQUESTS, SET LOCAL needs a transaction
+            self.read_transactions.enter_context(transaction.atomic(using=alias))
+        if not connection.in_atomic_block:
+            data = {'view': self.get_action_name(), 'database': alias}
+            LOG.warning('Statement timeout not set without ATOMIC_REQUESTS', extra={'data': data})
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(f'SET LOCAL statement_timeout = {milliseconds}')
+
+    def handle_exception(self, exc):
+        is_cancelled = isinstance(exc, OperationalError) and isinstance(exc.__cause__, QueryCanceledError)
+        if not is_cancelled:
+            return super().handle_exception(exc)
+        view_name = self.get_action_name()
+        count_statement_timeout(view_name)
+        LOG.warning('Database query cancelled', extra={'data': {'view': view_name, 'error': str(exc)}})
+        # The transactions are aborted and cannot be committed
+        for connection in connections.all():
+            if connection.in_atomic_block:
+                transaction.set_rollback(True, using=connection.alias)
+        retry_after = settings.STATEMENT_TIMEOUT_RETRY_AFTER
+        response = Response(
+            {'detail': _('The request took too long. Try again in a moment.'), 'retry_after': retry_after},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            headers={'Retry-After': str(retry_after)},
+        )
+        response.exception = True
+        return response
+
+
+class CoverImageUploadMixin:
+    """ PUT <object>/cover-image/ uploads the cover image as multipart/form-data instead of Base64 in the JSON body.
+        Django spools large uploads to a temporary file, and the resized versions are generated after saving,
+        see images.schedule_derivatives.
+    """
+    @action(detail=True, methods=['put'], url_path='cover-image', parser_classes=(MultiPartParser,))
+    def upload_cover_image(self, request, *args, **kwargs):
+        instance = self.get_object()
+        upload_serializer = CoverImageUploadSerializer(data=request.data)
+        upload_serializer.is_valid(raise_exception=True)
+        uploaded_file = upload_serializer.validated_data['cover_image']
+        directory = instance._meta.get_field('cover_image').upload_to
+        instance.cover_image = store_uploaded_image(directory, uploaded_file, uploaded_file.image.format)
+        instance.save()
+        return Response(self.get_serializer(instance).data)
+
+
+class QuerysetPlan(NamedTuple):
+    """ Related objects to load with the queryset, and fields not to load """
+    select_related: Tuple[str, ...] = ()
+    prefetch_related: Tuple[Union[str, Prefetch], ...] = ()
+    defer: Tuple[str, ...] = ()
+
+
+class QuerysetPlanningMixin:
+    """ Loads the related objects needed by the serializer with a constant number of queries.
+        Views describe them in get_queryset_plan() for the current API version, include parameters
+        and sparse fieldset.
+    """
+    def get_includes(self):
+        return self.request.query_params.getlist(ExtraDataMixin.INCLUDE_PARAMETER_NAME)
+
+    def get_fieldset(self) -> SparseFieldset:
+        return SparseFieldset.from_request(self.request)
+
+    def get_queryset_plan(self) -> QuerysetPlan:
+        return QuerysetPlan()
+
+    def apply_queryset_plan(self, queryset):
+        plan = self.get_queryset_plan()
+        if plan.select_related:
+            queryset = queryset.select_related(*plan.select_related)
+        if plan.prefetch_related:
+            queryset = queryset.prefetch_related(*plan.prefetch_related)
+        if plan.defer:
+            queryset = queryset.defer(*plan.defer)
+        return queryset
+
+    def get_queryset(self):
+        return self.apply_queryset_plan(super().get_queryset())
 
 
 class ExtraDataSchema(AutoSchema):
-    """ Schema describing the include parameter from ExtraDataMixin for serializers """
+    """ Schema describing the include, fields and omit parameters from ExtraDataMixin for serializers """
     def __init__(self, *args, **kwargs):
         self.include_description = kwargs.pop('include_description')
         if self.include_description is None:
@@ -103,6 +283,22 @@ class ExtraDataSchema(AutoSchema):
                 'schema': {'type': 'string'},
             }
             operation['parameters'].append(include_parameter)
+            operation['parameters'].extend([
+                {
+                    'description': 'Comma separated fields to return, by default all fields are returned',
+                    'in': 'query',
+                    'name': SparseFieldset.FIELDS_PARAMETER_NAME,
+                    'required': False,
+                    'schema': {'type': 'string'},
+                },
+                {
+                    'description': 'Comma separated fields to leave out',
+                    'in': 'query',
+                    'name': SparseFieldset.OMIT_PARAMETER_NAME,
+                    'required': False,
+                    'schema': {'type': 'string'},
+                },
+            ])
         return operation
 
 
@@ -112,6 +308,11 @@ class HobbyCategoryFilter(filters.FilterSet):
 
 class HobbyEventSearchFilter(drf_filters.SearchFilter):
     """ Custom search filter that takes categories descendants into account """
+    def get_category_lookup(self, queryset):
+        if queryset.model is HobbyEventListing:
+            return 'category_ids__overlap'
+        return 'hobby__categories__in'
+
     def filter_queryset(self, request, queryset, view):
         qs = super().filter_queryset(request, queryset, view)
         search_terms = self.get_search_terms(request)
@@ -127,17 +328,19 @@ class HobbyEventSearchFilter(drf_filters.SearchFilter):
             category_ids += parent_ids
             category_ids += descendant_ids
         if category_ids:
+            category_filter = {self.get_category_lookup(queryset): category_ids}
             try:
-                qs |= queryset.filter(hobby__categories__in=category_ids)
+                qs |= queryset.filter(**category_filter)
             except AssertionError:
                 # AssertionError: Cannot combine a unique query with a non-unique query.
                 # Both queries must be distinct (unique query)
-                qs |= queryset.filter(hobby__categories__in=category_ids).distinct()
+                qs |= queryset.filter(**category_filter).distinct()
             qs = qs.distinct()
         return qs
 
 
-class HobbyCategoryViewSet(viewsets.ReadOnlyModelViewSet):
+class HobbyCategoryViewSet(StatementTimeoutMixin, ReplicaReadMixin, SerializerProfilingMixin,
+                           viewsets.ReadOnlyModelViewSet):
     filter_backends = (filters.DjangoFilterBackend,)
     filterset_class = HobbyCategoryFilter
     queryset = HobbyCategory.objects.all()
@@ -158,6 +361,17 @@ class HierarchyModelMultipleChoiceFilter(filters.ModelMultipleChoiceFilter):
         return super().filter(qs, list(values_with_children))
 
 
+class HierarchyArrayOverlapFilter(filters.ModelMultipleChoiceFilter):
+    """ Filters an array of ids by the given objects and their children. Use with MPTT models. """
+    def filter(self, qs, value):
+        if not value:
+            return qs
+        ids = set(chain.from_iterable(
+            obj.get_descendants(include_self=True).values_list('pk', flat=True) for obj in value
+        ))
+        return qs.filter(**{f'{self.field_name}__overlap': list(ids)})
+
+
 class NearestOrderingFilter(filters.OrderingFilter):
 
     def get_coordinates(self):
@@ -227,6 +441,29 @@ class NearestOrderingFilter(filters.OrderingFilter):
         return qs
 
 
+def get_hobby_queryset_plan(version, includes, prefix='', fieldset=SparseFieldset()):
+    """ Related objects serialized by HobbySerializer and HobbyNestedSerializer, and their pre1 versions.
+        prefix is the path to the hobby, for example 'hobby__'.
+    """
+    select_related = []
+    prefetch_related = []
+    defer = []
+    # Categories are needed for the cover image fallback, and for the category field in pre1
+    if fieldset.includes_any('categories', 'category', 'cover_image', 'cover_image_srcset'):
+        prefetch_related.append(f'{prefix}categories')
+    # TODO: DEPRECATE VERSION pre1
+    if version != 'pre1' and fieldset.includes('municipality'):
+        select_related.append(f'{prefix}municipality')
+    if 'location_detail' in includes and fieldset.includes('location'):
+        select_related.append(f'{prefix}location')
+    if 'organizer_detail' in includes and fieldset.includes('organizer'):
+        select_related.append(f'{prefix}organizer')
+    if not fieldset.includes('description'):
+        defer.append(f'{prefix}description')
+    return QuerysetPlan(
+        select_related=tuple(select_related), prefetch_related=tuple(prefetch_related), defer=tuple(defer))
+
+
 class HobbyFilter(filters.FilterSet):
     category = HierarchyModelMultipleChoiceFilter(
         field_name='categories', queryset=HobbyCategory.objects.all(),
@@ -267,16 +504,19 @@ class HobbyFilter(filters.FilterSet):
         return queryset
 
 
-class HobbyViewSet(PermissionPrefetchMixin, viewsets.ModelViewSet):
+class HobbyViewSet(StatementTimeoutMixin, ReplicaReadMixin, SerializerProfilingMixin, PermissionPrefetchMixin,
+                   QuerysetPlanningMixin, CoverImageUploadMixin, viewsets.ModelViewSet):
     filter_backends = (filters.DjangoFilterBackend,)
     filterset_class = HobbyFilter
     permission_classes = (permissions.IsAuthenticatedOrReadOnly, HasPermOrReadOnly)
-    queryset = Hobby.objects.all().select_related('location', 'organizer')
+    queryset = Hobby.objects.all()
     schema = ExtraDataSchema(
         include_description=('Include extra data in the response. Multiple include parameters are supported.'
                              ' Possible options: location_detail, organizer_detail'))
     serializer_class = HobbySerializer
     pagination_class = DefaultPagination
+    # Searching and ordering by distance can be slow
+    statement_timeouts = {'list': 10}
 
     def get_serializer_class(self):
         # TODO: DEPRECATE VERSION pre1
@@ -284,6 +524,9 @@ class HobbyViewSet(PermissionPrefetchMixin, viewsets.ModelViewSet):
             return HobbySerializerPre1
         return self.serializer_class
 
+    def get_queryset_plan(self):
+        return get_hobby_queryset_plan(self.request.version, self.get_includes(), fieldset=self.get_fieldset())
+
     @property
     def paginator(self):
         if self.request.version in ['pre1', 'pre2']:
@@ -356,24 +599,79 @@ class HobbyEventFilter(filters.FilterSet):
         return queryset
 
 
-class HobbyEventViewSet(viewsets.ModelViewSet):
+class HobbyEventListingFilter(HobbyEventFilter):
+    category = HierarchyArrayOverlapFilter(
+        field_name='category_ids', queryset=HobbyCategory.objects.all(),
+        label=_('HobbyCategory id'),
+    )
+
+    class Meta(HobbyEventFilter.Meta):
+        model = HobbyEventListing
+
+    def filter_price_type(self, queryset, name, value):
+        value_in_price_type_choices = any(value == price_type for price_type, label in Hobby.PRICE_TYPE_CHOICES)
+        if value_in_price_type_choices:
+            queryset = queryset.filter(price_type=value)
+        return queryset
+
+
+class HobbyEventViewSet(StatementTimeoutMixin, ReplicaReadMixin, SerializerProfilingMixin, QuerysetPlanningMixin,
+                        viewsets.ModelViewSet):
     filter_backends = (filters.DjangoFilterBackend, HobbyEventSearchFilter)
-    filterset_class = HobbyEventFilter
     schema = ExtraDataSchema(
         include_description=('Include extra data in the response. Multiple include parameters are supported.'
                              ' Possible options: hobby_detail'))
     serializer_class = HobbyEventSerializer
     permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
     pagination_class = DefaultPagination
-    search_fields = ['hobby__name', 'hobby__description']
+    statement_timeouts = {'list': 10}
+
+    def uses_listing(self):
+        """ The next events of hobbies are listed from the denormalized HobbyEventListing table.
+            All events of a hobby, including past ones, are listed from HobbyEvent.
+        """
+        if not settings.HOBBY_EVENT_LISTING_ENABLED or self.request is None or self.action != 'list':
+            return False
+        # TODO: DEPRECATE VERSION pre1
+        if self.request.version == 'pre1':
+            return False
+        return 'hobby' not in self.request.query_params
+
+    @property
+    def filterset_class(self):
+        return HobbyEventListingFilter if self.uses_listing() else HobbyEventFilter
+
+    @property
+    def search_fields(self):
+        if self.uses_listing():
+            return ['hobby_name', 'hobby_description']
+        return ['hobby__name', 'hobby__description']
+
+    def get_serializer_class(self):
+        if self.uses_listing():
+            return HobbyEventListingSerializer
+        return self.serializer_class
 
     def get_queryset(self):
+        if self.uses_listing():
+            queryset = HobbyEventListing.objects.filter(is_next_event=True)
+            if 'hobby_detail' not in self.get_includes() or not self.get_fieldset().includes('hobby'):
+                queryset = queryset.defer('hobby_description')
+            return queryset
         hobby_in_query_params = self.request.query_params.get('hobby', None)
         queryset = HobbyEvent.objects.all()
         # Hobby may have dozens of events, so only return relevant for the list view
         if self.action == 'list' and not hobby_in_query_params:
             queryset = queryset.filter(hobby_via_next_event__isnull=False)
-        return queryset.select_related('hobby__location', 'hobby__organizer')
+        return self.apply_queryset_plan(queryset)
+
+    def get_queryset_plan(self):
+        if 'hobby_detail' not in self.get_includes() or not self.get_fieldset().includes('hobby'):
+            return QuerysetPlan()
+        # HobbyNestedSerializer always nests the location and the organizer
+        # TODO: DEPRECATE VERSION pre1
+        includes = [] if self.request.version == 'pre1' else ['location_detail', 'organizer_detail']
+        return get_hobby_queryset_plan(self.request.version, includes, prefix='hobby__')
 
     @property
     def paginator(self):
@@ -383,7 +681,7 @@ class HobbyEventViewSet(viewsets.ModelViewSet):
             return super().paginator
 
 
-class OrganizerViewSet(viewsets.ModelViewSet):
+class OrganizerViewSet(StatementTimeoutMixin, ReplicaReadMixin, SerializerProfilingMixin, viewsets.ModelViewSet):
     queryset = Organizer.objects.all()
     serializer_class = OrganizerSerializer
     permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
@@ -399,7 +697,7 @@ class OrganizerViewSet(viewsets.ModelViewSet):
         serializer.save(created_by=self.request.user, municipality=municipality)
 
 
-class LocationViewSet(viewsets.ModelViewSet):
+class LocationViewSet(StatementTimeoutMixin, ReplicaReadMixin, SerializerProfilingMixin, viewsets.ModelViewSet):
     serializer_class = LocationSerializer
     permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
 
@@ -417,19 +715,35 @@ class LocationViewSet(viewsets.ModelViewSet):
 
     def perform_create(self, serializer):
         municipality = Municipality.get_current_municipality_for_moderator(self.request.user)
-        if settings.GOOGLE_GEOCODING_API_KEY and 'coordinates' not in self.request.data:
-            address = self.request.data.get('address', '')
-            zip_code = self.request.data.get('zip_code', '')
-            city = self.request.data.get('city', '')
-            formatted_address = f'{address},+{zip_code}+{city}'
-            try:
-                coordinates = get_coordinates_from_address(formatted_address)
-            except APIException:
-                raise serializers.ValidationError('This address could not be geocoded. Please confirm your address is right, or try again later.')
-            serializer.save(created_by=self.request.user, municipality=municipality, coordinates=coordinates)
+        if is_geocoding_enabled() and 'coordinates' not in self.request.data:
+            # Coordinates are geocoded in the background, see tasks.geocode_pending_locations
+            serializer.save(
+                created_by=self.request.user,
+                municipality=municipality,
+                geocoding_status=Location.GEOCODING_PENDING,
+                geocoding_next_attempt_at=timezone.now(),
+            )
         else:
             serializer.save(created_by=self.request.user, municipality=municipality)
 
+    def perform_update(self, serializer):
+        location = serializer.instance
+        address_changed = any(
+            field in serializer.validated_data and serializer.validated_data[field] != getattr(location, field)
+            for field in ('address', 'zip_code', 'city')
+        )
+        if serializer.validated_data.get('coordinates') is not None:
+            # Coordinates given by the user are never overwritten by the geocoding
+            serializer.save(geocoding_status=Location.GEOCODING_DONE, geocoding_next_attempt_at=None)
+        elif address_changed and is_geocoding_enabled():
+            serializer.save(
+                geocoding_status=Location.GEOCODING_PENDING,
+                geocoding_attempts=0,
+                geocoding_next_attempt_at=timezone.now(),
+            )
+        else:
+            serializer.save()
+
 
 class PromotionFilter(filters.FilterSet):
     exclude_past_events = filters.BooleanFilter(method='filter_past_events', label=_('Show upcoming only'))
@@ -473,7 +787,8 @@ class PromotionFilter(filters.FilterSet):
             return self.queryset.none()
 
 
-class PromotionViewSet(viewsets.ModelViewSet):
+class PromotionViewSet(StatementTimeoutMixin, ReplicaReadMixin, SerializerProfilingMixin, CoverImageUploadMixin,
+                       viewsets.ModelViewSet):
     queryset = Promotion.objects.all()
     serializer_class = PromotionSerializer
     filter_backends = (filters.DjangoFilterBackend, drf_filters.SearchFilter)
@@ -484,8 +799,31 @@ class PromotionViewSet(viewsets.ModelViewSet):
         municipality = Municipality.get_current_municipality_for_moderator(self.request.user)
         serializer.save(municipality=municipality)
 
-
-class BenefitViewSet(viewsets.ModelViewSet):
-    queryset = Benefit.objects.all()
+    @action(detail=True)
+    def statistics(self, request, *args, **kwargs):
+        """ Daily usage of the promotion, updated periodically by the update_promotion_statistics command """
+        promotion = self.get_object()
+        query_serializer = PromotionStatisticsQuerySerializer(data=request.query_params)
+        query_serializer.is_valid(raise_exception=True)
+        statistics = promotion.usage_statistics.all()
+        if 'start_date' in query_serializer.validated_data:
+            statistics = statistics.filter(date__gte=query_serializer.validated_data['start_date'])
+        if 'end_date' in query_serializer.validated_data:
+            statistics = statistics.filter(date__lte=query_serializer.validated_data['end_date'])
+        serializer = PromotionStatisticsSerializer(
+            promotion, context=dict(self.get_serializer_context(), statistics=statistics))
+        return Response(serializer.data)
+
+
+class BenefitViewSet(StatementTimeoutMixin, ReplicaReadMixin, SerializerProfilingMixin, viewsets.ModelViewSet):
+    queryset = Benefit.objects.order_by('-created_at')
     serializer_class = BenefitSerializer
     permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
+    pagination_class = DefaultPagination
+
+    @property
+    def paginator(self):
+        if self.request.version in ['pre1', 'pre2']:
+            return None
+        else:
+            return super().paginator
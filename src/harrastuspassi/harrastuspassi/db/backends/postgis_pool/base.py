@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+""" PostGIS database backend keeping the connections in a pool of each process, see harrastuspassi.db.pool.
+
+    DATABASES = {
+        'default': {
+            'ENGINE': 'harrastuspassi.db.backends.postgis_pool',
+            # Return the connection to the pool at the end of each request
+            'CONN_MAX_AGE': 0,
+            ...
+        }
+    }
+"""
+from django.contrib.gis.db.backends.postgis.base import DatabaseWrapper as PostGISDatabaseWrapper
+from django.db.backends.base.base import NO_DB_ALIAS
+
+from harrastuspassi.db.pool import get_pool
+
+from .creation import DatabaseCreation
+
+
+class DatabaseWrapper(PostGISDatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = None
+
+    def get_new_connection(self, conn_params):
+        # Connections made for creating and dropping databases are not pooled
+        if self.alias == NO_DB_ALIAS:
+            return super().get_new_connection(conn_params)
+        self.pool = get_pool(self.alias, conn_params)
+        connection = self.pool.acquire(lambda: super(DatabaseWrapper, self).get_new_connection(conn_params))
+        # Set by PostgreSQL's get_new_connection() for new connections only
+        self.isolation_level = self.settings_dict['OPTIONS'].get('isolation_level', connection.isolation_level)
+        return connection
+
+    def _close(self):
+        if self.connection is None or self.pool is None:
+            return super()._close()
+        with self.wrap_database_errors:
+            # A connection closed inside an atomic block is still referenced until the block exits
+            self.pool.release(self.connection, reusable=not self.in_atomic_block)
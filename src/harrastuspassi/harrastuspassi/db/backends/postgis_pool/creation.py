@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+from django.db.backends.postgresql.creation import DatabaseCreation as PostgreSQLDatabaseCreation
+
+from harrastuspassi.db.pool import close_pools
+
+
+class DatabaseCreation(PostgreSQLDatabaseCreation):
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # PostgreSQL does not drop a database which has open connections
+        close_pools(test_database_name)
+        super()._destroy_test_db(test_database_name, verbosity)
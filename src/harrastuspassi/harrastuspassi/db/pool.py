@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+""" Connection pools of the harrastuspassi.db.backends.postgis_pool database backend.
+
+    Each process has its own pools, one per database alias and connection parameters, so gunicorn
+    workers never share the connections of the master process. Django closes the connection of a
+    request when the request finishes if CONN_MAX_AGE is 0, which returns it to the pool instead.
+    Threads of a process share the pool and wait for a free connection when all of them are in use.
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+
+import psycopg2
+from psycopg2 import extensions
+
+from harrastuspassi import settings
+from harrastuspassi.metrics import (
+    DATABASE_POOL_CHECKOUTS,
+    DATABASE_POOL_CONNECTIONS,
+    DATABASE_POOL_DISCARDS,
+    DATABASE_POOL_WAIT,
+)
+
+LOG = logging.getLogger(__name__)
+
+
+class PoolTimeout(psycopg2.OperationalError):
+    """ Raised as django.db.OperationalError when no connection is freed in time """
+
+
+class IdleConnection(NamedTuple):
+    connection: extensions.connection
+    created_at: float
+    returned_at: float
+
+
+class ConnectionPool:
+    """ At most max_size connections, reused from the most recently returned one. Connections idle for
+        health_check_after seconds are checked with a query before reuse, and connections older than
+        max_lifetime seconds are replaced.
+    """
+
+    def __init__(self, alias: str, database_name: Optional[str], max_size: int, timeout: float,
+                 max_lifetime: float, health_check_after: float):
+        self.alias = alias
+        self.database_name = database_name
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.health_check_after = health_check_after
+        self.pid = os.getpid()
+        self.closed = False
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._idle = deque()
+        # id() of checked out connections -> creation time
+        self._created_at = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, connect: Callable[[], extensions.connection]) -> extensions.connection:
+        """ Take an idle connection, or open a new one with connect() """
+        wait_start = time.monotonic()
+        if not self._slots.acquire(timeout=self.timeout):
+            DATABASE_POOL_CHECKOUTS.labels(self.alias, 'timeout').inc()
+            raise PoolTimeout(f'No free connection to database {self.alias} in {self.timeout} seconds,'
+                              f' all {self.max_size} connections are in use')
+        DATABASE_POOL_WAIT.labels(self.alias).observe(time.monotonic() - wait_start)
+        try:
+            connection, created_at = self._take_idle()
+            result = 'reused'
+            if connection is None:
+                connection, created_at = connect(), time.monotonic()
+                result = 'new'
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._created_at[id(connection)] = created_at
+        DATABASE_POOL_CHECKOUTS.labels(self.alias, result).inc()
+        DATABASE_POOL_CONNECTIONS.labels(self.alias, 'in_use').inc()
+        return connection
+
+    def release(self, connection: extensions.connection, reusable: bool = True) -> None:
+        """ Return a connection taken with acquire(). Connections which are not reusable are closed. """
+        if self.pid != os.getpid():
+            # Inherited from the parent process, closing it would close the connection of the parent too
+            return
+        with self._lock:
+            created_at = self._created_at.pop(id(connection), None)
+        if created_at is None:
+            connection.close()
+            return
+        try:
+            if self.closed or not reusable:
+                self._discard(connection, 'closed')
+            elif not self._reset(connection):
+                self._discard(connection, 'broken')
+            else:
+                with self._lock:
+                    self._idle.append(IdleConnection(connection, created_at, time.monotonic()))
+                DATABASE_POOL_CONNECTIONS.labels(self.alias, 'idle').inc()
+        finally:
+            DATABASE_POOL_CONNECTIONS.labels(self.alias, 'in_use').dec()
+            self._slots.release()
+
+    def close(self) -> None:
+        """ Close the idle connections, and the ones in use once they are returned """
+        self.closed = True
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return
+                idle_connection = self._idle.popleft()
+            DATABASE_POOL_CONNECTIONS.labels(self.alias, 'idle').dec()
+            self._discard(idle_connection.connection, 'closed')
+
+    def _take_idle(self) -> Tuple[Optional[extensions.connection], Optional[float]]:
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return None, None
+                idle_connection = self._idle.pop()
+            DATABASE_POOL_CONNECTIONS.labels(self.alias, 'idle').dec()
+            now = time.monotonic()
+            needs_check = now - idle_connection.returned_at >= self.health_check_after
+            if now - idle_connection.created_at >= self.max_lifetime:
+                self._discard(idle_connection.connection, 'expired')
+            elif idle_connection.connection.closed or needs_check and not self._is_usable(idle_connection.connection):
+                self._discard(idle_connection.connection, 'broken')
+            else:
+                return idle_connection.connection, idle_connection.created_at
+
+    def _is_usable(self, connection: extensions.connection) -> bool:
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            if not connection.autocommit:
+                connection.rollback()
+        except psycopg2.Error:
+            return False
+        return True
+
+    def _reset(self, connection: extensions.connection) -> bool:
+        """ Roll back what the previous user left open. SET LOCAL settings end with the transaction. """
+        if connection.closed:
+            return False
+        status = connection.get_transaction_status()
+        if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        if status != extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                connection.rollback()
+            except psycopg2.Error:
+                return False
+        return True
+
+    def _discard(self, connection: extensions.connection, reason: str) -> None:
+        DATABASE_POOL_DISCARDS.labels(self.alias, reason).inc()
+        try:
+            connection.close()
+        except psycopg2.Error as e:
+            LOG.warning('Could not close pooled connection', extra={'data': {'database': self.alias, 'error': str(e)}})
+
+
+_pools: Dict[Tuple, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias: str, conn_params: Dict) -> ConnectionPool:
+    """ Pool of this process for the database alias and connection parameters """
+    key = (os.getpid(), alias, repr(sorted(conn_params.items())))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(
+                alias,
+                conn_params.get('database'),
+                max_size=settings.DATABASE_POOL_MAX_SIZE,
+                timeout=settings.DATABASE_POOL_TIMEOUT,
+                max_lifetime=settings.DATABASE_POOL_MAX_LIFETIME,
+                health_check_after=settings.DATABASE_POOL_HEALTH_CHECK_AFTER,
+            )
+    return pool
+
+
+def close_pools(database_name: Optional[str] = None) -> None:
+    """ Close the pools of this process, of all databases or of the named database """
+    with _pools_lock:
+        pools = [
+            _pools.pop(key) for key, pool in list(_pools.items())
+            if key[0] == os.getpid() and database_name in (None, pool.database_name)
+        ]
+    for pool in pools:
+        pool.close()
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+""" Reads from PostgreSQL read replicas.
+
+    Safe requests of anonymous users to the API are read from a replica, see ReplicaReadMixin
+    in api.py. Everything else, including all writes, uses the default database. A replica is
+    only used while its replication lag is at most HARRASTUSPASSI_DATABASE_REPLICA_MAX_LAG seconds,
+    and clients which have written through the API are read from the default database for
+    HARRASTUSPASSI_DATABASE_STICKY_PRIMARY_SECONDS, so that they see their own writes.
+"""
+import logging
+import random
+import threading
+import time
+from typing import Optional
+
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from rest_framework import permissions
+
+from harrastuspassi import settings
+from harrastuspassi.metrics import count_database_read
+
+LOG = logging.getLogger(__name__)
+
+STICKY_PRIMARY_COOKIE = 'harrastuspassi_primary'
+# Seconds since the last transaction replayed from the primary, or 0 if everything received has been replayed.
+# A database which is not in recovery, like a second local database in development, has no lag.
+REPLICA_LAG_SQL = '''
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+'''
+
+_state = threading.local()
+# Database alias -> (time of the check, lag in seconds or None if unknown), shared by the threads
+_replica_lags = {}
+
+
+def get_read_database() -> Optional[str]:
+    """ Replica used by the current request, or None for the default database """
+    return getattr(_state, 'read_database', None)
+
+
+def use_replica(alias: Optional[str]) -> None:
+    _state.read_database = alias
+
+
+def use_primary() -> None:
+    _state.read_database = None
+
+
+def get_replica_lag(alias: str) -> Optional[float]:
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute(REPLICA_LAG_SQL)
+            lag = cursor.fetchone()[0]
+    except DatabaseError as e:
+        LOG.warning('Could not check replica lag', extra={'data': {'database': alias, 'error': str(e)}})
+        return None
+    return None if lag is None else float(lag)
+
+
+def is_replica_available(alias: str) -> bool:
+    """ The lag is checked at most every DATABASE_REPLICA_LAG_CHECK_INTERVAL seconds by each process """
+    now = time.monotonic()
+    checked_at, lag = _replica_lags.get(alias, (None, None))
+    if checked_at is None or now - checked_at >= settings.DATABASE_REPLICA_LAG_CHECK_INTERVAL:
+        # Threads checking at the same time only make an extra query
+        lag = get_replica_lag(alias)
+        _replica_lags[alias] = (now, lag)
+    return lag is not None and lag <= settings.DATABASE_REPLICA_MAX_LAG
+
+
+def choose_replica() -> Optional[str]:
+    """ A random replica which is not lagging behind, or None if there is none """
+    available_replicas = [alias for alias in settings.DATABASE_REPLICAS if is_replica_available(alias)]
+    return random.choice(available_replicas) if available_replicas else None
+
+
+def get_replica_for_request(request) -> Optional[str]:
+    """ Replica to read a DRF request from once it has been authenticated, or None for the default database """
+    if not settings.DATABASE_REPLICAS:
+        return None
+    if request.method not in permissions.SAFE_METHODS or request.user.is_authenticated:
+        return None
+    if STICKY_PRIMARY_COOKIE in request.COOKIES:
+        count_database_read('sticky_primary')
+        return None
+    replica = choose_replica()
+    count_database_read(replica or 'lagging_primary')
+    return replica
+
+
+def stick_to_primary(response) -> None:
+    """ Read the following requests of the client from the default database, until the replicas have caught up """
+    response.set_cookie(
+        STICKY_PRIMARY_COOKIE, '1', max_age=settings.DATABASE_STICKY_PRIMARY_SECONDS, httponly=True, samesite='Lax')
+
+
+class ReplicaRouter:
+    """ Routes reads to the replica chosen for the current request. Instances read from a replica
+        are saved to the default database.
+    """
+
+    def db_for_read(self, model, **hints):
+        return get_read_database()
+
+    def db_for_write(self, model, **hints):
+        # Without a router Django writes to the database the instance was read from
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
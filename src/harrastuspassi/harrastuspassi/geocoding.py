@@ -1,36 +1,188 @@
 # -*- coding: utf-8 -*-
 import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Dict, Iterable, Optional
 
 import requests
 from django.contrib.gis.geos import Point
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
 from rest_framework.exceptions import APIException
 
 from harrastuspassi import settings
+from harrastuspassi.metrics import count_cache_lookup
+from harrastuspassi.models import GeocodedAddress
 
 LOG = logging.getLogger(__name__)
 
 
-def get_coordinates_from_address(address):
-    payload = {
-        'key': settings.GOOGLE_GEOCODING_API_KEY,
-        'address': address
-    }
+class GeocodingError(APIException):
+    default_detail = 'Could not geocode given address'
+
+
+class GeocodingProvider:
+    """ Base class for geocoding providers.
+        geocode() returns None when the address does not exist, and raises GeocodingError
+        when the lookup failed for some other reason. Only the former is cached.
+        Providers are called from several threads by geocode_addresses().
+    """
+
+    @classmethod
+    def is_enabled(cls) -> bool:
+        return True
+
+    def geocode(self, address: str) -> Optional[Point]:
+        raise NotImplementedError
+
+
+class GoogleGeocodingProvider(GeocodingProvider):
     url = 'https://maps.googleapis.com/maps/api/geocode/json'
-    try:
-        response = requests.get(url, params=payload, timeout=settings.DEFAULT_REQUESTS_TIMEOUT)
-        location_data = response.json()
-    except requests.exceptions.RequestException:
-        LOG.error(
-            "Invalid response from GeoCoding API",
-            extra={
-                "data": {
-                    "status_code": response.status_code,
-                    "location_data": repr(response.content),
-                }
-            },
-        )
-    if not location_data['status'] == 'OK':
-        raise APIException('Could not geocode given address')
-    lat = location_data['results'][0]['geometry']['location']['lat']
-    lon = location_data['results'][0]['geometry']['location']['lng']
-    return Point(lon, lat)
+
+    @classmethod
+    def is_enabled(cls) -> bool:
+        return bool(settings.GOOGLE_GEOCODING_API_KEY)
+
+    def geocode(self, address: str) -> Optional[Point]:
+        payload = {
+            'key': settings.GOOGLE_GEOCODING_API_KEY,
+            'address': address
+        }
+        try:
+            response = requests.get(self.url, params=payload, timeout=settings.DEFAULT_REQUESTS_TIMEOUT)
+            location_data = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            LOG.error(
+                "Invalid response from GeoCoding API",
+                extra={
+                    "data": {
+                        "address": address,
+                        "error": str(e),
+                    }
+                },
+            )
+            raise GeocodingError()
+        if location_data['status'] == 'ZERO_RESULTS':
+            return None
+        if not location_data['status'] == 'OK':
+            LOG.error('GeoCoding API request failed', extra={'data': {'status': location_data['status']}})
+            raise GeocodingError()
+        lat = location_data['results'][0]['geometry']['location']['lat']
+        lon = location_data['results'][0]['geometry']['location']['lng']
+        return Point(lon, lat)
+
+
+def get_provider() -> GeocodingProvider:
+    return import_string(settings.GEOCODING_PROVIDER)()
+
+
+def is_geocoding_enabled() -> bool:
+    return import_string(settings.GEOCODING_PROVIDER).is_enabled()
+
+
+def format_address(address: str, zip_code: str, city: str) -> str:
+    return f'{address},+{zip_code}+{city}'
+
+
+def normalize_address(address: str) -> str:
+    """ 'Mannerheimintie 1,+00100+HELSINKI' -> 'mannerheimintie 1 00100 helsinki' """
+    return re.sub(r'[\s,+]+', ' ', address).strip().casefold()
+
+
+def get_cache_filter() -> Q:
+    """ Cached results which have not expired yet """
+    now = timezone.now()
+    return (
+        Q(coordinates__isnull=False, updated_at__gte=now - timedelta(days=settings.GEOCODING_CACHE_TTL_DAYS)) |
+        Q(coordinates__isnull=True, updated_at__gte=now - timedelta(days=settings.GEOCODING_NEGATIVE_CACHE_TTL_DAYS))
+    )
+
+
+def store_geocoding_result(normalized_address: str, coordinates: Optional[Point]) -> None:
+    GeocodedAddress.objects.update_or_create(address=normalized_address, defaults={'coordinates': coordinates})
+
+
+def get_coordinates_from_address(address: str) -> Point:
+    """ Geocode a single address, using cached results when available """
+    normalized_address = normalize_address(address)
+    geocoded_address = GeocodedAddress.objects.filter(get_cache_filter(), address=normalized_address).first()
+    count_cache_lookup('geocoding', hit=geocoded_address is not None)
+    if geocoded_address:
+        coordinates = geocoded_address.coordinates
+    else:
+        coordinates = get_provider().geocode(address)
+        store_geocoding_result(normalized_address, coordinates)
+    if coordinates is None:
+        raise GeocodingError()
+    return coordinates
+
+
+class RateLimiter:
+    """ Spaces out calls from several threads to at most rate calls per second """
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate else 0
+        self.next_call_at = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self) -> None:
+        with self.lock:
+            now = time.monotonic()
+            call_at = max(now, self.next_call_at)
+            self.next_call_at = call_at + self.interval
+        if call_at > now:
+            time.sleep(call_at - now)
+
+
+def geocode_addresses(addresses: Iterable[str], max_workers: int = None,
+                      rate_limit: float = None) -> Dict[str, Optional[Point]]:
+    """ Geocode many addresses concurrently. Returns a dict mapping each address to its
+        coordinates, or None if the address does not exist. Addresses whose lookup failed
+        are left out. Each distinct address is looked up at most once, and database access
+        happens only in the calling thread.
+    """
+    addresses = set(addresses)
+    normalized_addresses = {address: normalize_address(address) for address in addresses}
+    coordinates_by_normalized_address = dict(
+        GeocodedAddress.objects
+        .filter(get_cache_filter(), address__in=set(normalized_addresses.values()))
+        .values_list('address', 'coordinates')
+    )
+    uncached_addresses = {}
+    for address, normalized_address in normalized_addresses.items():
+        is_cached = normalized_address in coordinates_by_normalized_address
+        count_cache_lookup('geocoding', hit=is_cached)
+        if not is_cached:
+            uncached_addresses.setdefault(normalized_address, address)
+
+    if uncached_addresses:
+        provider = get_provider()
+        rate_limiter = RateLimiter(rate_limit or settings.GEOCODING_RATE_LIMIT)
+
+        def geocode(address):
+            rate_limiter.wait()
+            return provider.geocode(address)
+
+        with ThreadPoolExecutor(max_workers=max_workers or settings.GEOCODING_WORKERS) as executor:
+            futures = {
+                normalized_address: executor.submit(geocode, address)
+                for normalized_address, address in uncached_addresses.items()
+            }
+        for normalized_address, future in futures.items():
+            try:
+                coordinates = future.result()
+            except GeocodingError:
+                # not cached, the lookup is retried on the next run
+                continue
+            store_geocoding_result(normalized_address, coordinates)
+            coordinates_by_normalized_address[normalized_address] = coordinates
+
+    return {
+        address: coordinates_by_normalized_address[normalized_address]
+        for address, normalized_address in normalized_addresses.items()
+        if normalized_address in coordinates_by_normalized_address
+    }
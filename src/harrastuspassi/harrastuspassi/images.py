@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import logging
+import os
+import posixpath
+import re
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from io import BytesIO
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional
+from urllib.parse import urlparse
+
+import requests
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image, ImageOps, features
+from requests.adapters import HTTPAdapter
+
+from harrastuspassi import settings
+from harrastuspassi.metrics import count_cache_lookup
+from harrastuspassi.models import ImageDerivativeJob, RemoteImage
+
+LOG = logging.getLogger(__name__)
+
+CONTENT_ADDRESSED_NAME = re.compile(r'(^|/)[0-9a-f]{64}(_\d+w)?\.\w+$')
+# Cache lifetime in seconds of content-addressed files
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+class FetchedImage(NamedTuple):
+    url: str
+    name: str
+    etag: str
+    last_modified: str
+    has_derivatives: bool = False
+
+
+def get_content_addressed_name(directory: str, content: bytes, original_name: str) -> str:
+    """ Name a file by the SHA-256 digest of its content, keeping the original extension """
+    digest = hashlib.sha256(content).hexdigest()
+    _, extension = os.path.splitext(original_name)
+    return f'{directory}/{digest}{extension.lower()}'
+
+
+# Formats accepted by the cover image uploads and their extensions
+UPLOAD_EXTENSIONS = {
+    'JPEG': '.jpg',
+    'PNG': '.png',
+    'GIF': '.gif',
+    'WEBP': '.webp',
+}
+
+
+def store_uploaded_image(directory: str, uploaded_file, image_format: str, storage=None) -> str:
+    """ Store an uploaded image content-addressed, unless an identical image has already been stored.
+        The file is read in chunks, so large uploads spooled to disk are never held in memory.
+    """
+    storage = storage or default_storage
+    digest = hashlib.sha256()
+    for chunk in uploaded_file.chunks():
+        digest.update(chunk)
+    name = f'{directory}/{digest.hexdigest()}{UPLOAD_EXTENSIONS[image_format]}'
+    if not storage.exists(name):
+        uploaded_file.seek(0)
+        name = storage.save(name, uploaded_file)
+    return name
+
+
+def is_content_addressed(name: str) -> bool:
+    """ True for files named by get_content_addressed_name and their derivatives, which never change """
+    return bool(CONTENT_ADDRESSED_NAME.search(name))
+
+
+class ImageFetcher:
+    """ Downloads images concurrently using a pooled session and stores them content-addressed.
+        Conditional requests are made with the ETag and Last-Modified headers recorded in
+        RemoteImage on previous runs. Worker threads only download and store files,
+        all database access happens in the calling thread.
+    """
+
+    def __init__(self, directory: str = 'hobby_images', max_workers: int = None, timeout: int = None, storage=None):
+        self.directory = directory
+        self.max_workers = max_workers or settings.IMAGE_FETCH_WORKERS
+        self.timeout = timeout or settings.IMAGE_FETCH_TIMEOUT
+        self.storage = storage or default_storage
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.max_workers, pool_maxsize=self.max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._name_locks = defaultdict(threading.Lock)
+        self._name_locks_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self) -> None:
+        self.session.close()
+
+    def fetch_many(self, urls: Iterable[str]) -> Dict[str, Optional[str]]:
+        """ Fetch images from the given urls. Returns a dict mapping each url to the
+            name of the stored image, or None if the image could not be fetched.
+        """
+        urls = set(url for url in urls if url)
+        remote_images = {remote_image.url: remote_image for remote_image in RemoteImage.objects.filter(url__in=urls)}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {url: executor.submit(self.fetch, url, remote_images.get(url)) for url in urls}
+        image_names = {}
+        generated_names = set()
+        for url, future in futures.items():
+            fetched_image = future.result()
+            if fetched_image is None:
+                image_names[url] = None
+                continue
+            if fetched_image.has_derivatives:
+                generated_names.add(fetched_image.name)
+            remote_image = remote_images.get(url) or RemoteImage(url=url)
+            is_dirty = (
+                remote_image.image.name != fetched_image.name or
+                remote_image.etag != fetched_image.etag or
+                remote_image.last_modified != fetched_image.last_modified
+            )
+            if is_dirty:
+                remote_image.image = fetched_image.name
+                remote_image.etag = fetched_image.etag
+                remote_image.last_modified = fetched_image.last_modified
+                remote_image.save()
+            image_names[url] = fetched_image.name
+        mark_derivatives_generated(generated_names)
+        return image_names
+
+    def fetch(self, url: str, remote_image: Optional[RemoteImage] = None) -> Optional[FetchedImage]:
+        """ Download a single image unless the previously stored copy is still valid """
+        headers = {}
+        if remote_image and remote_image.image and self.storage.exists(remote_image.image.name):
+            if remote_image.etag:
+                headers['If-None-Match'] = remote_image.etag
+            if remote_image.last_modified:
+                headers['If-Modified-Since'] = remote_image.last_modified
+        try:
+            response = self.session.get(url, headers=headers, timeout=self.timeout)
+            if response.status_code == 304 and headers:
+                return FetchedImage(url, remote_image.image.name, remote_image.etag, remote_image.last_modified)
+            response.raise_for_status()
+            name = self.store(response.content, url)
+            is_generated = generate_derivatives(name, self.storage)
+        except requests.exceptions.RequestException as e:
+            LOG.warning('Could not get image data', extra={'data': {'url': url, 'error': str(e)}})
+            return None
+        except IOError as e:
+            LOG.error('Could not save image file', extra={'data': {'url': url, 'error': str(e)}})
+            return None
+        return FetchedImage(
+            url, name, response.headers.get('ETag', ''), response.headers.get('Last-Modified', ''), is_generated)
+
+    def store(self, content: bytes, url: str) -> str:
+        """ Store image content unless an identical image has already been stored """
+        name = get_content_addressed_name(self.directory, content, urlparse(url).path)
+        with self._name_locks_lock:
+            name_lock = self._name_locks[name]
+        with name_lock:
+            if not self.storage.exists(name):
+                name = self.storage.save(name, ContentFile(content))
+        return name
+
+
+DERIVATIVE_EXTENSIONS = {
+    'jpeg': 'jpg',
+    'webp': 'webp',
+}
+
+
+@lru_cache()
+def get_derivative_formats() -> List[str]:
+    """ WebP support depends on the libraries Pillow has been built with """
+    return [
+        image_format for image_format in settings.IMAGE_DERIVATIVE_FORMATS
+        if image_format != 'webp' or features.check('webp')
+    ]
+
+
+def get_derivative_name(name: str, width: int, image_format: str) -> str:
+    """ hobby_images/foo.jpg -> hobby_images/derivatives/foo_300w.webp """
+    directory, filename = posixpath.split(name)
+    root, _ = posixpath.splitext(filename)
+    extension = DERIVATIVE_EXTENSIONS[image_format]
+    return posixpath.join(directory, 'derivatives', f'{root}_{width}w.{extension}')
+
+
+def get_derivative_names(name: str) -> List[str]:
+    return [
+        get_derivative_name(name, width, image_format)
+        for image_format in get_derivative_formats()
+        for width in settings.IMAGE_DERIVATIVE_WIDTHS
+    ]
+
+
+def get_derivatives_key() -> str:
+    """ Derivatives are regenerated when the configured widths or formats change """
+    key = f'{settings.IMAGE_DERIVATIVE_WIDTHS}:{get_derivative_formats()}'
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def generate_derivatives(name: str, storage=None) -> bool:
+    """ Generate the missing resized versions of an image. Images are never upscaled,
+        a derivative wider than the original is stored in the original size.
+    """
+    storage = storage or default_storage
+    missing_derivatives = [
+        (width, image_format)
+        for image_format in get_derivative_formats()
+        for width in settings.IMAGE_DERIVATIVE_WIDTHS
+        if not storage.exists(get_derivative_name(name, width, image_format))
+    ]
+    if not missing_derivatives:
+        return True
+    try:
+        with storage.open(name, 'rb') as image_file:
+            image = Image.open(image_file)
+            image.load()
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if image.mode in ('LA', 'P') else 'RGB')
+        for width, image_format in missing_derivatives:
+            derivative = image
+            if width < image.width:
+                height = max(1, round(image.height * width / image.width))
+                derivative = image.resize((width, height), Image.LANCZOS)
+            if image_format == 'jpeg' and derivative.mode != 'RGB':
+                derivative = derivative.convert('RGB')
+            buffer = BytesIO()
+            derivative.save(buffer, format=image_format.upper(), quality=settings.IMAGE_DERIVATIVE_QUALITY)
+            derivative_name = get_derivative_name(name, width, image_format)
+            if not storage.exists(derivative_name):
+                storage.save(derivative_name, ContentFile(buffer.getvalue()))
+    except (IOError, ValueError, Image.DecompressionBombError) as e:
+        LOG.error('Could not generate image derivatives', extra={'data': {'name': name, 'error': str(e)}})
+        return False
+    return True
+
+
+# Derivatives key -> (time of loading, names of the images with derivatives), shared by the threads
+_images_with_derivatives = {}
+
+
+def get_images_with_derivatives() -> FrozenSet[str]:
+    """ Names of the images whose derivatives have been generated, read from ImageDerivativeJob
+        at most every IMAGE_DERIVATIVE_INDEX_INTERVAL seconds by each process
+    """
+    key = get_derivatives_key()
+    now = time.monotonic()
+    loaded_at, names = _images_with_derivatives.get(key, (None, frozenset()))
+    if loaded_at is None or now - loaded_at >= settings.IMAGE_DERIVATIVE_INDEX_INTERVAL:
+        names = frozenset(ImageDerivativeJob.objects.filter(derivatives_key=key).values_list('image_name', flat=True))
+        _images_with_derivatives[key] = (now, names)
+    return names
+
+
+def has_derivatives(name: str) -> bool:
+    """ True if the derivatives of an image are known to exist """
+    is_generated = name in get_images_with_derivatives()
+    count_cache_lookup('image_derivatives', hit=is_generated)
+    return is_generated
+
+
+def mark_derivatives_generated(names: Iterable[str]) -> None:
+    """ Record the derivatives of the images as generated with the current widths and formats """
+    names = set(names)
+    if not names:
+        return
+    key = get_derivatives_key()
+    ImageDerivativeJob.objects.filter(image_name__in=names).update(
+        derivatives_key=key, attempts=0, next_attempt_at=None, updated_at=timezone.now())
+    ImageDerivativeJob.objects.bulk_create([
+        ImageDerivativeJob(image_name=name, derivatives_key=key, next_attempt_at=None) for name in names
+    ], ignore_conflicts=True)
+
+
+def ensure_derivatives(name: str, storage=None) -> bool:
+    """ Generate the missing derivatives of an image and record them as generated """
+    if not generate_derivatives(name, storage):
+        return False
+    mark_derivatives_generated([name])
+    return True
+
+
+def schedule_derivatives(name: str) -> None:
+    """ Generate the derivatives of a saved image after the current transaction has been committed,
+        or queue the image for the generate_image_derivatives command when IMAGE_DERIVATIVES_DEFERRED is set.
+    """
+    if settings.IMAGE_DERIVATIVES_DEFERRED:
+        # Images queued already, including the ones which have failed, are not queued again
+        ImageDerivativeJob.objects.bulk_create([ImageDerivativeJob(image_name=name)], ignore_conflicts=True)
+    else:
+        transaction.on_commit(lambda: ensure_derivatives(name))
+
+
+def queue_derivatives(names: Iterable[str]) -> int:
+    """ Queue the images which have no derivatives in the current widths and formats for the
+        generate_image_derivatives command, including the ones which have failed before.
+        Returns the number of images queued.
+    """
+    names = set(names)
+    generated_jobs = ImageDerivativeJob.objects.filter(image_name__in=names, derivatives_key=get_derivatives_key())
+    names -= set(generated_jobs.values_list('image_name', flat=True))
+    if not names:
+        return 0
+    now = timezone.now()
+    ImageDerivativeJob.objects.filter(image_name__in=names).update(attempts=0, next_attempt_at=now, updated_at=now)
+    ImageDerivativeJob.objects.bulk_create([ImageDerivativeJob(image_name=name) for name in names],
+                                           ignore_conflicts=True)
+    return len(names)
+
+
+def get_derivative_urls(image_file) -> Optional[Dict[str, Dict[str, str]]]:
+    """ Urls of the resized versions of an image, or None until they have been generated. Nothing is
+        generated or queued while serializing, see schedule_derivatives and queue_derivatives.
+        Example:
+            {'webp': {'300w': '/media/hobby_images/derivatives/foo_300w.webp', ...}, 'jpeg': {...}}
+    """
+    if not image_file or not has_derivatives(image_file.name):
+        return None
+    return {
+        image_format: {
+            f'{width}w': image_file.storage.url(get_derivative_name(image_file.name, width, image_format))
+            for width in settings.IMAGE_DERIVATIVE_WIDTHS
+        }
+        for image_format in get_derivative_formats()
+    }
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+""" Synthetic Linked Courses and Lipas payloads for benchmarking the importers.
+
+    The payloads are served from a local HTTP server, so that the importers can be run
+    unchanged against them. See the benchmark_importers management command.
+"""
+import datetime
+import json
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from typing import Dict, List, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from harrastuspassi.management.commands.import_lipas import Command as LipasCommand
+
+LINKED_COURSES_PATH = '/linkedcourses/v1/event/'
+LINKED_COURSES_PLACE_PATH = '/linkedcourses/v1/place/'
+LIPAS_PATH = '/api/sports-places/'
+
+# (path, page) -> response body
+Routes = Dict[Tuple[str, int], bytes]
+
+
+class PayloadServer(ThreadingMixIn, HTTPServer):
+    """ Serves pre-rendered JSON responses from memory. Paged resources use the page query parameter.
+        Pages past the last one are served as an empty list, which is how Lipas ends paging.
+    """
+    daemon_threads = True
+
+    def __init__(self, routes: Routes):
+        super().__init__(('127.0.0.1', 0), PayloadRequestHandler)
+        self.routes = routes
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+        self.thread.join()
+
+
+class PayloadRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        page = int(parse_qs(url.query).get('page', ['1'])[0])
+        body = self.server.routes.get((url.path, page))
+        if body is None and any(path == url.path for path, _page in self.server.routes):
+            body = b'[]'
+        if body is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def render(data) -> bytes:
+    return json.dumps(data).encode('utf-8')
+
+
+def generate_linked_courses_routes(base_url: str, event_count: int, keywords: List[Tuple[str, str]],
+                                   rng: random.Random, page_size: int = 100, sub_event_count: int = 5,
+                                   image_url: str = None) -> Tuple[Routes, int]:
+    """ Events look like the ones in tests/fixtures_linkedcourses.py. About half of the events are
+        recurring super events with sub events, the rest are self-contained events.
+        keywords is a list of (source, id) pairs mapping to existing categories.
+        Returns the routes and the number of generated events.
+    """
+    place_count = max(1, event_count // 10)
+    routes = {}
+    for place_number in range(place_count):
+        place_url = f'{base_url}{LINKED_COURSES_PLACE_PATH}bench:{place_number}/'
+        routes[(f'{LINKED_COURSES_PLACE_PATH}bench:{place_number}/', 1)] = render({
+            '@id': place_url,
+            'name': {'fi': f'Paikka {place_number}'},
+            'postal_code': f'{rng.randint(0, 99999):05d}',
+            'address_locality': {'fi': 'Helsinki'},
+            'street_address': {'fi': f'Katu {place_number}'},
+            'position': {'type': 'Point', 'coordinates': [rng.uniform(24.8, 25.2), rng.uniform(60.1, 60.3)]},
+        })
+
+    events = []
+    start_date = datetime.date.today()
+    while len(events) < event_count:
+        event_number = len(events)
+        is_recurring = rng.random() < 0.5 and event_count - len(events) > sub_event_count
+        event = generate_linked_courses_event(
+            base_url, f'bench:{event_number}', rng.choice(keywords), rng.randrange(place_count),
+            start_date + datetime.timedelta(days=rng.randint(0, 60)), image_url)
+        events.append(event)
+        if not is_recurring:
+            continue
+        event['super_event_type'] = 'recurring'
+        event['sub_events'] = []
+        for sub_event_number in range(sub_event_count):
+            sub_event = generate_linked_courses_event(
+                base_url, f'bench:{event_number}-{sub_event_number}', rng.choice(keywords),
+                rng.randrange(place_count), start_date + datetime.timedelta(weeks=sub_event_number), None)
+            sub_event['super_event'] = {'@id': event['@id']}
+            event['sub_events'].append({'@id': sub_event['@id']})
+            events.append(sub_event)
+
+    page_count = (len(events) + page_size - 1) // page_size
+    for page in range(1, page_count + 1):
+        next_url = f'{base_url}{LINKED_COURSES_PATH}?page={page + 1}' if page < page_count else None
+        routes[(LINKED_COURSES_PATH, page)] = render({
+            'meta': {'count': len(events), 'next': next_url},
+            'data': events[(page - 1) * page_size:page * page_size],
+        })
+    return routes, len(events)
+
+
+def generate_linked_courses_event(base_url: str, event_id: str, keyword: Tuple[str, str], place_number: int,
+                                  date: datetime.date, image_url: str = None) -> Dict:
+    source, origin_id = keyword
+    images = []
+    if image_url:
+        images.append({'url': image_url, 'last_modified_time': '2020-06-10T11:15:57.772182Z'})
+    return {
+        'id': event_id,
+        '@id': f'{base_url}{LINKED_COURSES_PATH}{event_id}/',
+        'location': {'@id': f'{base_url}{LINKED_COURSES_PLACE_PATH}bench:{place_number}/'},
+        'keywords': [{'@id': f'{base_url}/linkedcourses/v1/keyword/{source}:{origin_id}/'}],
+        'super_event': None,
+        'super_event_type': None,
+        'sub_events': [],
+        'external_links': [],
+        'offers': [{'is_free': False, 'price': {'fi': '25 €'}, 'description': None, 'info_url': None}],
+        'images': images,
+        'name': {'fi': f'Harrastus {event_id}'},
+        'short_description': {'fi': 'Lyhyt kuvaus harrastuksesta.'},
+        'description': {'fi': '<p>Pitkä kuvaus harrastuksesta. ' * 20 + '</p>'},
+        'audience_min_age': 13,
+        'audience_max_age': 18,
+        'start_time': f'{date.isoformat()}T17:00:00Z',
+        'end_time': f'{date.isoformat()}T18:30:00Z',
+    }
+
+
+def generate_lipas_routes(place_count: int, rng: random.Random, page_size: int = 100) -> Tuple[Routes, int]:
+    """ Sports places in the format requested by the Lipas importer """
+    type_codes = list(LipasCommand.category_mappings.keys())
+    places = [
+        {
+            'sportsPlaceId': 900000 + place_number,
+            'name': f'Liikuntapaikka {place_number}',
+            'freeUse': rng.random() < 0.5,
+            'type': {'typeCode': rng.choice(type_codes), 'name': 'Tyyppi'},
+            'location': {
+                'address': f'Katu {place_number}',
+                'postalCode': f'{rng.randint(0, 99999):05d}',
+                'postalOffice': 'Helsinki',
+                'city': {'name': 'Helsinki'},
+                'coordinates': {'wgs84': {'lon': rng.uniform(20.0, 31.0), 'lat': rng.uniform(59.8, 69.0)}},
+            },
+            'properties': {'infoFi': 'Liikuntapaikan kuvaus.'},
+        }
+        for place_number in range(place_count)
+    ]
+    routes = {
+        (LIPAS_PATH, page + 1): render(places[page * page_size:(page + 1) * page_size])
+        for page in range((place_count + page_size - 1) // page_size)
+    }
+    return routes, place_count
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+""" Maintenance of the denormalized HobbyEventListing table.
+
+    Listings are refreshed per hobby once the transaction changing the hobby or the objects
+    it is displayed with has been committed, see receivers.py. Importers save many objects
+    outside of a single transaction and use deferred_refresh() to refresh each hobby once.
+"""
+import datetime
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Iterable, List, Optional
+
+from django.db import connection, transaction
+from django.db.models import Prefetch, Q
+
+from harrastuspassi import settings
+from harrastuspassi.models import Hobby, HobbyCategory, HobbyEvent, HobbyEventListing
+
+BATCH_SIZE = 1000
+# First key of the advisory locks taken on hobby ids during refreshes
+ADVISORY_LOCK_NAMESPACE = 1138
+
+_state = threading.local()
+
+
+class CategoryCoverImages:
+    """ Cover image fallback for hobbies without a cover image of their own: the image of the
+        closest category or category ancestor which has one. The categories with images are
+        loaded once, so that hobbies can be handled without further queries.
+    """
+
+    def __init__(self):
+        self.categories_by_tree = defaultdict(list)
+        categories_with_image = (
+            HobbyCategory.objects.exclude(cover_image='').filter(cover_image__isnull=False)
+            .only('id', 'tree_id', 'lft', 'rght', 'cover_image')
+        )
+        for category in categories_with_image:
+            self.categories_by_tree[category.tree_id].append(category)
+
+    def get_cover_image(self, categories: Iterable[HobbyCategory]):
+        candidates = [
+            category_with_image
+            for category in categories
+            for category_with_image in self.categories_by_tree.get(category.tree_id, [])
+            if category_with_image.lft <= category.lft and category_with_image.rght >= category.rght
+        ]
+        if not candidates:
+            return None
+        # get_ancestors() orders by tree and left value and the last one is used
+        return max(candidates, key=lambda category: (category.tree_id, category.lft)).cover_image
+
+
+def build_listings(hobby_ids: List[int], cover_images: CategoryCoverImages) -> List[HobbyEventListing]:
+    hobbies = (
+        Hobby.objects.filter(id__in=hobby_ids)
+        .select_related('location', 'organizer', 'municipality')
+        .prefetch_related(Prefetch('categories', queryset=HobbyCategory.objects.only('id', 'tree_id', 'lft', 'rght')))
+    )
+    hobbies_by_id = {hobby.pk: hobby for hobby in hobbies}
+    next_event_ids = [hobby.next_event_id for hobby in hobbies_by_id.values() if hobby.next_event_id]
+    # The next event of a hobby may be ongoing, or even past until update_hobby_next_event is run
+    events = HobbyEvent.objects.filter(
+        Q(end_date__gte=datetime.date.today()) | Q(id__in=next_event_ids), hobby_id__in=list(hobbies_by_id),
+    ).order_by()
+
+    listings = []
+    for event in events:
+        hobby = hobbies_by_id[event.hobby_id]
+        categories = list(hobby.categories.all())
+        cover_image = hobby.cover_image or cover_images.get_cover_image(categories)
+        location = hobby.location
+        listings.append(HobbyEventListing(
+            event=event,
+            hobby=hobby,
+            is_next_event=event.pk == hobby.next_event_id,
+            start_date=event.start_date,
+            start_time=event.start_time,
+            start_weekday=event.start_weekday,
+            end_date=event.end_date,
+            end_time=event.end_time,
+            data_source=event.data_source,
+            hobby_name=hobby.name,
+            hobby_description=hobby.description,
+            price_type=hobby.price_type,
+            price_amount=hobby.price_amount,
+            cover_image=cover_image.name if cover_image else '',
+            category_ids=[category.pk for category in categories],
+            location=location,
+            location_name=location.name if location else '',
+            location_address=location.address if location else '',
+            location_zip_code=location.zip_code if location else '',
+            location_city=location.city if location else '',
+            location_geocoding_status=location.geocoding_status if location else '',
+            coordinates=location.coordinates if location else None,
+            organizer=hobby.organizer,
+            organizer_name=hobby.organizer.name if hobby.organizer else '',
+            municipality=hobby.municipality,
+            municipality_name=hobby.municipality.name if hobby.municipality else '',
+        ))
+    return listings
+
+
+def refresh_listings_of(hobby_ids: List[int], cover_images: CategoryCoverImages) -> int:
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            # Concurrent refreshes of a hobby would otherwise both insert its listings
+            cursor.execute('SELECT pg_advisory_xact_lock(%s, hobby_id) FROM unnest(%s) AS hobby_id',
+                           [ADVISORY_LOCK_NAMESPACE, hobby_ids])
+        HobbyEventListing.objects.filter(hobby_id__in=hobby_ids).delete()
+        listings = build_listings(hobby_ids, cover_images)
+        return len(HobbyEventListing.objects.bulk_create(listings, batch_size=BATCH_SIZE))
+
+
+def refresh_hobby_event_listings(hobby_ids: Optional[Iterable[int]] = None) -> int:
+    """ Rebuild the listings of the given hobbies, or of all hobbies. Listings of past events are
+        removed. Hobbies are refreshed in batches, each in its own transaction.
+        Returns the number of listings created.
+    """
+    if hobby_ids is None:
+        hobby_ids = Hobby.objects.values_list('id', flat=True)
+    # Sorted so that concurrent refreshes take the locks in the same order
+    hobby_ids = sorted(set(hobby_ids))
+    cover_images = CategoryCoverImages()
+    created_count = 0
+    for start in range(0, len(hobby_ids), BATCH_SIZE):
+        created_count += refresh_listings_of(hobby_ids[start:start + BATCH_SIZE], cover_images)
+    return created_count
+
+
+def get_pending_hobby_ids() -> set:
+    if not hasattr(_state, 'hobby_ids'):
+        _state.hobby_ids = set()
+        _state.deferred = 0
+    return _state.hobby_ids
+
+
+def refresh_pending() -> None:
+    hobby_ids = get_pending_hobby_ids()
+    if hobby_ids:
+        _state.hobby_ids = set()
+        refresh_hobby_event_listings(hobby_ids)
+
+
+def schedule_refresh(hobby_ids: Iterable[int]) -> None:
+    """ Refresh the listings of the hobbies after the current transaction has been committed.
+        The listings are refreshed once however many times a hobby is scheduled.
+        hobby_ids may be a queryset, it is only evaluated when the listings are enabled.
+    """
+    if not settings.HOBBY_EVENT_LISTING_ENABLED:
+        return
+    get_pending_hobby_ids().update(hobby_ids)
+    if not _state.deferred:
+        # Later callbacks find nothing left to refresh. Hobbies scheduled in a transaction
+        # which was rolled back are refreshed with the next ones, which is harmless.
+        transaction.on_commit(refresh_pending)
+
+
+@contextmanager
+def deferred_refresh():
+    """ Refresh the scheduled listings only when leaving the block """
+    get_pending_hobby_ids()
+    _state.deferred += 1
+    try:
+        yield
+    finally:
+        _state.deferred -= 1
+        if not _state.deferred:
+            transaction.on_commit(refresh_pending)
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+import random
+import tempfile
+import time
+import tracemalloc
+from io import BytesIO, StringIO
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import override_settings
+from PIL import Image
+
+from harrastuspassi.importer_benchmark import (
+    LINKED_COURSES_PATH,
+    LIPAS_PATH,
+    PayloadServer,
+    generate_linked_courses_routes,
+    generate_lipas_routes,
+)
+from harrastuspassi.models import Hobby, HobbyCategory, HobbyEvent
+
+IMAGE_PATH = '/images/cover.jpg'
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = ('Measure the throughput of the importers with synthetic data served from a local HTTP server.'
+            ' Nothing is saved, all changes are rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--importer', action='store', dest='importer', default='all',
+                            choices=['all', 'linkedcourses', 'lipas'], help='Importer to benchmark')
+        parser.add_argument('--events', action='store', dest='events', type=int, default=1000,
+                            help='Number of events or sports places to import')
+        parser.add_argument('--seed', action='store', dest='seed', type=int, default=0,
+                            help='Seed for generating the data')
+        parser.add_argument('--images', action='store_true', dest='images', default=False,
+                            help='Give Linked Courses events a cover image, stored in a temporary directory')
+        parser.add_argument('--no-memory', action='store_false', dest='trace_memory', default=True,
+                            help='Do not trace memory allocations, which slows the import down')
+
+    def handle(self, *args, **options):
+        if options['importer'] in ('all', 'linkedcourses'):
+            self.benchmark(self.run_linkedcourses, 'import_linkedcourses', options)
+        if options['importer'] in ('all', 'lipas'):
+            self.benchmark(self.run_lipas, 'import_lipas', options)
+
+    def benchmark(self, run_importer, name, options):
+        rng = random.Random(options['seed'])
+        with transaction.atomic():
+            query_counter = QueryCounter()
+            hobby_count = Hobby.objects.count()
+            hobby_event_count = HobbyEvent.objects.count()
+            if options['trace_memory']:
+                tracemalloc.start()
+            try:
+                with connection.execute_wrapper(query_counter):
+                    event_count, elapsed = run_importer(rng, options)
+                peak_memory = tracemalloc.get_traced_memory()[1] if options['trace_memory'] else None
+            finally:
+                if options['trace_memory']:
+                    tracemalloc.stop()
+            created_hobbies = Hobby.objects.count() - hobby_count
+            created_hobby_events = HobbyEvent.objects.count() - hobby_event_count
+            transaction.set_rollback(True)
+
+        self.stdout.write(f'{name}: {event_count} events in {round(elapsed, 2)} seconds')
+        self.stdout.write(f'  {round(event_count / elapsed, 1)} events/s')
+        self.stdout.write(f'  {query_counter.count} queries, {round(query_counter.count / event_count, 1)} per event')
+        if peak_memory is not None:
+            self.stdout.write(f'  peak memory {round(peak_memory / 1024 / 1024, 1)} MiB')
+        self.stdout.write(f'  created {created_hobbies} hobbies and {created_hobby_events} hobby events')
+
+    def get_keywords(self):
+        """ Keywords of the categories the events map to, benchmark categories are created if there are none """
+        keywords = list(
+            HobbyCategory.objects.exclude(data_source='').exclude(origin_id='').values_list('data_source', 'origin_id')
+        )
+        if not keywords:
+            for number in range(50):
+                category = HobbyCategory.objects.create(
+                    name=f'Benchmark category {number}', data_source='yso', origin_id=f'pbenchmark{number}')
+                keywords.append((category.data_source, category.origin_id))
+        return keywords
+
+    def run_linkedcourses(self, rng, options):
+        with PayloadServer({}) as server:
+            image_url = None
+            if options['images']:
+                image_buffer = BytesIO()
+                Image.new('RGB', (1200, 800)).save(image_buffer, format='JPEG')
+                server.routes[(IMAGE_PATH, 1)] = image_buffer.getvalue()
+                image_url = server.base_url + IMAGE_PATH
+            routes, event_count = generate_linked_courses_routes(
+                server.base_url, options['events'], self.get_keywords(), rng, image_url=image_url)
+            server.routes.update(routes)
+            with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+                start_time = time.perf_counter()
+                call_command('import_linkedcourses', url=server.base_url + LINKED_COURSES_PATH,
+                             stdout=StringIO(), stderr=StringIO())
+                elapsed = time.perf_counter() - start_time
+        return event_count, elapsed
+
+    def run_lipas(self, rng, options):
+        routes, event_count = generate_lipas_routes(options['events'], rng)
+        with PayloadServer(routes) as server:
+            start_time = time.perf_counter()
+            call_command('import_lipas', url=server.base_url + LIPAS_PATH, stdout=StringIO(), stderr=StringIO())
+            elapsed = time.perf_counter() - start_time
+        return event_count, elapsed
@@ -1,77 +1,110 @@
-import os
+import posixpath
+import time
+from datetime import timedelta
 
 from django.apps import apps
-from django.conf import settings
+from django.core.files.storage import default_storage
 from django.core.management.base import BaseCommand
+from django.utils import timezone
 from django.db import models
 
+from harrastuspassi.images import get_derivative_names
+
 
 class Command(BaseCommand):
-    help = 'Clean media by deleting those files which are no more referenced by any FileField'
+    help = ('Clean media by deleting those files which are no more referenced by any FileField.'
+            ' Works with any storage backend, for example the file system or S3.')
+
+    # Exclude cache folder by default since generally it's used by third-party apps
+    exclude_paths = ('cache', )
 
     def add_arguments(self, parser):
         parser.add_argument(
             '--noinput',
-            action = 'store_true',
-            default = False,
-            help = 'Clean media by deleting those files which are no more referenced by any FileField without asking for confirmation'
+            action='store_true',
+            default=False,
+            help='Clean media by deleting those files which are no more referenced by any FileField without asking for confirmation'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            dest='dry_run',
+            default=False,
+            help='Only list the unreferenced files, do not delete anything'
+        )
+        parser.add_argument(
+            '--older-than',
+            action='store',
+            dest='older_than',
+            type=int,
+            default=0,
+            help='Only handle files which have not been modified in the given number of days'
         )
 
     def handle(self, *args, **options):
-        exclude_paths = ('cache', )  # Exclude cache folder by default since generally it's used by third-party apps
-        exclude_roots = [ os.path.normpath(settings.MEDIA_ROOT + '/' + path) for path in exclude_paths ]
-
-        # Build a list of all media files used by our models
-        models_files = []
-
-        for model in apps.get_models():
-
-            model_objects = list(model.objects.all())
-            model_file_fields = []
-
-            for field_name in [f.name for f in model._meta.get_fields()]:
-                field = model._meta.get_field(field_name)
-
-                if isinstance(field, models.FileField):
-                    model_file_fields.append(str(field_name))
-
-            if not len(model_file_fields):
-                continue
-
-            for obj in model_objects:
-                for field in model_file_fields:
-                    file = getattr(obj, field, '')
-                    if file:
-                        models_files.append(file.path)
+        start_time = time.time()
+        referenced_names = self.get_referenced_names()
+        self.stdout.write(
+            f'Found {len(referenced_names)} referenced files in {round(time.time() - start_time, 2)} seconds'
+        )
 
+        start_time = time.time()
+        modified_before = timezone.now() - timedelta(days=options['older_than'])
         unref_files = []
-
-        for root, dirs, files in os.walk(settings.MEDIA_ROOT):
-            exclude_root = False
-            for excluded_root in exclude_roots:
-                if root.find(excluded_root) == 0:
-                    exclude_root = True
-                    break
-
-            if exclude_root:
+        for name in self.iter_media_files():
+            if name in referenced_names:
                 continue
-
-            for file in files:
-                file_path = os.path.join(root, file)
-                if not file_path in models_files:
-                    unref_files.append(file_path)
-
-        for file in unref_files:
-            print('found unreferenced file: %s' % (file ))
+            if options['older_than'] and default_storage.get_modified_time(name) >= modified_before:
+                continue
+            self.stdout.write(f'found unreferenced file: {name}')
+            unref_files.append(name)
         num_unref_files = len(unref_files)
-        print('found %s unreferenced file%s' % (num_unref_files, 's' if num_unref_files else '', ))
-        if num_unref_files:
-            remove_unref_files = True if options['noinput'] else (input('remove all unreferenced files? (y/N) ').lower().find('y') == 0)
-            if remove_unref_files:
-                for file in unref_files:
-                    try:
-                        os.remove(file)
-                        print('removed unreferenced file: %s' % (file ))
-                    except:
-                        continue
-        return
+        self.stdout.write(
+            f'found {num_unref_files} unreferenced file{"s" if num_unref_files != 1 else ""}'
+            f' in {round(time.time() - start_time, 2)} seconds'
+        )
+        if not num_unref_files or options['dry_run']:
+            return
+
+        remove_unref_files = options['noinput'] or input('remove all unreferenced files? (y/N) ').lower().find('y') == 0
+        if not remove_unref_files:
+            return
+        start_time = time.time()
+        for name in unref_files:
+            try:
+                default_storage.delete(name)
+                self.stdout.write(f'removed unreferenced file: {name}')
+            except Exception as e:
+                self.stderr.write(f'could not remove {name}: {str(e)}')
+        self.stdout.write(f'removed files in {round(time.time() - start_time, 2)} seconds')
+
+    def get_referenced_names(self):
+        """ Names of all files referenced by FileFields, including the resized versions of images.
+            Only the file columns are read from the database, one row at a time.
+        """
+        referenced_names = set()
+        for model in apps.get_models():
+            if model._meta.proxy:
+                continue
+            file_fields = [field for field in model._meta.concrete_fields if isinstance(field, models.FileField)]
+            for field in file_fields:
+                names = model._default_manager.exclude(**{field.name: ''}).exclude(**{f'{field.name}__isnull': True})
+                for name in names.values_list(field.name, flat=True).iterator():
+                    referenced_names.add(name)
+                    if isinstance(field, models.ImageField):
+                        referenced_names.update(get_derivative_names(name))
+        return referenced_names
+
+    def iter_media_files(self, directory=''):
+        """ Yield the storage name of each file in the media storage """
+        try:
+            directories, files = default_storage.listdir(directory)
+        except FileNotFoundError:
+            return
+        for file in files:
+            yield posixpath.join(directory, file)
+        for subdirectory in directories:
+            path = posixpath.join(directory, subdirectory)
+            # excluded directories are not listed at all
+            if path not in self.exclude_paths:
+                yield from self.iter_media_files(path)
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+import gzip
+import json
+import statistics
+import time
+from io import BytesIO
+from urllib.parse import urlparse
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from django.urls import Resolver404, resolve
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from harrastuspassi.parsers import MessagePackParser
+from harrastuspassi.renderers import FastJSONRenderer, MessagePackRenderer
+
+# (name, renderer) pairs, each response is serialized for the accepted renderer
+RENDERERS = [
+    ('json', JSONRenderer()),
+    ('fastjson', FastJSONRenderer()),
+    ('msgpack', MessagePackRenderer()),
+]
+
+
+class Command(BaseCommand):
+    help = ('Compare the size and rendering time of an API response in the supported formats,'
+            ' using the data in the database')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', action='store', dest='path',
+                            default='/api/v1/hobbyevents/?include=hobby_detail&page_size=500',
+                            help='API path with query parameters')
+        parser.add_argument('--rounds', action='store', dest='rounds', type=int, default=10,
+                            help='Timed renders per format')
+
+    def handle(self, *args, **options):
+        try:
+            match = resolve(urlparse(options['path']).path)
+        except Resolver404:
+            raise CommandError(f'No view for {options["path"]}')
+        self.stdout.write(f'{options["path"]}')
+        self.stdout.write(f'{"format":<10}{"bytes":>12}{"gzip bytes":>12}{"render ms":>12}{"parse ms":>12}')
+        for name, renderer in RENDERERS:
+            request = APIRequestFactory().get(options['path'], HTTP_ACCEPT=renderer.media_type)
+            # Image urls are built with the host of the request
+            with override_settings(ALLOWED_HOSTS=['testserver']):
+                response = match.func(request, *match.args, **match.kwargs)
+            if response.status_code != 200:
+                raise CommandError(f'{options["path"]} responded with {response.status_code}')
+            body = renderer.render(response.data, renderer.media_type, {})
+            render_durations = []
+            parse_durations = []
+            for _ in range(options['rounds']):
+                start = time.perf_counter()
+                renderer.render(response.data, renderer.media_type, {})
+                render_durations.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                self.parse(name, body)
+                parse_durations.append(time.perf_counter() - start)
+            self.stdout.write(
+                f'{name:<10}{len(body):>12}{len(gzip.compress(body)):>12}'
+                f'{statistics.median(render_durations) * 1000:>12.1f}{statistics.median(parse_durations) * 1000:>12.1f}'
+            )
+
+    def parse(self, name, body):
+        """ Parse like a client would, JSON with the standard library """
+        if name == 'msgpack':
+            return MessagePackParser().parse(BytesIO(body))
+        return json.loads(body)
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand
+
+from harrastuspassi.partitioning import ensure_benefit_partitions
+
+
+class Command(BaseCommand):
+    help = 'Create the monthly Benefit table partitions for the coming months'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--months-ahead',
+            action='store',
+            dest='months_ahead',
+            type=int,
+            default=3,
+            help='Number of months after the current one to create partitions for'
+        )
+
+    def handle(self, *args, **options):
+        created_partitions = ensure_benefit_partitions(months_ahead=options['months_ahead'])
+        for partition_name in created_partitions:
+            self.stdout.write(f'Created partition {partition_name}')
+        self.stdout.write(f'Created {len(created_partitions)} partitions')
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from harrastuspassi import tasks
+
+
+class Command(BaseCommand):
+    help = ('Generate the resized versions of queued images. Images are queued when they are saved'
+            ' if HARRASTUSPASSI_IMAGE_DERIVATIVES_DEFERRED is set, and with --queue-missing.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--queue-missing',
+            action='store_true',
+            default=False,
+            help='First queue the cover images without resized versions, like the ones saved earlier'
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            default=False,
+            help='Keep running and poll for queued images'
+        )
+        parser.add_argument(
+            '--interval',
+            action='store',
+            dest='interval',
+            type=int,
+            default=10,
+            help='Seconds to wait between polls when running with --loop'
+        )
+        parser.add_argument(
+            '--limit',
+            action='store',
+            dest='limit',
+            type=int,
+            default=20,
+            help='Maximum number of images to handle at a time'
+        )
+
+    def handle(self, *args, **options):
+        if options['queue_missing']:
+            queued_count = tasks.queue_missing_image_derivatives()
+            self.stdout.write(f'Queued {queued_count} images')
+        while True:
+            handled_count = tasks.generate_pending_image_derivatives(limit=options['limit'])
+            if handled_count:
+                self.stdout.write(f'Generated resized versions of {handled_count} images')
+            if not options['loop']:
+                break
+            # Return the connection to the pool between polls and get a working one after database restarts
+            close_old_connections()
+            # A full batch means there may be more images waiting
+            if handled_count < options['limit']:
+                time.sleep(options['interval'])
@@ -1,29 +1,58 @@
 # -*- coding: utf-8 -*-
+import time
+
 from django.contrib.gis.geos import Point
 from django.core.management.base import BaseCommand
 from django.db import models
-from rest_framework.exceptions import APIException
 
-from harrastuspassi.geocoding import get_coordinates_from_address
+from harrastuspassi.geocoding import format_address, geocode_addresses
 from harrastuspassi.models import Location
 
 
 class Command(BaseCommand):
     help = 'Geocode location objects with (0, 0) or Null coordinates'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            action='store',
+            dest='workers',
+            type=int,
+            default=None,
+            help='Number of concurrent geocoding requests'
+        )
+        parser.add_argument(
+            '--rate-limit',
+            action='store',
+            dest='rate_limit',
+            type=float,
+            default=None,
+            help='Maximum number of geocoding requests per second'
+        )
+
     def handle(self, *args, **options):
         faulty_coordinates = models.Q(coordinates=Point(0, 0)) | models.Q(coordinates__isnull=True)
         # We implicitly exclude faulty locations that are imported, because those should not be edited in our database
-        locations_with_faulty_coordinates = Location.objects.filter(faulty_coordinates).filter(data_source='')
+        locations_with_faulty_coordinates = list(Location.objects.filter(faulty_coordinates).filter(data_source=''))
+        self.stdout.write(
+            f'Found {len(locations_with_faulty_coordinates)} locations with faulty or null coordinates.'
+        )
+
+        start_time = time.time()
+        formatted_addresses = {
+            location.pk: format_address(location.address, location.zip_code, location.city)
+            for location in locations_with_faulty_coordinates
+        }
+        coordinates_by_address = geocode_addresses(
+            formatted_addresses.values(), max_workers=options['workers'], rate_limit=options['rate_limit'])
         self.stdout.write(
-            f'Found {locations_with_faulty_coordinates.count()} locations with faulty or null coordinates.'
+            f'Geocoded {len(coordinates_by_address)} addresses in {round(time.time() - start_time, 2)} seconds'
         )
 
         for location in locations_with_faulty_coordinates:
-            formatted_address = f'{location.address},+{location.zip_code}+{location.city}'
-            self.stdout.write(f'Getting coordinates for address {repr(formatted_address)}')
-            try:
-                location.coordinates = get_coordinates_from_address(formatted_address)
-                location.save()
-            except APIException:
+            coordinates = coordinates_by_address.get(formatted_addresses[location.pk])
+            if coordinates is None:
                 self.stdout.write(f'Could not get coordinates for {repr(location)}')
+                continue
+            location.coordinates = coordinates
+            location.save()
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from harrastuspassi import tasks
+
+
+class Command(BaseCommand):
+    help = 'Geocode locations which have been created without coordinates'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            default=False,
+            help='Keep running and poll for pending locations'
+        )
+        parser.add_argument(
+            '--interval',
+            action='store',
+            dest='interval',
+            type=int,
+            default=30,
+            help='Seconds to wait between polls when running with --loop'
+        )
+        parser.add_argument(
+            '--limit',
+            action='store',
+            dest='limit',
+            type=int,
+            default=100,
+            help='Maximum number of locations to geocode at a time'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            handled_count = tasks.geocode_pending_locations(limit=options['limit'])
+            if handled_count:
+                self.stdout.write(f'Geocoded {handled_count} pending locations')
+            if not options['loop']:
+                break
+            # Return the connection to the pool between polls and get a working one after database restarts
+            close_old_connections()
+            # A full batch means there may be more locations waiting
+            if handled_count < options['limit']:
+                time.sleep(options['interval'])
@@ -14,23 +14,22 @@ import iso8601
 import json
 import logging
 import operator
-import os
 import pytz
 import re
 import requests
 from bs4 import BeautifulSoup
 from decimal import Decimal
 from collections import namedtuple
-from django.core.files import File
 from functools import lru_cache, reduce
 from django.contrib.gis.geos import Point
 from django.core.management.base import BaseCommand
 from django.db import transaction
 from django.db.models import Q
-from tempfile import NamedTemporaryFile
-from typing import Dict, Iterator, List, Optional, Set, Tuple, Union
-from urllib.parse import urlparse
+from typing import Dict, Iterator, List, Optional, Set, Union
 from harrastuspassi import settings
+from harrastuspassi.images import ImageFetcher
+from harrastuspassi.listings import deferred_refresh, schedule_refresh
+from harrastuspassi.metrics import count_importer_row
 from harrastuspassi.models import (Hobby,
                                    HobbyAudience,
                                    HobbyCategory,
@@ -52,6 +51,9 @@ EXCLUDE_AUDIENCE_NAMES = ['Lapsiperheet', 'Vauvaperheet']
 # We are interested mainly in YSO ontology.
 # Keyword source is the name of the ontology and id is the identifier in that ontology.
 Keyword = namedtuple('Keyword', ['source', 'id'])
+# Cover images are fetched after the import transaction, so only the image url is
+# recorded for each Hobby during the import.
+PendingImage = namedtuple('PendingImage', ['hobby_id', 'url', 'modified_at'])
 SourceUrls = {'linked_courses': settings.LINKED_COURSES_URL,
               'helmet': settings.HELMET_URL,
               'lippupiste': settings.LIPPUPISTE_URL,
@@ -70,6 +72,12 @@ class Command(BaseCommand):
         self.INCLUDE_AUDIENCE = self.populate_keyword_set(INCLUDE_AUDIENCE_NAMES, 'Include Audience')
         self.EXCLUDE_AUDIENCE = self.populate_keyword_set(EXCLUDE_AUDIENCE_NAMES, 'Exclude Audience')
         self.LOCAL_TZ = pytz.timezone(settings.TIME_ZONE)
+        self.pending_images = []
+
+    def execute(self, *args, **options):
+        # Refresh the listings of each imported hobby once, not after every saved object
+        with deferred_refresh():
+            return super().execute(*args, **options)
 
     def populate_keyword_set(self, keyword_names: List, keyword_type: str, parent: str = '') -> Set[Keyword]:
         """Stores ids for the audience keywords in order to save on DB queries."""
@@ -101,7 +109,10 @@ class Command(BaseCommand):
             self.session = session
             for page in self.get_event_pages(options['url']):
                 for event in page:
-                    objects = self.handle_event(event)
+                    with count_importer_row('linkedcourses') as row:
+                        objects = self.handle_event(event)
+                        if not objects:
+                            row.skip()
                     for obj in objects:
                         if isinstance(obj, HobbyEvent) and not hasattr(obj, 'hobby'):
                             # we might have created HobbyEvents which could not determine
@@ -111,6 +122,7 @@ class Command(BaseCommand):
                             found_hobby_origin_ids.append(obj.origin_id)
                         elif isinstance(obj, HobbyEvent):
                             found_hobbyevent_origin_ids.append(obj.origin_id)
+        self.handle_pending_images()
         # try to find hobbies for orphaned events now that we have processed all pages
         self.handle_orphaned_hobby_events(orphaned_hobby_events)
         self.handle_deletions(found_hobby_origin_ids, found_hobbyevent_origin_ids)
@@ -203,12 +215,33 @@ class Command(BaseCommand):
         should_fetch_new_image = is_event_image_modified or not hobby.cover_image
         if not should_fetch_new_image:
             return
-        image_file, image_name = self.fetch_image(event)
-        if not image_file:
+        image_url = event['images'][0]['url']
+        if not image_url:
+            return
+        self.pending_images.append(PendingImage(hobby.pk, image_url, event_image_modified_at))
+
+    def handle_pending_images(self) -> None:
+        """ Download the cover images recorded during the import concurrently.
+            Identical images are stored only once, so many hobbies may share one file.
+        """
+        if not self.pending_images:
             return
-        hobby.cover_image.save(f'hobby_{hobby.pk}_{image_name}', image_file)
-        hobby.cover_image_modified_at = event_image_modified_at
-        hobby.save()
+        self.stdout.write(f'Fetching {len(self.pending_images)} cover images\n')
+        with ImageFetcher() as image_fetcher:
+            image_names = image_fetcher.fetch_many(pending_image.url for pending_image in self.pending_images)
+        updated_hobby_ids = []
+        for pending_image in self.pending_images:
+            image_name = image_names.get(pending_image.url)
+            if not image_name:
+                self.stderr.write(f'Could not get cover image {pending_image.url} for Hobby {pending_image.hobby_id}\n')
+                continue
+            # update() skips the cover image cleanup signals, superseded files are removed by clean_mediaroot
+            Hobby.objects.filter(pk=pending_image.hobby_id).update(
+                cover_image=image_name, cover_image_modified_at=pending_image.modified_at)
+            updated_hobby_ids.append(pending_image.hobby_id)
+        # update() sends no signals either, the listings show the cover image
+        schedule_refresh(updated_hobby_ids)
+        self.pending_images = []
 
     def handle_hobby_event(self, event: Dict) -> Optional[HobbyEvent]:
         """ Handle an event, creating or updating existing HobbyEvent """
@@ -418,35 +451,6 @@ class Command(BaseCommand):
             self.stderr.write(f'Could not parse location data: {str(e)}\n')
             return None
 
-    def fetch_image(self, event: Dict) -> Tuple[Optional[File], Optional[str]]:
-        """ Get a File instance with a downloaded image file.
-            Returns the first image in the event if it's accessible.
-        """
-        temp_file = NamedTemporaryFile(delete=True)
-        if len(event['images']) == 0:
-            return (None, None)
-        image_url = event['images'][0]['url']
-        image_name = self.parse_image_name(event['images'][0]['url'])
-        if not image_url or not image_name:
-            return (None, None)
-        try:
-            response = self.session.get(image_url, timeout=REQUESTS_TIMEOUT)
-            response.raise_for_status()
-            temp_file.write(response.content)
-            temp_file.flush()
-            return (File(temp_file), image_name)
-        except requests.exceptions.RequestException as e:
-            self.stderr.write(f'Could not get image data: {str(e)}\n')
-            return (None, None)
-        except IOError as e:
-            self.stderr.write(f'Could not save image file: {str(e)}\n')
-            return (None, None)
-
-    def parse_image_name(self, url: str) -> Optional[str]:
-        """ Get filename from image url """
-        parsed = urlparse(url)
-        return os.path.basename(parsed.path)
-
     def get_description(self, event: Dict) -> str:  # TODO: language support
         description = self.possible_dict_to_str(event.get('short_description'), '').strip(' ')
         description = re.sub(r'\s+', ' ', description)
@@ -7,6 +7,8 @@ from django.contrib.gis.geos import Point
 from django.core.management.base import BaseCommand
 from django.db import transaction
 from harrastuspassi import settings
+from harrastuspassi.listings import deferred_refresh
+from harrastuspassi.metrics import count_importer_row
 from harrastuspassi.models import Hobby, HobbyCategory, HobbyEvent, Location
 
 LOG = logging.getLogger(__name__)
@@ -145,6 +147,11 @@ class Command(BaseCommand):
         1540: 'Luistelu',
     }
 
+    def execute(self, *args, **options):
+        # Refresh the listings of each imported hobby once, not after every saved object
+        with deferred_refresh():
+            return super().execute(*args, **options)
+
     def add_arguments(self, parser):
 
         parser.add_argument('--url', action='store', dest='url', default=settings.LIPAS_URL,
@@ -195,76 +202,79 @@ class Command(BaseCommand):
                 response.raise_for_status()
                 response_json = response.json()
                 for sports_place in response_json:
-                    cleaned_postal_code = sports_place['location'].get('postalCode', '').strip()
-                    zip_code_is_valid = len(cleaned_postal_code) == 5
-                    is_free = 'freeUse' in sports_place and sports_place['freeUse']
+                    with count_importer_row('lipas') as row:
+                        cleaned_postal_code = sports_place['location'].get('postalCode', '').strip()
+                        zip_code_is_valid = len(cleaned_postal_code) == 5
+                        is_free = 'freeUse' in sports_place and sports_place['freeUse']
 
-                    if not 'coordinates' in sports_place['location']:
-                        continue
-                    name = sports_place.get('name')
-                    type_code = sports_place['type'].get('typeCode')
+                        if not 'coordinates' in sports_place['location']:
+                            row.skip()
+                            continue
+                        name = sports_place.get('name')
+                        type_code = sports_place['type'].get('typeCode')
 
-                    self.stdout.write(f'Handling hobby: {name}')
-                    if not zip_code_is_valid or not type_code in self.category_mappings.keys():
-                        continue
-                    location, location_created = Location.objects.update_or_create(
-                        data_source=self.source,
-                        origin_id=sports_place.get('sportsPlaceId'),
-                        defaults={
-                            'address': sports_place['location'].get('address', ''),
-                            'city': sports_place['location']['city'].get('name'),
-                            'coordinates': Point(
-                                sports_place['location']['coordinates']['wgs84'].get('lon', ''),
-                                sports_place['location']['coordinates']['wgs84'].get('lat', '')
-                            ),
-                            'name': sports_place.get('name'),
-                            'zip_code': cleaned_postal_code
-                        },
-                    )
+                        self.stdout.write(f'Handling hobby: {name}')
+                        if not zip_code_is_valid or not type_code in self.category_mappings.keys():
+                            row.skip()
+                            continue
+                        location, location_created = Location.objects.update_or_create(
+                            data_source=self.source,
+                            origin_id=sports_place.get('sportsPlaceId'),
+                            defaults={
+                                'address': sports_place['location'].get('address', ''),
+                                'city': sports_place['location']['city'].get('name'),
+                                'coordinates': Point(
+                                    sports_place['location']['coordinates']['wgs84'].get('lon', ''),
+                                    sports_place['location']['coordinates']['wgs84'].get('lat', '')
+                                ),
+                                'name': sports_place.get('name'),
+                                'zip_code': cleaned_postal_code
+                            },
+                        )
 
-                    if location_created:
-                        created_locations += 1
-                    else:
-                        updated_locations += 1
+                        if location_created:
+                            created_locations += 1
+                        else:
+                            updated_locations += 1
 
-                    category, _category_created = HobbyCategory.objects.get_or_create(
-                        name=self.category_mappings[type_code],
-                    )
-                    # Lipas import only tells us if a hobby is free, there is no price information or type available
-                    if is_free:
-                        price_type = Hobby.TYPE_FREE
-                    else:
-                        price_type = Hobby.TYPE_PAID
-                    hobby, hobby_created = Hobby.objects.update_or_create(
-                        data_source=self.source,
-                        origin_id=sports_place.get('sportsPlaceId'),
-                        defaults={
-                            'location': location,
-                            'name': sports_place['name'],
-                            'price_type': price_type,
-                            'description': sports_place['properties'].get('infoFi', ''),
-                        }
-                    )
-                    hobby.categories.set([category])
-                    found_hobby_origin_ids.append(hobby.origin_id)
+                        category, _category_created = HobbyCategory.objects.get_or_create(
+                            name=self.category_mappings[type_code],
+                        )
+                        # Lipas import only tells us if a hobby is free, there is no price information or type available
+                        if is_free:
+                            price_type = Hobby.TYPE_FREE
+                        else:
+                            price_type = Hobby.TYPE_PAID
+                        hobby, hobby_created = Hobby.objects.update_or_create(
+                            data_source=self.source,
+                            origin_id=sports_place.get('sportsPlaceId'),
+                            defaults={
+                                'location': location,
+                                'name': sports_place['name'],
+                                'price_type': price_type,
+                                'description': sports_place['properties'].get('infoFi', ''),
+                            }
+                        )
+                        hobby.categories.set([category])
+                        found_hobby_origin_ids.append(hobby.origin_id)
 
-                    hobbyevent, hobbyevent_created = HobbyEvent.objects.update_or_create(
-                        data_source=self.source,
-                        origin_id=sports_place.get('sportsPlaceId'),
-                        defaults={
-                            'hobby': hobby,
-                            'start_date': datetime.date.today(),
-                            'end_date': datetime.date.today() + datetime.timedelta(days=365),
-                            'start_time': datetime.datetime.strptime('00:00', '%H:%M').time(),
-                            'end_time': datetime.datetime.strptime('00:00', '%H:%M').time(),
-                        }
-                    )
-                    found_hobbyevent_origin_ids.append(hobbyevent.origin_id)
+                        hobbyevent, hobbyevent_created = HobbyEvent.objects.update_or_create(
+                            data_source=self.source,
+                            origin_id=sports_place.get('sportsPlaceId'),
+                            defaults={
+                                'hobby': hobby,
+                                'start_date': datetime.date.today(),
+                                'end_date': datetime.date.today() + datetime.timedelta(days=365),
+                                'start_time': datetime.datetime.strptime('00:00', '%H:%M').time(),
+                                'end_time': datetime.datetime.strptime('00:00', '%H:%M').time(),
+                            }
+                        )
+                        found_hobbyevent_origin_ids.append(hobbyevent.origin_id)
 
-                    if hobby_created:
-                        created_hobbies += 1
-                    else:
-                        updated_hobbies += 1
+                        if hobby_created:
+                            created_hobbies += 1
+                        else:
+                            updated_hobbies += 1
                 page_number += 1
         execution_time = round(time.time() - start_time, 2)
         self.stdout.write(f'\n{created_hobbies} new hobbies, {updated_hobbies} updated hobbies, {created_hobbies} new locations, {updated_hobbies} updated locations in {execution_time} seconds')
@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand
+
+from harrastuspassi.listings import refresh_hobby_event_listings
+
+
+class Command(BaseCommand):
+    help = ('Rebuild the denormalized hobby event listings of all hobbies or the given hobbies.'
+            ' The listings are also refreshed by update_hobby_next_event when they are enabled.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('hobby_ids', nargs='*', type=int, help='Hobbies to refresh, all by default')
+
+    def handle(self, *args, **options):
+        listing_count = refresh_hobby_event_listings(options['hobby_ids'] or None)
+        self.stdout.write(f'Refreshed hobby event listings, {listing_count} listings')
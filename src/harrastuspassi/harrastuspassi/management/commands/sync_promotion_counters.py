@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand
+
+from harrastuspassi.models import Promotion
+
+
+class Command(BaseCommand):
+    help = 'Update the used count of promotions which count redemptions in sharded counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--shards',
+            action='store',
+            dest='shards',
+            type=int,
+            default=None,
+            help='Set the number of counter shards of the given promotions, 0 disables sharding'
+        )
+        parser.add_argument('promotion_ids', nargs='*', type=int, help='Promotions to handle, all sharded by default')
+
+    def handle(self, *args, **options):
+        promotions = Promotion.objects.all()
+        if options['promotion_ids']:
+            promotions = promotions.filter(pk__in=options['promotion_ids'])
+        elif options['shards'] is None:
+            promotions = promotions.filter(counter_shard_count__gt=0)
+        else:
+            self.stderr.write('Give the promotions to shard')
+            return
+
+        for promotion in promotions:
+            if options['shards'] is not None:
+                promotion.enable_counter_shards(options['shards'])
+                self.stdout.write(f'Promotion {promotion.pk} uses {options["shards"]} counter shards')
+            else:
+                promotion.sync_counter_shards()
+                self.stdout.write(
+                    f'Promotion {promotion.pk}: {promotion.used_count}/{promotion.available_count} used'
+                )
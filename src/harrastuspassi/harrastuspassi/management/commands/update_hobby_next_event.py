@@ -2,6 +2,8 @@
 from datetime import date
 from django.core.management.base import BaseCommand
 from django.db import models
+from harrastuspassi import settings
+from harrastuspassi.listings import refresh_hobby_event_listings
 from harrastuspassi.models import Hobby, HobbyEvent
 
 
@@ -38,4 +40,8 @@ class Command(BaseCommand):
         end_date_in_future_count = fallback_updated_count - hobbies_without_next_event_count
         self.stdout.write(f'{start_date_in_future_count} hobbies with upcoming next event')
         self.stdout.write(f'{end_date_in_future_count} hobbies with ongoing next event')
-        self.stdout.write(f'{hobbies_without_next_event_count} hobbies without next event')
\ No newline at end of file
+        self.stdout.write(f'{hobbies_without_next_event_count} hobbies without next event')
+        if settings.HOBBY_EVENT_LISTING_ENABLED:
+            # Next events were updated without signals, and past events are dropped from the listings
+            listing_count = refresh_hobby_event_listings()
+            self.stdout.write(f'Refreshed hobby event listings, {listing_count} listings')
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand
+
+from harrastuspassi import tasks
+
+
+class Command(BaseCommand):
+    help = 'Roll up the daily usage statistics of promotions from benefits'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            action='store',
+            dest='days',
+            type=int,
+            default=2,
+            help='Number of days to update, including today. Use 0 to update all days.'
+        )
+
+    def handle(self, *args, **options):
+        updated_count = tasks.update_promotion_statistics(days=options['days'] or None)
+        self.stdout.write(f'Updated {updated_count} daily promotion statistics')
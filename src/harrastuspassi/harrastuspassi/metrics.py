@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+""" Prometheus metrics, exposed on /monitor/metrics.
+
+    Under gunicorn each worker has its own copy of the metrics. For the endpoint to report
+    all of them, set the prometheus_multiproc_dir environment variable to an empty directory
+    before starting gunicorn and call mark_process_dead from the child_exit server hook.
+    Management commands run with the same environment variable report their metrics
+    through the same directory.
+"""
+import os
+from contextlib import contextmanager
+
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+from prometheus_client.core import GaugeMetricFamily
+
+REQUEST_DURATION = Histogram(
+    'harrastuspassi_request_duration_seconds',
+    'Time spent handling API requests',
+    ['view', 'method', 'status'],
+)
+CACHE_REQUESTS = Counter(
+    'harrastuspassi_cache_requests_total',
+    'Lookups from caches, by cache and result which is hit or miss',
+    ['cache', 'result'],
+)
+IMPORTER_ROWS = Counter(
+    'harrastuspassi_importer_rows_total',
+    'Rows handled by the importers, by result which is processed, skipped or failed',
+    ['importer', 'result'],
+)
+DATABASE_READS = Counter(
+    'harrastuspassi_database_reads_total',
+    'Safe API requests of anonymous users by route, which is the replica, sticky_primary or lagging_primary',
+    ['route'],
+)
+DATABASE_POOL_CONNECTIONS = Gauge(
+    'harrastuspassi_database_pool_connections',
+    'Connections in the database connection pools by state, which is idle or in_use',
+    ['database', 'state'],
+    multiprocess_mode='livesum',
+)
+DATABASE_POOL_CHECKOUTS = Counter(
+    'harrastuspassi_database_pool_checkouts_total',
+    'Connections taken from the database connection pools by result, which is reused, new or timeout',
+    ['database', 'result'],
+)
+DATABASE_POOL_WAIT = Histogram(
+    'harrastuspassi_database_pool_wait_seconds',
+    'Time spent waiting for a free connection in the database connection pools',
+    ['database'],
+)
+DATABASE_POOL_DISCARDS = Counter(
+    'harrastuspassi_database_pool_discards_total',
+    'Pooled connections closed instead of reused, by reason which is broken, expired or closed',
+    ['database', 'reason'],
+)
+STATEMENT_TIMEOUTS = Counter(
+    'harrastuspassi_statement_timeouts_total',
+    'API requests answered with 503 because a database query was cancelled, by view',
+    ['view'],
+)
+PERMISSION_SYNC_DURATION = Histogram(
+    'harrastuspassi_permission_sync_duration_seconds',
+    'Time spent updating object permissions',
+    ['task'],
+)
+
+
+def is_multiprocess() -> bool:
+    return bool(os.environ.get('prometheus_multiproc_dir'))
+
+
+def mark_process_dead(pid: int) -> None:
+    """ Call from the gunicorn child_exit hook """
+    if is_multiprocess():
+        multiprocess.mark_process_dead(pid)
+
+
+def count_cache_lookup(cache: str, hit: bool) -> None:
+    CACHE_REQUESTS.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+def count_database_read(route: str) -> None:
+    DATABASE_READS.labels(route).inc()
+
+
+def count_statement_timeout(view: str) -> None:
+    STATEMENT_TIMEOUTS.labels(view).inc()
+
+
+class ImporterRow:
+    result = 'processed'
+
+    def skip(self):
+        self.result = 'skipped'
+
+
+@contextmanager
+def count_importer_row(importer: str):
+    """ Count a row as processed, or as skipped if row.skip() is called. Rows raising an exception are failed. """
+    row = ImporterRow()
+    try:
+        yield row
+    except Exception:
+        IMPORTER_ROWS.labels(importer, 'failed').inc()
+        raise
+    IMPORTER_ROWS.labels(importer, row.result).inc()
+
+
+def time_permission_sync(function):
+    """ Decorator for the permission update tasks """
+    return PERMISSION_SYNC_DURATION.labels(function.__name__).time()(function)
+
+
+class QueueCollector:
+    """ Sizes of the work queues, read from the database on each scrape """
+
+    def collect(self):
+        # Imported here, the database backend uses this module before the models are ready
+        from harrastuspassi.models import ImageDerivativeJob, Location
+
+        pending = GaugeMetricFamily(
+            'harrastuspassi_geocoding_pending_locations', 'Locations waiting to be geocoded')
+        pending.add_metric([], Location.objects.filter(geocoding_status=Location.GEOCODING_PENDING).count())
+        yield pending
+        pending_images = GaugeMetricFamily(
+            'harrastuspassi_pending_image_derivatives', 'Images waiting for their resized versions')
+        pending_images.add_metric([], ImageDerivativeJob.objects.filter(next_attempt_at__isnull=False).count())
+        yield pending_images
+
+
+QUEUE_REGISTRY = CollectorRegistry()
+QUEUE_REGISTRY.register(QueueCollector())
+
+
+def render_metrics() -> bytes:
+    if is_multiprocess():
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry) + generate_latest(QUEUE_REGISTRY)
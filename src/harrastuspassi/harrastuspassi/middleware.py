@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+import functools
+import hashlib
+import logging
+import random
+import re
+import time
+from contextlib import ExitStack
+from typing import Optional
+
+import brotli
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence, compress_string
+
+from harrastuspassi import settings
+from harrastuspassi.metrics import REQUEST_DURATION, count_cache_lookup
+
+LOG = logging.getLogger(__name__)
+
+
+def get_view_name(request, view_func=None) -> str:
+    """ HobbyViewSet.list for viewsets, the url name or the function name for other views """
+    view_func = view_func or getattr(getattr(request, 'resolver_match', None), 'func', None)
+    if view_func is None:
+        return 'unknown'
+    view_class = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+    if view_class is None:
+        return getattr(view_func, '__qualname__', view_func.__class__.__name__)
+    actions = getattr(view_func, 'actions', None) or {}
+    action = actions.get(request.method.lower(), request.method.lower())
+    return f'{view_class.__name__}.{action}'
+
+
+class RequestProfile:
+    """ Timings of a single request, in seconds """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.query_count = 0
+        self.query_time = 0.0
+        self.view_name = None
+        self.view_start = None
+        self.view_end = None
+        self.view_query_time = None
+        self.render_end = None
+        # Set when the view uses api.SerializerProfilingMixin
+        self.serializer_time = None
+
+    def __call__(self, execute, sql, params, many, context):
+        # Database execute wrapper
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.query_count += 1
+            self.query_time += time.perf_counter() - start
+
+    def time_serializer(self, to_representation):
+        """ Wraps to_representation of a serializer, the time spent in it excluding SQL is counted as serializer """
+        @functools.wraps(to_representation)
+        def timed_to_representation(*args, **kwargs):
+            start = time.perf_counter()
+            query_time = self.query_time
+            try:
+                return to_representation(*args, **kwargs)
+            finally:
+                duration = time.perf_counter() - start - (self.query_time - query_time)
+                self.serializer_time = (self.serializer_time or 0.0) + duration
+        return timed_to_representation
+
+    def get_timings(self, end):
+        """ db: time spent in SQL during the whole request
+            view: time spent in the view excluding SQL and serializers
+            serializer: time spent serializing the response data excluding SQL, for DRF viewsets
+            render: time spent rendering the response, for example into JSON
+            total: time spent in the middlewares below this one, the view and rendering
+        """
+        timings = {'db': self.query_time, 'total': end - self.start}
+        if self.view_start is not None:
+            view_end = self.view_end or end
+            view_query_time = self.view_query_time if self.view_end else self.query_time
+            timings['view'] = max(0.0, view_end - self.view_start - view_query_time - (self.serializer_time or 0.0))
+        if self.serializer_time is not None:
+            timings['serializer'] = self.serializer_time
+        if self.view_end is not None and self.render_end is not None:
+            timings['render'] = self.render_end - self.view_end
+        return timings
+
+
+class ProfilingMiddleware:
+    """ Profiles a random sample of requests, the fraction is set with HARRASTUSPASSI_PROFILING_SAMPLE_RATE.
+        The timings are logged and returned in the Server-Timing header. Requests which are not
+        sampled only cost a random number.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_SAMPLE_RATE:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.sample_rate = settings.PROFILING_SAMPLE_RATE
+
+    def __call__(self, request):
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+        profile = RequestProfile()
+        request._profile = profile
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(profile))
+            response = self.get_response(request)
+        timings = profile.get_timings(time.perf_counter())
+        if settings.PROFILING_SERVER_TIMING:
+            response['Server-Timing'] = ', '.join(
+                [f'{name};dur={round(duration * 1000, 1)}' for name, duration in timings.items()] +
+                [f'queries;desc="{profile.query_count}"']
+            )
+        LOG.info('Request profile', extra={'data': {
+            'view': profile.view_name or get_view_name(request),
+            'method': request.method,
+            'path': request.path,
+            'status_code': response.status_code,
+            'query_count': profile.query_count,
+            **{f'{name}_ms': round(duration * 1000, 1) for name, duration in timings.items()},
+        }})
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        profile = getattr(request, '_profile', None)
+        if profile is not None:
+            profile.view_name = get_view_name(request, view_func)
+            profile.view_start = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after this, so the view and serializers are done
+        profile = getattr(request, '_profile', None)
+        if profile is not None:
+            profile.view_end = time.perf_counter()
+            profile.view_query_time = profile.query_time
+
+            def render_finished(response):
+                profile.render_end = time.perf_counter()
+            response.add_post_render_callback(render_finished)
+        return response
+
+
+class MetricsMiddleware:
+    """ Records the duration of each request by view and action """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        response = self.get_response(request)
+        REQUEST_DURATION.labels(
+            getattr(request, '_metrics_view_name', 'unknown'), request.method, response.status_code,
+        ).observe(time.perf_counter() - start)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._metrics_view_name = get_view_name(request, view_func)
+
+
+def get_accepted_encoding(accept_encoding: str, streaming: bool = False) -> Optional[str]:
+    """ br or gzip, whichever the client accepts in that order of preference, or None.
+        Streaming responses are only compressed with gzip.
+    """
+    qualities = {}
+    for item in accept_encoding.split(','):
+        coding, *params = [part.strip() for part in item.split(';')]
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding:
+            qualities[coding.lower()] = quality
+    for encoding in (('gzip',) if streaming else ('br', 'gzip')):
+        if qualities.get(encoding, qualities.get('*', 0.0)) > 0:
+            return encoding
+    return None
+
+
+def compress(content: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(content, quality=settings.COMPRESSION_BROTLI_QUALITY)
+    return compress_string(content)
+
+
+class CompressionMiddleware:
+    """ Replaces django.middleware.gzip.GZipMiddleware, compressing with brotli when the client accepts it.
+        Compressed responses of anonymous GET requests are cached by the digest of their content,
+        so identical responses, like the public lists, are compressed only once.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        # Images are compressed already
+        if response.has_header('Content-Encoding') or response.get('Content-Type', '').startswith('image/'):
+            return response
+        if not response.streaming and len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = get_accepted_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''), response.streaming)
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            # Delete the Content-Length header, the length of the compressed content is not known
+            response.streaming_content = compress_sequence(response.streaming_content)
+            del response['Content-Length']
+        else:
+            compressed_content = self.get_compressed_content(request, response, encoding)
+            if len(compressed_content) >= len(response.content):
+                return response
+            response.content = compressed_content
+            response['Content-Length'] = str(len(compressed_content))
+
+        # The ETag of the uncompressed content is only a weak match for the compressed content, as in GZipMiddleware
+        if response.has_header('ETag'):
+            response['ETag'] = re.sub(r'^"', 'W/"', response['ETag'])
+        response['Content-Encoding'] = encoding
+        return response
+
+    def get_compressed_content(self, request, response, encoding):
+        is_cacheable = (
+            request.method == 'GET' and response.status_code == 200 and 'HTTP_AUTHORIZATION' not in request.META
+            and len(response.content) <= settings.COMPRESSION_CACHE_MAX_SIZE
+        )
+        if not is_cacheable:
+            return compress(response.content, encoding)
+        cache_key = f'compressed-response:{encoding}:{hashlib.blake2b(response.content).hexdigest()}'
+        compressed_content = cache.get(cache_key)
+        count_cache_lookup('compressed_responses', hit=compressed_content is not None)
+        if compressed_content is None:
+            compressed_content = compress(response.content, encoding)
+            cache.set(cache_key, compressed_content, timeout=settings.COMPRESSION_CACHE_TIMEOUT)
+        return compressed_content
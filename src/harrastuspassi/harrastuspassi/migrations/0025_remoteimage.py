@@ -0,0 +1,29 @@
+# Generated by Django 2.2.4 on 2026-10-19 09:12
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('harrastuspassi', '0024_organizer_municipality_created_by'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RemoteImage',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, editable=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('url', models.URLField(max_length=1024, unique=True)),
+                ('image', models.ImageField(max_length=255, upload_to='hobby_images')),
+                ('etag', models.CharField(blank=True, default='', max_length=256)),
+                ('last_modified', models.CharField(blank=True, default='', max_length=64)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
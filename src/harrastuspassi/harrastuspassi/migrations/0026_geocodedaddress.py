@@ -0,0 +1,28 @@
+# Generated by Django 2.2.4 on 2026-10-19 10:05
+
+import django.contrib.gis.db.models.fields
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('harrastuspassi', '0025_remoteimage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeocodedAddress',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, editable=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('address', models.CharField(max_length=512, unique=True, verbose_name='Normalized address')),
+                ('coordinates', django.contrib.gis.db.models.fields.PointField(blank=True, null=True, srid=4326)),
+            ],
+            options={
+                'verbose_name_plural': 'geocoded addresses',
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 2.2.4 on 2026-10-19 11:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('harrastuspassi', '0026_geocodedaddress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='geocoding_attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='geocoding_next_attempt_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='geocoding_status',
+            field=models.CharField(blank=True, choices=[('pending', 'Pending'), ('done', 'Done'), ('failed', 'Failed')], default='', max_length=16),
+        ),
+        migrations.AddIndex(
+            model_name='location',
+            index=models.Index(fields=['geocoding_status', 'geocoding_next_attempt_at'], name='harrastuspa_geocodi_a9b4d2_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 2.2.4 on 2026-10-19 12:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('harrastuspassi', '0027_location_geocoding_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='promotion',
+            name='counter_shard_count',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='PromotionCounterShard',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('available_count', models.PositiveIntegerField()),
+                ('used_count', models.PositiveIntegerField(default=0)),
+                ('promotion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='counter_shards', to='harrastuspassi.Promotion')),
+            ],
+            options={
+                'unique_together': {('promotion', 'shard')},
+            },
+        ),
+    ]
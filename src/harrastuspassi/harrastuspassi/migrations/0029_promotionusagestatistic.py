@@ -0,0 +1,27 @@
+# Generated by Django 2.2.4 on 2026-10-19 13:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('harrastuspassi', '0028_promotion_counter_shards'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PromotionUsageStatistic',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('used_count', models.PositiveIntegerField(default=0)),
+                ('promotion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='usage_statistics', to='harrastuspassi.Promotion')),
+            ],
+            options={
+                'ordering': ('date',),
+                'unique_together': {('promotion', 'date')},
+            },
+        ),
+    ]
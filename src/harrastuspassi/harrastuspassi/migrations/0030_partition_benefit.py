@@ -0,0 +1,107 @@
+# Generated by Django 2.2.4 on 2026-10-19 13:45
+
+import datetime
+
+from django.db import migrations
+
+TABLE = 'harrastuspassi_benefit'
+PROMOTION_TABLE = 'harrastuspassi_promotion'
+# Partitions are created for this many months ahead, later ones by the create_benefit_partitions command
+MONTHS_AHEAD = 3
+
+
+def next_month_start(month):
+    return (month.replace(day=1) + datetime.timedelta(days=32)).replace(day=1)
+
+
+def can_partition(schema_editor):
+    # Declarative partitioning with primary and foreign keys requires PostgreSQL 11
+    connection = schema_editor.connection
+    return connection.vendor == 'postgresql' and connection.pg_version >= 110000
+
+
+def is_partitioned(cursor):
+    cursor.execute('SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)', [TABLE])
+    return cursor.fetchone() is not None
+
+
+def partition_benefit(apps, schema_editor):
+    if not can_partition(schema_editor):
+        return
+    with schema_editor.connection.cursor() as cursor:
+        if is_partitioned(cursor):
+            return
+        # The primary key of a partitioned table has to include the partition key
+        cursor.execute(f"""
+            CREATE TABLE {TABLE}_partitioned (
+                id integer NOT NULL,
+                created_at timestamp with time zone NOT NULL,
+                updated_at timestamp with time zone NOT NULL,
+                promotion_id integer NOT NULL REFERENCES {PROMOTION_TABLE} (id) DEFERRABLE INITIALLY DEFERRED,
+                PRIMARY KEY (id, created_at)
+            ) PARTITION BY RANGE (created_at)
+        """)
+        cursor.execute(f'CREATE TABLE {TABLE}_default PARTITION OF {TABLE}_partitioned DEFAULT')
+
+        cursor.execute(f"SELECT DISTINCT date_trunc('month', created_at AT TIME ZONE 'UTC')::date FROM {TABLE}")
+        months = set(row[0] for row in cursor.fetchall())
+        month = datetime.datetime.utcnow().date().replace(day=1)
+        for _ in range(MONTHS_AHEAD + 1):
+            months.add(month)
+            month = next_month_start(month)
+        for month in sorted(months):
+            cursor.execute(
+                f'CREATE TABLE {TABLE}_y{month.year}m{month.month:02d} PARTITION OF {TABLE}_partitioned'
+                f" FOR VALUES FROM ('{month:%Y-%m-%d} 00:00:00+00')"
+                f" TO ('{next_month_start(month):%Y-%m-%d} 00:00:00+00')"
+            )
+
+        cursor.execute(
+            f'INSERT INTO {TABLE}_partitioned (id, created_at, updated_at, promotion_id)'
+            f' SELECT id, created_at, updated_at, promotion_id FROM {TABLE}'
+        )
+        # Keep the id sequence when the original table is dropped
+        cursor.execute(f"ALTER TABLE {TABLE}_partitioned ALTER COLUMN id SET DEFAULT nextval('{TABLE}_id_seq')")
+        cursor.execute(f'ALTER SEQUENCE {TABLE}_id_seq OWNED BY {TABLE}_partitioned.id')
+        cursor.execute(f'DROP TABLE {TABLE}')
+        cursor.execute(f'ALTER TABLE {TABLE}_partitioned RENAME TO {TABLE}')
+        cursor.execute(f'ALTER INDEX {TABLE}_partitioned_pkey RENAME TO {TABLE}_pkey')
+        cursor.execute(f'CREATE INDEX {TABLE}_promotion_id_idx ON {TABLE} (promotion_id)')
+
+
+def unpartition_benefit(apps, schema_editor):
+    if not can_partition(schema_editor):
+        return
+    with schema_editor.connection.cursor() as cursor:
+        if not is_partitioned(cursor):
+            return
+        cursor.execute(f"""
+            CREATE TABLE {TABLE}_unpartitioned (
+                id integer NOT NULL PRIMARY KEY,
+                created_at timestamp with time zone NOT NULL,
+                updated_at timestamp with time zone NOT NULL,
+                promotion_id integer NOT NULL REFERENCES {PROMOTION_TABLE} (id) DEFERRABLE INITIALLY DEFERRED
+            )
+        """)
+        cursor.execute(
+            f'INSERT INTO {TABLE}_unpartitioned (id, created_at, updated_at, promotion_id)'
+            f' SELECT id, created_at, updated_at, promotion_id FROM {TABLE}'
+        )
+        cursor.execute(f"ALTER TABLE {TABLE}_unpartitioned ALTER COLUMN id SET DEFAULT nextval('{TABLE}_id_seq')")
+        cursor.execute(f'ALTER SEQUENCE {TABLE}_id_seq OWNED BY {TABLE}_unpartitioned.id')
+        # Dropping the partitioned table drops all of its partitions
+        cursor.execute(f'DROP TABLE {TABLE}')
+        cursor.execute(f'ALTER TABLE {TABLE}_unpartitioned RENAME TO {TABLE}')
+        cursor.execute(f'ALTER INDEX {TABLE}_unpartitioned_pkey RENAME TO {TABLE}_pkey')
+        cursor.execute(f'CREATE INDEX {TABLE}_promotion_id_idx ON {TABLE} (promotion_id)')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('harrastuspassi', '0029_promotionusagestatistic'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_benefit, unpartition_benefit),
+    ]
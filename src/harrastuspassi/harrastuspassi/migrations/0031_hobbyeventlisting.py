@@ -0,0 +1,63 @@
+# Generated by Django 2.2.4 on 2026-10-19 16:10
+
+import django.contrib.gis.db.models.fields
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('harrastuspassi', '0030_partition_benefit'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HobbyEventListing',
+            fields=[
+                ('event', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='listing', serialize=False, to='harrastuspassi.HobbyEvent')),
+                ('is_next_event', models.BooleanField(default=False)),
+                ('start_date', models.DateField()),
+                ('start_time', models.TimeField()),
+                ('start_weekday', models.PositiveSmallIntegerField(choices=[(1, 'Monday'), (2, 'Tuesday'), (3, 'Wednesday'), (4, 'Thursday'), (5, 'Friday'), (6, 'Saturday'), (7, 'Sunday')])),
+                ('end_date', models.DateField()),
+                ('end_time', models.TimeField()),
+                ('data_source', models.CharField(blank=True, max_length=256)),
+                ('hobby_name', models.CharField(max_length=1024)),
+                ('hobby_description', models.TextField(blank=True)),
+                ('price_type', models.CharField(choices=[('free', 'Free'), ('annual', 'Annual'), ('seasonal', 'Seasonal'), ('one_time', 'One time'), ('paid', 'Paid')], max_length=1024)),
+                ('price_amount', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('cover_image', models.ImageField(blank=True, max_length=255, upload_to='hobby_images')),
+                ('category_ids', django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), default=list, size=None)),
+                ('location_name', models.CharField(blank=True, max_length=256)),
+                ('location_address', models.CharField(blank=True, max_length=256)),
+                ('location_zip_code', models.CharField(blank=True, max_length=5)),
+                ('location_city', models.CharField(blank=True, max_length=64)),
+                ('location_geocoding_status', models.CharField(blank=True, max_length=16)),
+                ('coordinates', django.contrib.gis.db.models.fields.PointField(null=True, srid=4326)),
+                ('organizer_name', models.CharField(blank=True, max_length=256)),
+                ('municipality_name', models.CharField(blank=True, max_length=256)),
+                ('hobby', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='event_listings', to='harrastuspassi.Hobby')),
+                ('location', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='harrastuspassi.Location')),
+                ('municipality', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='harrastuspassi.Municipality')),
+                ('organizer', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='harrastuspassi.Organizer')),
+            ],
+            options={
+                'ordering': ('start_date', 'start_time'),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='hobbyeventlisting',
+            index=models.Index(fields=['is_next_event', 'start_date', 'start_time'], name='harrastuspa_is_next_3427c0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='hobbyeventlisting',
+            index=models.Index(fields=['hobby', 'start_date'], name='harrastuspa_hobby_i_565ff4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='hobbyeventlisting',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['category_ids'], name='harrastuspa_categor_d08b92_gin'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.4 on 2026-10-20 09:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('harrastuspassi', '0032_imagederivativejob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imagederivativejob',
+            name='derivatives_key',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=40),
+        ),
+    ]
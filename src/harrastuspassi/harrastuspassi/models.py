@@ -2,18 +2,18 @@
 # -*- coding: utf-8 -*-
 import logging
 import datetime
-import os
 from copy import copy
 from django.contrib.gis.db import models as gis_models
 from django.contrib.gis.db.models.functions import GeoFunc, Distance
 from django.contrib.gis.geos import Point
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
 from django.core.exceptions import ValidationError
-from django.db import models
-from django.db.models import F
+from django.db import connection, models, transaction
 from django.db.models.expressions import Func
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
-from django.db.models.signals import pre_save, post_delete
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from mptt.models import MPTTModel, TreeForeignKey
 from harrastuspassi import settings
@@ -49,6 +49,44 @@ class ExternalDataModel(models.Model):
         abstract = True
 
 
+class FileTrackingMixin:
+    """ Remembers the names of the files an instance was loaded with, so that replaced
+    files can be detected in memory instead of querying the database again on save.
+    """
+    tracked_file_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_file_names = instance._get_file_names()
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # post_save receivers still see the names the instance was loaded with
+        self._loaded_file_names = self._get_file_names()
+
+    def _get_file_names(self):
+        file_names = {}
+        for field_name in self.tracked_file_fields:
+            # deferred fields are not in __dict__ and would be fetched by getattr()
+            if field_name in self.__dict__:
+                value = self.__dict__[field_name]
+                file_names[field_name] = getattr(value, 'name', value) or None
+        return file_names
+
+    def get_changed_files(self):
+        """ List of (field name, loaded file name, current file name) for changed file fields.
+        The loaded file name is None for new instances.
+        """
+        loaded_file_names = getattr(self, '_loaded_file_names', {})
+        return [
+            (field_name, loaded_file_names.get(field_name), file_name)
+            for field_name, file_name in self._get_file_names().items()
+            if loaded_file_names.get(field_name) != file_name
+        ]
+
+
 class GeometryDistance(GeoFunc):
     # Backported from Django 3.0
     # GeometryDistance allows spatial sorting using spatial indexes
@@ -102,6 +140,15 @@ class Municipality(TimestampedModel):
 
 
 class Location(ExternalDataModel, TimestampedModel):
+    GEOCODING_PENDING = 'pending'
+    GEOCODING_DONE = 'done'
+    GEOCODING_FAILED = 'failed'
+    GEOCODING_STATUS_CHOICES = (
+        (GEOCODING_PENDING, _('Pending')),
+        (GEOCODING_DONE, _('Done')),
+        (GEOCODING_FAILED, _('Failed')),
+    )
+
     name = models.CharField(max_length=256, blank=True, verbose_name='Location')
     address = models.CharField(max_length=256, blank=True)
     zip_code = models.CharField(max_length=5, blank=True)
@@ -109,9 +156,18 @@ class Location(ExternalDataModel, TimestampedModel):
     coordinates = gis_models.PointField(null=True, blank=True, srid=COORDINATE_SYSTEM_ID)
     municipality = models.ForeignKey(Municipality, null=True, blank=True, on_delete=models.CASCADE)
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL)
+    # Coordinates of locations created without them are geocoded in the background
+    geocoding_status = models.CharField(max_length=16, blank=True, default='', choices=GEOCODING_STATUS_CHOICES)
+    geocoding_attempts = models.PositiveSmallIntegerField(default=0)
+    geocoding_next_attempt_at = models.DateTimeField(null=True, blank=True)
 
     objects = LocationQuerySet.as_manager()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['geocoding_status', 'geocoding_next_attempt_at']),
+        ]
+
     @property
     def lat(self):
         return self.coordinates.y if self.coordinates else None
@@ -130,6 +186,18 @@ class Location(ExternalDataModel, TimestampedModel):
             raise ValidationError('One of the following fields is required: name, city or coordinates')
 
 
+class GeocodedAddress(TimestampedModel):
+    """ Cached geocoding result. Coordinates are null for addresses which could not be geocoded. """
+    address = models.CharField(max_length=512, unique=True, verbose_name='Normalized address')
+    coordinates = gis_models.PointField(null=True, blank=True, srid=COORDINATE_SYSTEM_ID)
+
+    class Meta:
+        verbose_name_plural = 'geocoded addresses'
+
+    def __str__(self):
+        return self.address
+
+
 class Organizer(ExternalDataModel, TimestampedModel):
     name = models.CharField(max_length=256, verbose_name='Organizer')
     municipality = models.ForeignKey(Municipality, null=True, blank=True, on_delete=models.CASCADE)
@@ -139,11 +207,13 @@ class Organizer(ExternalDataModel, TimestampedModel):
         return self.name
 
 
-class HobbyCategory(MPTTModel, ExternalDataModel, TimestampedModel):
+class HobbyCategory(FileTrackingMixin, MPTTModel, ExternalDataModel, TimestampedModel):
     name = models.CharField(max_length=256, verbose_name='Hobby Category')
     parent = TreeForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='children')
     cover_image = models.ImageField(upload_to='hobbycategory_images', null=True, blank=True)
 
+    tracked_file_fields = ('cover_image',)
+
     class MPTTMeta:
         order_insertion_by = ['name']
 
@@ -172,7 +242,7 @@ class HobbyQuerySet(DistanceMixin, models.QuerySet):
     coordinates_field = 'location__coordinates'
 
 
-class Hobby(ExternalDataModel, TimestampedModel):
+class Hobby(FileTrackingMixin, ExternalDataModel, TimestampedModel):
     TYPE_FREE = 'free'
     TYPE_PAID = 'paid'  # for the cases when the recurrence of payment is not defined
     TYPE_ANNUAL = 'annual'
@@ -204,6 +274,8 @@ class Hobby(ExternalDataModel, TimestampedModel):
 
     objects = HobbyQuerySet.as_manager()
 
+    tracked_file_fields = ('cover_image',)
+
     class Meta:
         ordering = ('id',)
         verbose_name_plural = 'Hobbies'
@@ -232,27 +304,67 @@ class Hobby(ExternalDataModel, TimestampedModel):
         self.next_event = next_event
         self.save()
 
+
+def is_cover_image_shared(name):
+    """ Imported cover images are content-addressed, so one file may be used by many hobbies """
+    return Hobby.objects.filter(cover_image=name).exists() or RemoteImage.objects.filter(image=name).exists()
+
+
+def delete_cover_image_on_commit(name):
+    """ Delete a replaced or orphaned cover image once the transaction has been committed.
+    Nothing is deleted if the transaction is rolled back.
+    """
+    storage = Hobby._meta.get_field('cover_image').storage
+
+    def delete_if_unreferenced():
+        if not is_cover_image_shared(name):
+            storage.delete(name)
+    transaction.on_commit(delete_if_unreferenced)
+
+
 @receiver(post_delete, sender=Hobby)
 def auto_delete_file_on_delete(sender, instance, **kwargs):
     if instance.cover_image:
-        if os.path.isfile(instance.cover_image.path):
-            os.remove(instance.cover_image.path)
+        delete_cover_image_on_commit(instance.cover_image.name)
+
+
+@receiver(post_save, sender=Hobby)
+def auto_delete_file_on_change(sender, instance, created, **kwargs):
+    for _field_name, loaded_file_name, _file_name in instance.get_changed_files():
+        if loaded_file_name:
+            delete_cover_image_on_commit(loaded_file_name)
+
 
-@receiver(pre_save, sender=Hobby)
-def auto_delete_file_on_change(sender, instance, **kwargs):
-    if not instance.pk:
-        return False
+class RemoteImage(TimestampedModel):
+    """
+    An image downloaded from an external data source. The stored file is named by
+    its content hash, so an image used by many hobbies is stored only once.
+    ETag and Last-Modified are kept for conditional requests on later imports.
+    """
+    url = models.URLField(max_length=1024, unique=True)
+    image = models.ImageField(upload_to='hobby_images', max_length=255)
+    etag = models.CharField(max_length=256, blank=True, default='')
+    last_modified = models.CharField(max_length=64, blank=True, default='')
 
-    try:
-        hobby = Hobby.objects.get(pk=instance.pk)
-    except Hobby.DoesNotExist:
-        return False
+    def __str__(self):
+        return self.url
+
+
+class ImageDerivativeJob(TimestampedModel):
+    """
+    The resized versions of an image. Images waiting for the generate_image_derivatives command
+    have next_attempt_at set. Once the versions have been generated, derivatives_key records the
+    widths and formats they were generated in, see images.get_derivatives_key. Jobs which have
+    failed too many times are kept with next_attempt_at unset, so that they are not queued again.
+    """
+    image_name = models.CharField(max_length=255, unique=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(null=True, blank=True, default=timezone.now, db_index=True)
+    derivatives_key = models.CharField(max_length=40, blank=True, default='', db_index=True)
+
+    def __str__(self):
+        return self.image_name
 
-    if hobby.cover_image:
-        new_file = instance.cover_image
-        if not hobby.cover_image == new_file:
-            if os.path.isfile(hobby.cover_image.path):
-                os.remove(hobby.cover_image.path)
 
 class HobbyEventQuerySet(DistanceMixin, models.QuerySet):
     coordinates_field = 'hobby__location__coordinates'
@@ -324,7 +436,63 @@ class HobbyEvent(ExternalDataModel, TimestampedModel):
             return f'Orphan HobbyEvent with no Hobby'
 
 
-class Promotion(TimestampedModel):
+class HobbyEventListingQuerySet(DistanceMixin, models.QuerySet):
+    coordinates_field = 'coordinates'
+
+
+class HobbyEventListing(models.Model):
+    """ Denormalized row per upcoming HobbyEvent with everything the hobby event list needs,
+        so that the list is served from this table alone. Maintained by harrastuspassi.listings.
+    """
+    event = models.OneToOneField(HobbyEvent, primary_key=True, on_delete=models.CASCADE, related_name='listing')
+    hobby = models.ForeignKey(Hobby, on_delete=models.CASCADE, related_name='event_listings')
+    is_next_event = models.BooleanField(default=False)
+    start_date = models.DateField()
+    start_time = models.TimeField()
+    start_weekday = models.PositiveSmallIntegerField(choices=HobbyEvent.DAY_OF_WEEK_CHOICES)
+    end_date = models.DateField()
+    end_time = models.TimeField()
+    data_source = models.CharField(max_length=256, blank=True)
+
+    hobby_name = models.CharField(max_length=1024)
+    hobby_description = models.TextField(blank=True)
+    price_type = models.CharField(max_length=1024, choices=Hobby.PRICE_TYPE_CHOICES)
+    price_amount = models.DecimalField(max_digits=5, decimal_places=2)
+    # Cover image of the hobby or the fallback image from its categories
+    cover_image = models.ImageField(upload_to='hobby_images', max_length=255, blank=True)
+    category_ids = ArrayField(models.IntegerField(), default=list)
+
+    # Related objects are not deleted through the listing, the hobby takes the rows with it
+    location = models.ForeignKey(Location, null=True, on_delete=models.DO_NOTHING, db_constraint=False,
+                                 related_name='+')
+    location_name = models.CharField(max_length=256, blank=True)
+    location_address = models.CharField(max_length=256, blank=True)
+    location_zip_code = models.CharField(max_length=5, blank=True)
+    location_city = models.CharField(max_length=64, blank=True)
+    location_geocoding_status = models.CharField(max_length=16, blank=True)
+    coordinates = gis_models.PointField(null=True, srid=COORDINATE_SYSTEM_ID)
+    organizer = models.ForeignKey(Organizer, null=True, on_delete=models.DO_NOTHING, db_constraint=False,
+                                  related_name='+')
+    organizer_name = models.CharField(max_length=256, blank=True)
+    municipality = models.ForeignKey(Municipality, null=True, on_delete=models.DO_NOTHING, db_constraint=False,
+                                     related_name='+')
+    municipality_name = models.CharField(max_length=256, blank=True)
+
+    objects = HobbyEventListingQuerySet.as_manager()
+
+    class Meta:
+        ordering = ('start_date', 'start_time')
+        indexes = [
+            models.Index(fields=['is_next_event', 'start_date', 'start_time']),
+            models.Index(fields=['hobby', 'start_date']),
+            GinIndex(fields=['category_ids']),
+        ]
+
+    def __str__(self):
+        return f'{self.hobby_name} {self.start_date}'
+
+
+class Promotion(FileTrackingMixin, TimestampedModel):
     """
     Promotion is an offer to users from service providers,
     for example -30% discount on sneakers.
@@ -342,27 +510,159 @@ class Promotion(TimestampedModel):
     used_count = models.PositiveIntegerField(default=0)
     location = models.ForeignKey(Location, on_delete=models.CASCADE)
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL)
+    # When greater than zero, redemptions are counted in this many PromotionCounterShard rows
+    # and used_count is only updated by sync_counter_shards()
+    counter_shard_count = models.PositiveSmallIntegerField(default=0)
 
     objects = PromotionQuerySet.as_manager()
 
+    tracked_file_fields = ('cover_image',)
+
     def __str__(self):
         return self.name
 
+    def is_used_up(self):
+        if self.counter_shard_count:
+            # used_count lags behind the shards until the next sync
+            return not self.counter_shards.filter(used_count__lt=models.F('available_count')).exists()
+        return self.used_count >= self.available_count
+
+    def redeem(self):
+        """ Use one of the available promotions. Returns False if all of them have been used.
+            The check and the increment are done in a single conditional UPDATE, so concurrent
+            redemptions can never exceed available_count.
+        """
+        if self.counter_shard_count:
+            return self._redeem_from_shard()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {self._meta.db_table} SET used_count = used_count + 1'
+                ' WHERE id = %s AND used_count < available_count RETURNING used_count',
+                [self.pk]
+            )
+            row = cursor.fetchone()
+        if row is None:
+            return False
+        self.used_count = row[0]
+        return True
+
+    def _redeem_from_shard(self):
+        """ Concurrent redemptions are spread over the shards at random. Shards locked by other
+            transactions are skipped first. When every shard with capacity left is locked, all of them
+            are locked in the order of their ids, so that shards used up while waiting are left out and
+            the redemption only fails when no shard has capacity left.
+        """
+        shard_table = PromotionCounterShard._meta.db_table
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {shard_table} SET used_count = used_count + 1 WHERE id = ('
+                f'  SELECT id FROM {shard_table} WHERE promotion_id = %s AND used_count < available_count'
+                '  ORDER BY random() LIMIT 1 FOR UPDATE SKIP LOCKED'
+                ') RETURNING id',
+                [self.pk]
+            )
+            if cursor.fetchone() is not None:
+                return True
+            cursor.execute(
+                f'SELECT id FROM {shard_table} WHERE promotion_id = %s AND used_count < available_count'
+                ' ORDER BY id FOR UPDATE',
+                [self.pk]
+            )
+            shard_ids = [row[0] for row in cursor.fetchall()]
+            if not shard_ids:
+                return False
+            cursor.execute(f'UPDATE {shard_table} SET used_count = used_count + 1 WHERE id = %s', [shard_ids[0]])
+        return True
+
+    def enable_counter_shards(self, shard_count):
+        """ Split the available and used counts of the promotion evenly over shard_count counters.
+            Use shard_count 0 to go back to a single counter. Call again after changing available_count.
+        """
+        with transaction.atomic():
+            self.sync_counter_shards()
+            promotion = Promotion.objects.select_for_update().get(pk=self.pk)
+            PromotionCounterShard.objects.filter(promotion=promotion).delete()
+            shards = []
+            remaining_used_count = promotion.used_count
+            for shard in range(shard_count):
+                available_count = promotion.available_count // shard_count
+                if shard < promotion.available_count % shard_count:
+                    available_count += 1
+                used_count = min(available_count, remaining_used_count)
+                remaining_used_count -= used_count
+                shards.append(PromotionCounterShard(
+                    promotion=promotion, shard=shard, available_count=available_count, used_count=used_count))
+            PromotionCounterShard.objects.bulk_create(shards)
+            Promotion.objects.filter(pk=self.pk).update(counter_shard_count=shard_count)
+            self.counter_shard_count = shard_count
+            self.used_count = promotion.used_count
+
+    def sync_counter_shards(self):
+        """ Update used_count from the counter shards """
+        if not self.counter_shard_count:
+            return
+        Promotion.objects.filter(pk=self.pk).update(used_count=models.Subquery(
+            PromotionCounterShard.objects
+            .filter(promotion=models.OuterRef('pk'))
+            .values('promotion')
+            .annotate(total=models.Sum('used_count'))
+            .values('total')
+        ))
+        self.refresh_from_db(fields=['used_count'])
+
+
+class PromotionCounterShard(models.Model):
+    """ One part of the redemption counter of a high traffic Promotion.
+        Redemptions are spread over several rows to avoid contention on the promotion row.
+    """
+    promotion = models.ForeignKey(Promotion, on_delete=models.CASCADE, related_name='counter_shards')
+    shard = models.PositiveSmallIntegerField()
+    available_count = models.PositiveIntegerField()
+    used_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('promotion', 'shard')
+
+    def __str__(self):
+        return f'{self.promotion} #{self.shard}'
+
+
+class PromotionUsageStatistic(models.Model):
+    """ Number of benefits created from a promotion on a day, rolled up from Benefit
+        by the update_promotion_statistics command.
+    """
+    promotion = models.ForeignKey(Promotion, on_delete=models.CASCADE, related_name='usage_statistics')
+    date = models.DateField()
+    used_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ('date',)
+        unique_together = ('promotion', 'date')
+
+    def __str__(self):
+        return f'{self.promotion} {self.date}: {self.used_count}'
+
 
 class Benefit(TimestampedModel):
     """
     Benefit represents a single use of a Promotion, and serves as a log entry.
+    On PostgreSQL 11 and later the table is partitioned monthly by created_at,
+    see harrastuspassi.partitioning.
     """
     promotion = models.ForeignKey(Promotion, on_delete=models.CASCADE)
 
     def clean(self):
-        promotion = Promotion.objects.get(pk=self.promotion.pk)
-        if promotion.used_count >= promotion.available_count:
+        # Quick check with the promotion already at hand, redeem() makes the final decision
+        if self.promotion.is_used_up():
             raise ValidationError('All available promotions have been used')
 
     def save(self, *args, **kwargs):
-        Promotion.objects.filter(pk=self.promotion.pk).update(used_count=F('used_count') + 1)
-        super().save(*args, **kwargs)
+        if not self._state.adding:
+            return super().save(*args, **kwargs)
+        with transaction.atomic():
+            if not self.promotion.redeem():
+                raise ValidationError('All available promotions have been used')
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return str(self.created_at)
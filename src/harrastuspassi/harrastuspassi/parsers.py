@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+import datetime
+import struct
+from decimal import Decimal
+
+import msgpack
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+from harrastuspassi.renderers import EXT_DATE, EXT_DECIMAL, EXT_POINT, EXT_TIME
+
+
+def ext_hook(code, data):
+    """ Decodes the extension types of MessagePackRenderer """
+    if code == EXT_DECIMAL:
+        return Decimal(data.decode('utf-8'))
+    if code == EXT_DATE:
+        return datetime.date(*struct.unpack('>HBB', data))
+    if code == EXT_TIME:
+        if len(data) == 3:
+            return datetime.time(*struct.unpack('>BBB', data))
+        return datetime.time(*struct.unpack('>BBBI', data))
+    if code == EXT_POINT:
+        return {'type': 'Point', 'coordinates': list(struct.unpack('>dd', data))}
+    return msgpack.ExtType(code, data)
+
+
+class MessagePackParser(BaseParser):
+    """ Parses the MessagePack format of MessagePackRenderer """
+    media_type = 'application/msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), ext_hook=ext_hook, timestamp=3, raw=False)
+        except (ValueError, TypeError, ArithmeticError, struct.error, msgpack.UnpackException) as exc:
+            raise ParseError(f'MessagePack parse error - {exc}')
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+""" Monthly range partitions for the Benefit table.
+
+    On PostgreSQL 11 and later migration 0030 turns the Benefit table into a table partitioned
+    by created_at. Partitions for the coming months are created by the create_benefit_partitions
+    management command. Rows outside the existing partitions end up in a default partition,
+    and are moved into the monthly partition when it is created.
+"""
+import datetime
+from typing import List
+
+from django.db import connection, transaction
+
+from harrastuspassi.models import Benefit
+
+
+def is_partitioned(cursor, table: str) -> bool:
+    cursor.execute(
+        'SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)',
+        [table]
+    )
+    return cursor.fetchone() is not None
+
+
+def get_month_start(date: datetime.date) -> datetime.date:
+    return date.replace(day=1)
+
+
+def get_next_month_start(month: datetime.date) -> datetime.date:
+    return (month.replace(day=1) + datetime.timedelta(days=32)).replace(day=1)
+
+
+def get_partition_name(table: str, month: datetime.date) -> str:
+    return f'{table}_y{month.year}m{month.month:02d}'
+
+
+def get_partition_bounds(month: datetime.date) -> str:
+    # Partition bounds have to be literals on PostgreSQL 11, the dates are generated here so this is safe
+    return (
+        f"FROM ('{month:%Y-%m-%d} 00:00:00+00') "
+        f"TO ('{get_next_month_start(month):%Y-%m-%d} 00:00:00+00')"
+    )
+
+
+def create_monthly_partition(cursor, table: str, month: datetime.date) -> bool:
+    """ Create the partition for the month unless it exists already. Returns True if it was created. """
+    month = get_month_start(month)
+    partition_name = get_partition_name(table, month)
+    cursor.execute('SELECT to_regclass(%s)', [partition_name])
+    if cursor.fetchone()[0] is not None:
+        return False
+    next_month = get_next_month_start(month)
+    cursor.execute(f'CREATE TABLE {partition_name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+    # A partition can not be attached while the default partition contains rows belonging to it
+    cursor.execute(
+        f'WITH moved AS ('
+        f'  DELETE FROM {table}_default WHERE created_at >= %s AND created_at < %s RETURNING *'
+        f') INSERT INTO {partition_name} SELECT * FROM moved',
+        [month, next_month]
+    )
+    cursor.execute(f'ALTER TABLE {table} ATTACH PARTITION {partition_name} FOR VALUES {get_partition_bounds(month)}')
+    return True
+
+
+def ensure_benefit_partitions(months_ahead: int = 3) -> List[str]:
+    """ Create the Benefit partitions for the current month and the given number of months ahead.
+        Returns the names of the created partitions.
+    """
+    table = Benefit._meta.db_table
+    created_partitions = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        if connection.vendor != 'postgresql' or not is_partitioned(cursor, table):
+            return created_partitions
+        month = get_month_start(datetime.datetime.utcnow().date())
+        for _ in range(months_ahead + 1):
+            if create_monthly_partition(cursor, table, month):
+                created_partitions.append(get_partition_name(table, month))
+            month = get_next_month_start(month)
+    return created_partitions
@@ -1,7 +1,9 @@
 
-from django.db.models.signals import m2m_changed, post_save
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.dispatch import receiver
-from harrastuspassi.models import Hobby, Municipality, Promotion, Location, Organizer
+from harrastuspassi.images import schedule_derivatives
+from harrastuspassi.listings import schedule_refresh
+from harrastuspassi.models import Hobby, HobbyCategory, HobbyEvent, Municipality, Promotion, Location, Organizer
 from harrastuspassi import tasks
 
 
@@ -25,6 +27,15 @@ def organizer_post_save(sender, instance, **kwargs):
     tasks.update_organizer_permissions(instance.pk)
 
 
+@receiver(post_save, sender=Hobby)
+@receiver(post_save, sender=HobbyCategory)
+@receiver(post_save, sender=Promotion)
+def cover_image_post_save(sender, instance, **kwargs):
+    for _field_name, _loaded_file_name, file_name in instance.get_changed_files():
+        if file_name:
+            schedule_derivatives(file_name)
+
+
 @receiver(m2m_changed, sender=Municipality.moderators.through)
 def municipality_moderators_change(sender, instance, action, reverse, pk_set, **kwargs):
     if action == 'post_add' or action == 'post_remove':
@@ -36,3 +47,43 @@ def municipality_moderators_change(sender, instance, action, reverse, pk_set, **
         tasks.update_user_promotion_permissions(user_ids)
         tasks.update_user_location_permissions(user_ids)
         tasks.update_user_organizer_permissions(user_ids)
+
+
+@receiver(post_save, sender=Hobby)
+def hobby_listing_post_save(sender, instance, **kwargs):
+    schedule_refresh([instance.pk])
+
+
+@receiver(post_save, sender=HobbyEvent)
+@receiver(post_delete, sender=HobbyEvent)
+def hobby_event_listing_change(sender, instance, **kwargs):
+    schedule_refresh([instance.hobby_id])
+
+
+@receiver(m2m_changed, sender=Hobby.categories.through)
+def hobby_categories_listing_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse and action in ('post_add', 'post_remove', 'post_clear'):
+        schedule_refresh([instance.pk])
+    elif reverse and action in ('post_add', 'post_remove'):
+        schedule_refresh(pk_set)
+    elif reverse and action == 'pre_clear':
+        schedule_refresh(instance.hobbies.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Location)
+@receiver(post_save, sender=Organizer)
+@receiver(post_save, sender=Municipality)
+def related_object_listing_post_save(sender, instance, created, **kwargs):
+    if created:
+        return
+    field_name = sender._meta.model_name
+    schedule_refresh(Hobby.objects.filter(**{field_name: instance}).values_list('id', flat=True))
+
+
+@receiver(post_save, sender=HobbyCategory)
+def hobby_category_listing_post_save(sender, instance, **kwargs):
+    # Hobbies without a cover image of their own use the category image
+    if not instance.get_changed_files():
+        return
+    categories = instance.get_descendants(include_self=True)
+    schedule_refresh(Hobby.objects.filter(categories__in=categories).values_list('id', flat=True).distinct())
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+import datetime
+import struct
+from decimal import Decimal
+
+import msgpack
+import orjson
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework_gis.fields import GeoJsonDict
+
+# MessagePack extension types, see MessagePackRenderer
+EXT_DECIMAL = 1
+EXT_DATE = 2
+EXT_TIME = 3
+EXT_POINT = 4
+
+
+class FastJSONRenderer(JSONRenderer):
+    """ JSONRenderer using orjson for compact responses, which are most of the API responses.
+        Indented responses, like the ones in the browsable API, are rendered by JSONRenderer.
+
+        Values orjson does not serialize natively, such as Decimal and lazy translations,
+        are converted like in JSONRenderer.
+    """
+    default = JSONEncoder().default
+    # Dates and times not yet converted are formatted by JSONEncoder too
+    options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        renderer_context = renderer_context or {}
+        indent = self.get_indent(accepted_media_type, renderer_context)
+        if indent or self.ensure_ascii or not self.compact or not self.strict:
+            return super().render(data, accepted_media_type, renderer_context)
+        ret = orjson.dumps(data, default=self.default, option=self.options)
+        # Escape the line and paragraph separators for JavaScript, as JSONRenderer does
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class MessagePackRenderer(BaseRenderer):
+    """ Renders MessagePack, which is smaller and faster to parse than JSON.
+
+        Serializers return native values instead of strings for this renderer, see
+        NativeValuesMixin. Values without a MessagePack type are encoded as extension types:
+            1 Decimal   the decimal as an UTF-8 string, for example 12.50
+            2 date      year as an unsigned 16 bit integer, month and day as unsigned bytes
+            3 time      hour, minute and second as unsigned bytes, followed by microseconds as
+                        an unsigned 32 bit integer if there are any
+            4 point     GeoJSON points as longitude and latitude doubles
+        All integers are big-endian. Datetimes are encoded as the MessagePack timestamp type.
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+    native_values = True
+    json_default = JSONEncoder().default
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        # Strict types, so that GeoJSON and the OrderedDicts of DRF are passed to default
+        return msgpack.packb(data, default=self.default, strict_types=True, datetime=True)
+
+    def default(self, obj):
+        if isinstance(obj, GeoJsonDict) and obj.get('type') == 'Point':
+            return msgpack.ExtType(EXT_POINT, struct.pack('>dd', *obj['coordinates']))
+        if isinstance(obj, dict):
+            return dict(obj)
+        if isinstance(obj, (list, tuple)):
+            return list(obj)
+        if isinstance(obj, str):
+            return str(obj)
+        if isinstance(obj, bool):
+            return bool(obj)
+        if isinstance(obj, int):
+            return int(obj)
+        if isinstance(obj, float):
+            return float(obj)
+        if isinstance(obj, Decimal):
+            return msgpack.ExtType(EXT_DECIMAL, str(obj).encode('utf-8'))
+        if isinstance(obj, datetime.datetime):
+            return msgpack.Timestamp.from_datetime(obj)
+        if isinstance(obj, datetime.date):
+            return msgpack.ExtType(EXT_DATE, struct.pack('>HBB', obj.year, obj.month, obj.day))
+        if isinstance(obj, datetime.time):
+            if obj.microsecond:
+                data = struct.pack('>BBBI', obj.hour, obj.minute, obj.second, obj.microsecond)
+            else:
+                data = struct.pack('>BBB', obj.hour, obj.minute, obj.second)
+            return msgpack.ExtType(EXT_TIME, data)
+        return self.json_default(obj)
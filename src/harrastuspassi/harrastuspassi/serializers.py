@@ -1,61 +1,195 @@
-from drf_extra_fields.fields import Base64ImageField
-from rest_framework import serializers
+import copy
+import threading
+from collections import OrderedDict
+from typing import FrozenSet, NamedTuple, Optional
 
+from django.core.exceptions import ValidationError as DjangoValidationError
+from drf_extra_fields.fields import Base64ImageField
+from PIL import Image
+from rest_framework import permissions, serializers
+from rest_framework.settings import api_settings
+from rest_framework_gis.fields import GeometryField
+
+from harrastuspassi import settings
+from harrastuspassi.images import UPLOAD_EXTENSIONS, get_derivative_urls
+from harrastuspassi.listings import CategoryCoverImages
 from harrastuspassi.models import (
     Benefit,
     Hobby,
     HobbyCategory,
     HobbyEvent,
+    HobbyEventListing,
     Location,
     Municipality,
     Organizer,
     Promotion,
+    PromotionUsageStatistic,
 )
 
 
-class ExtraDataMixin():
-    """ Mixin for serializers that provides conditionally included extra fields """
-    INCLUDE_PARAMETER_NAME = 'include'
+LANGUAGES = ('fi', 'en', 'sv')
+# Maximum number of compiled field sets kept by ExtraDataMixin
+COMPILED_FIELDS_MAX_SIZE = 256
+
+
+class LRUCache:
+    """ Keeps the max_size most recently used values, shared by the threads """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._values = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._values)
+
+    def get(self, key):
+        with self._lock:
+            value = self._values.get(key)
+            if value is not None:
+                self._values.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._values[key] = value
+            self._values.move_to_end(key)
+            while len(self._values) > self.max_size:
+                self._values.popitem(last=False)
+
+
+def get_language(context):
+    """ Language requested with the lang parameter, or None for the active language """
+    request = context.get('request')
+    language = request.GET.get('lang') if request else None
+    return language if language in LANGUAGES else None
+
+
+def set_native_values(fields):
+    """ Return dates, times and decimals as such for renderers which encode them natively """
+    for field in fields.values():
+        if isinstance(field, (serializers.DateField, serializers.TimeField, serializers.DateTimeField)):
+            field.format = None
+        elif isinstance(field, serializers.DecimalField):
+            field.coerce_to_string = False
+
+
+class SparseFieldset(NamedTuple):
+    """ Fields requested with the fields and omit parameters, both take comma separated field names """
+    fields: Optional[FrozenSet[str]] = None
+    omit: FrozenSet[str] = frozenset()
+
+    FIELDS_PARAMETER_NAME = 'fields'
+    OMIT_PARAMETER_NAME = 'omit'
+
+    @classmethod
+    def from_request(cls, request):
+        # Writes are validated and returned with all fields
+        if request is None or request.method not in permissions.SAFE_METHODS:
+            return cls()
+
+        def get_names(parameter_name):
+            values = request.GET.getlist(parameter_name)
+            return frozenset(name.strip() for value in values for name in value.split(',') if name.strip())
+        fields = get_names(cls.FIELDS_PARAMETER_NAME)
+        return cls(fields=fields or None, omit=get_names(cls.OMIT_PARAMETER_NAME))
+
+    def restrict(self, names) -> 'SparseFieldset':
+        """ The fieldset without the names which are not in names, unknown names select nothing anyway """
+        names = frozenset(names)
+        return SparseFieldset(fields=None if self.fields is None else self.fields & names, omit=self.omit & names)
+
+    def includes(self, name: str) -> bool:
+        return (self.fields is None or name in self.fields) and name not in self.omit
+
+    def includes_any(self, *names: str) -> bool:
+        return any(self.includes(name) for name in names)
+
+
+class NativeValuesMixin:
+    """ Mixin for serializers returning dates, times and decimals as Python objects instead of strings
+        for renderers with native_values set. Nested serializers see the renderer of the root serializer,
+        so every serializer of a response needs this for the format not to depend on the nesting.
+    """
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
+    def get_fields(self):
+        fields = self.get_base_fields()
+        request = self.context.get('request')
+        if getattr(getattr(request, 'accepted_renderer', None), 'native_values', False):
+            set_native_values(fields)
+        return fields
+
+    def get_base_fields(self):
+        """ Fields of the serializer, which are modified for the renderer and must not be shared """
+        return super().get_fields()
 
-        if 'context' in kwargs and 'request' in kwargs['context']:
-            request = kwargs['context']['request']
-            includes = request.GET.getlist(self.INCLUDE_PARAMETER_NAME)
-            self.fields.update(self.get_extra_fields(includes, context=kwargs['context']))
+
+class ExtraDataMixin(NativeValuesMixin):
+    """ Mixin for serializers that provides conditionally included extra fields, and sparse
+        fieldsets for the serialized objects of the response, see SparseFieldset.
+        The fields are compiled once per serializer class, includes, fieldset, API version and
+        language, and the most recently used ones are kept. Serializer instances get copies of them.
+    """
+    INCLUDE_PARAMETER_NAME = 'include'
+    # Values of the include parameter handled by get_extra_fields
+    INCLUDES = frozenset()
+    # The parameters are free-form, so only known includes and field names are used as the keys
+    _compiled_fields = LRUCache(COMPILED_FIELDS_MAX_SIZE)
+
+    def get_base_fields(self):
+        # Nested serializers see the context of the root serializer
+        request = self.context.get('request')
+        if request is None:
+            return super().get_base_fields()
+        includes = frozenset(request.GET.getlist(self.INCLUDE_PARAMETER_NAME)) & self.INCLUDES
+        key = (type(self), includes, getattr(request, 'version', None), get_language(self.context))
+        all_fields = self._compiled_fields.get(key)
+        if all_fields is None:
+            all_fields = super().get_base_fields()
+            all_fields.update(self.get_extra_fields(includes, context=self.context))
+            self._compiled_fields.set(key, all_fields)
+        fields = all_fields
+        # The fieldset applies to the objects of the response, not to nested objects
+        if self.is_response_object():
+            fieldset = SparseFieldset.from_request(request).restrict(all_fields)
+            if fieldset != SparseFieldset():
+                fieldset_key = (key, fieldset)
+                fields = self._compiled_fields.get(fieldset_key)
+                if fields is None:
+                    fields = {name: field for name, field in all_fields.items() if fieldset.includes(name)}
+                    self._compiled_fields.set(fieldset_key, fields)
+        return copy.deepcopy(fields)
+
+    def is_response_object(self):
+        """ True for the root serializer and the child of a root list serializer """
+        parent = self.parent
+        return parent is None or (isinstance(parent, serializers.ListSerializer) and parent.parent is None)
 
     def get_extra_fields(self, includes, context):
         """ Return a dictionary of extra serializer fields.
-        includes is a list of requested extra data.
+        includes is a list of requested extra data. Nested serializers get the context
+        from the root serializer and must not be given one, because the fields are reused.
         Example:
             fields = {}
             if 'user' in includes:
-                fields['user'] = UserSerializer(read_only=True, context=context)
+                fields['user'] = UserSerializer(read_only=True)
             return fields
         """
         return {}
 
 
 class HobbyCategorySerializer(ExtraDataMixin, serializers.ModelSerializer):
-    name = serializers.SerializerMethodField()
+    name = serializers.CharField(read_only=True)
 
-    def get_name(self, obj):
-        request = self.context['request']
-        language = request.query_params.get('lang', None)
-        if language:
-            if language == 'fi':
-                return obj.name_fi
-            elif language == 'en':
-                return obj.name_en
-            elif language == 'sv':
-                return obj.name_sv
-        return obj.name
+    INCLUDES = frozenset(['child_categories'])
 
     def get_extra_fields(self, includes, context):
         fields = super().get_extra_fields(includes, context)
+        language = get_language(context)
+        if language:
+            fields['name'] = serializers.CharField(source=f'name_{language}', read_only=True)
         if 'child_categories' in includes:
-            fields['child_categories'] = HobbyCategoryTreeSerializer(many=True, source='get_children', context=context)
+            fields['child_categories'] = HobbyCategoryTreeSerializer(many=True, source='get_children')
         return fields
 
     class Meta:
@@ -63,7 +197,7 @@ class HobbyCategorySerializer(ExtraDataMixin, serializers.ModelSerializer):
         fields = ['id', 'name', 'name_fi', 'name_en', 'name_sv', 'tree_id', 'level', 'parent']
 
 
-class HobbyCategoryTreeSerializer(serializers.ModelSerializer):
+class HobbyCategoryTreeSerializer(NativeValuesMixin, serializers.ModelSerializer):
     """ Serializer for an arbitrarily deep tree of categories """
     def get_fields(self):
         fields = super().get_fields()
@@ -75,7 +209,7 @@ class HobbyCategoryTreeSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'name_fi', 'name_en', 'name_sv', 'tree_id', 'level', 'parent']
 
 
-class LocationSerializerPre1(serializers.ModelSerializer):
+class LocationSerializerPre1(NativeValuesMixin, serializers.ModelSerializer):
     lat = serializers.SerializerMethodField
     lon = serializers.SerializerMethodField
 
@@ -90,54 +224,114 @@ class LocationSerializerPre1(serializers.ModelSerializer):
         fields = ['id', 'name', 'address', 'zip_code', 'city', 'lat', 'lon']
 
 
-class LocationSerializer(serializers.ModelSerializer):
+class LocationSerializer(NativeValuesMixin, serializers.ModelSerializer):
 
     class Meta:
         model = Location
-        fields = ['id', 'name', 'address', 'zip_code', 'city', 'coordinates']
+        fields = ['id', 'name', 'address', 'zip_code', 'city', 'coordinates', 'geocoding_status']
+        read_only_fields = ['geocoding_status']
 
 
-class OrganizerSerializer(serializers.ModelSerializer):
+class OrganizerSerializer(NativeValuesMixin, serializers.ModelSerializer):
     class Meta:
         model = Organizer
         fields = ['id', 'name']
 
 
-class MunicipalitySerializer(serializers.ModelSerializer):
+class MunicipalitySerializer(NativeValuesMixin, serializers.ModelSerializer):
 
     class Meta:
         model = Municipality
         fields = ['id', 'name']
 
 
+def get_category_cover_images(context):
+    """ Cover images of all categories, loaded once per serializer context """
+    if 'category_cover_images' not in context:
+        context['category_cover_images'] = CategoryCoverImages()
+    return context['category_cover_images']
+
+
+def get_hobby_cover_image(hobby, context):
+    """ Cover image of the hobby, falling back to the closest category with a cover image """
+    if hobby.cover_image:
+        return hobby.cover_image
+    # Both the image and the srcset fields need the fallback, look it up only once
+    if not hasattr(hobby, '_fallback_cover_image'):
+        # Categories are prefetched by the views, see api.get_hobby_queryset_plan
+        category_cover_images = get_category_cover_images(context)
+        hobby._fallback_cover_image = category_cover_images.get_cover_image(hobby.categories.all())
+    return hobby._fallback_cover_image
+
+
+class ImageSrcsetField(serializers.Field):
+    """ Urls of the resized versions of an image grouped by format and width """
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        derivative_urls = get_derivative_urls(value)
+        request = self.context.get('request', None)
+        if derivative_urls is None or request is None:
+            return derivative_urls
+        return {
+            image_format: {width: request.build_absolute_uri(url) for width, url in urls.items()}
+            for image_format, urls in derivative_urls.items()
+        }
+
+
+class CoverImageUploadSerializer(serializers.Serializer):
+    """ Multipart upload of a cover image. Only the header of the image is read for validation,
+        the image data is decoded when the resized versions are generated.
+    """
+    cover_image = serializers.FileField()
+
+    def validate_cover_image(self, value):
+        if value.size > settings.IMAGE_UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(f'Image can be at most {settings.IMAGE_UPLOAD_MAX_SIZE} bytes')
+        try:
+            # Image.open() reads the format and the dimensions without loading the image data
+            image = Image.open(value)
+        except (IOError, Image.DecompressionBombError):
+            raise serializers.ValidationError('Upload a valid image')
+        if image.format not in UPLOAD_EXTENSIONS:
+            raise serializers.ValidationError(f'Image format has to be one of {", ".join(UPLOAD_EXTENSIONS)}')
+        width, height = image.size
+        if width * height > settings.IMAGE_UPLOAD_MAX_PIXELS:
+            raise serializers.ValidationError(f'Image can have at most {settings.IMAGE_UPLOAD_MAX_PIXELS} pixels')
+        # Like django.forms.ImageField
+        value.image = image
+        return value
+
+
 class HobbyCoverImageField(Base64ImageField):
 
     def get_attribute(self, instance):
-        cover_image = None
-        if instance.cover_image:
-            cover_image = instance.cover_image
-        else:
-            related_categories = instance.categories.all().get_ancestors(include_self=True)
-            related_categories_with_image = related_categories.exclude(cover_image='').filter(cover_image__isnull=False)
-            if related_categories_with_image.exists():
-                # get_ancestors() by default returns ancestors by descending order
-                # (root ancestor first, immediate parent last)
-                cover_image = related_categories_with_image.last().cover_image
-        
-        return cover_image
+        return get_hobby_cover_image(instance, self.context)
+
+
+class HobbyCoverImageSrcsetField(ImageSrcsetField):
+
+    def get_attribute(self, instance):
+        return get_hobby_cover_image(instance, self.context)
 
 
 class HobbySerializer(ExtraDataMixin, serializers.ModelSerializer):
     permissions = serializers.SerializerMethodField()
     cover_image = HobbyCoverImageField(required=False, allow_null=True)
+    cover_image_srcset = HobbyCoverImageSrcsetField()
     municipality = MunicipalitySerializer(read_only=True)
 
+    INCLUDES = frozenset(['location_detail', 'organizer_detail'])
+
     def get_extra_fields(self, includes, context):
         fields = super().get_extra_fields(includes, context)
         if 'location_detail' in includes:
-            fields['location'] = LocationSerializer(read_only=True, context=context)
+            fields['location'] = LocationSerializer(read_only=True)
         if 'organizer_detail' in includes:
-            fields['organizer'] = OrganizerSerializer(read_only=True, context=context)
+            fields['organizer'] = OrganizerSerializer(read_only=True)
         return fields
 
     def get_permissions(self, instance):
@@ -154,6 +348,7 @@ class HobbySerializer(ExtraDataMixin, serializers.ModelSerializer):
         fields = [
             'categories',
             'cover_image',
+            'cover_image_srcset',
             'description',
             'id',
             'location',
@@ -182,7 +377,8 @@ class HobbySerializerPre1(HobbySerializer):
     category = serializers.SerializerMethodField()
 
     def get_category(self, instance):
-        category = instance.categories.first()
+        # all() instead of first() to use the prefetched categories
+        category = next(iter(instance.categories.all()), None)
         if category:
             return category.pk
         else:
@@ -238,14 +434,16 @@ class HobbyEventSerializer(ExtraDataMixin, serializers.ModelSerializer):
     is_recurrent = serializers.BooleanField(default=False, required=False, write_only=True)
     recurrency_count = serializers.IntegerField(default=0, min_value=0, max_value=50, required=False, write_only=True)
 
+    INCLUDES = frozenset(['hobby_detail'])
+
     def get_extra_fields(self, includes, context):
         fields = super().get_extra_fields(includes, context)
         if 'hobby_detail' in includes:
-            fields['hobby'] = HobbyNestedSerializer(context=context)
+            fields['hobby'] = HobbyNestedSerializer()
         # TODO: DEPRECATE VERSION pre1
         request = context.get('request')
         if 'hobby_detail' in includes and request and request.version == 'pre1':
-            fields['hobby'] = HobbyNestedSerializerPre1(context=context)
+            fields['hobby'] = HobbyNestedSerializerPre1()
         return fields
 
     def create(self, validated_data):
@@ -274,15 +472,104 @@ class HobbyEventSerializer(ExtraDataMixin, serializers.ModelSerializer):
         read_only_fields = ('start_weekday',)
 
 
+class ListingRelatedSerializer(NativeValuesMixin, serializers.Serializer):
+    """ Nested data of a related object from the denormalized fields of a HobbyEventListing """
+    id_field = None
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('source', '*')
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, instance):
+        if getattr(instance, self.id_field) is None:
+            return None
+        return super().to_representation(instance)
+
+
+class ListingLocationSerializer(ListingRelatedSerializer):
+    id_field = 'location_id'
+    id = serializers.IntegerField(source='location_id')
+    name = serializers.CharField(source='location_name')
+    address = serializers.CharField(source='location_address')
+    zip_code = serializers.CharField(source='location_zip_code')
+    city = serializers.CharField(source='location_city')
+    coordinates = GeometryField()
+    geocoding_status = serializers.CharField(source='location_geocoding_status')
+
+
+class ListingOrganizerSerializer(ListingRelatedSerializer):
+    id_field = 'organizer_id'
+    id = serializers.IntegerField(source='organizer_id')
+    name = serializers.CharField(source='organizer_name')
+
+
+class ListingMunicipalitySerializer(ListingRelatedSerializer):
+    id_field = 'municipality_id'
+    id = serializers.IntegerField(source='municipality_id')
+    name = serializers.CharField(source='municipality_name')
+
+
+class ListingHobbySerializer(ListingRelatedSerializer):
+    """ Same data as HobbyNestedSerializer """
+    id_field = 'hobby_id'
+    categories = serializers.ListField(child=serializers.IntegerField(), source='category_ids')
+    cover_image = serializers.ImageField()
+    cover_image_srcset = ImageSrcsetField(source='cover_image')
+    description = serializers.CharField(source='hobby_description')
+    id = serializers.IntegerField(source='hobby_id')
+    location = ListingLocationSerializer()
+    name = serializers.CharField(source='hobby_name')
+    organizer = ListingOrganizerSerializer()
+    permissions = serializers.SerializerMethodField()
+    price_type = serializers.CharField()
+    price_amount = serializers.DecimalField(max_digits=5, decimal_places=2)
+    municipality = ListingMunicipalitySerializer()
+
+    def get_permissions(self, instance):
+        # Permissions are not prefetched for the hobby event list
+        return {}
+
+
+class HobbyEventListingSerializer(ExtraDataMixin, serializers.ModelSerializer):
+    """ Same data as HobbyEventSerializer from the denormalized HobbyEventListing table """
+    id = serializers.IntegerField(source='event_id')
+    hobby = serializers.IntegerField(source='hobby_id')
+
+    INCLUDES = frozenset(['hobby_detail'])
+
+    def get_extra_fields(self, includes, context):
+        fields = super().get_extra_fields(includes, context)
+        if 'hobby_detail' in includes:
+            fields['hobby'] = ListingHobbySerializer()
+        return fields
+
+    class Meta:
+        model = HobbyEventListing
+        fields = (
+            'end_date',
+            'end_time',
+            'hobby',
+            'id',
+            'start_date',
+            'start_time',
+            'start_weekday',
+            'data_source',
+        )
+
+
 class PromotionSerializer(ExtraDataMixin, serializers.ModelSerializer):
     cover_image = Base64ImageField(required=False, allow_null=True)
+    cover_image_srcset = ImageSrcsetField(source='cover_image')
+
+    INCLUDES = frozenset(['location_detail', 'organizer_detail'])
 
     def get_extra_fields(self, includes, context):
         fields = super().get_extra_fields(includes, context)
         if 'location_detail' in includes:
-            fields['location'] = LocationSerializer(read_only=True, context=context)
+            fields['location'] = LocationSerializer(read_only=True)
         if 'organizer_detail' in includes:
-            fields['organizer'] = OrganizerSerializer(read_only=True, context=context)
+            fields['organizer'] = OrganizerSerializer(read_only=True)
         return fields
 
     def get_permissions(self, instance):
@@ -295,18 +582,47 @@ class PromotionSerializer(ExtraDataMixin, serializers.ModelSerializer):
 
     class Meta:
         model = Promotion
-        fields = '__all__'
+        exclude = ('counter_shard_count',)
 
 
-class BenefitSerializer(serializers.ModelSerializer):
+class PromotionUsageStatisticSerializer(NativeValuesMixin, serializers.ModelSerializer):
+
+    class Meta:
+        model = PromotionUsageStatistic
+        fields = ['date', 'used_count']
+
+
+class PromotionStatisticsSerializer(NativeValuesMixin, serializers.ModelSerializer):
+    """ Usage of a promotion with daily statistics, expects the statistics in the context """
+    daily = serializers.SerializerMethodField()
+
+    def get_daily(self, obj):
+        return PromotionUsageStatisticSerializer(self.context['statistics'], many=True, context=self.context).data
+
+    class Meta:
+        model = Promotion
+        fields = ['id', 'available_count', 'used_count', 'daily']
+
+
+class PromotionStatisticsQuerySerializer(serializers.Serializer):
+    start_date = serializers.DateField(required=False)
+    end_date = serializers.DateField(required=False)
+
+
+class BenefitSerializer(NativeValuesMixin, serializers.ModelSerializer):
 
     def validate(self, data):
-        promotion = data['promotion']
-        promotion = Promotion.objects.get(pk=promotion.pk)
-        if promotion.used_count >= promotion.available_count:
+        # The promotion has just been fetched by the related field, redeem() makes the final decision
+        if data['promotion'].is_used_up():
             raise serializers.ValidationError('All available promotions have been used')
         return data
 
+    def create(self, validated_data):
+        try:
+            return super().create(validated_data)
+        except DjangoValidationError as e:
+            raise serializers.ValidationError({api_settings.NON_FIELD_ERRORS_KEY: e.messages})
+
     class Meta:
         model = Benefit
         fields = '__all__'
@@ -24,3 +24,99 @@ LINKEDEVENTS_URL = getattr(settings, 'HARRASTUSPASSI_LINKEDEVENTS_URL',
                            'https://api.hel.fi/linkedevents/v1/event/?start=now&keyword=yso:p11617,yso:p16486&keyword!=yso:p4354,yso:p13050,yso:p16485,yso:p20513')
 
 TIME_ZONE = getattr(settings, 'TIME_ZONE', 'Europe/Helsinki')
+
+#  Imported cover images are downloaded concurrently using a pool of this many connections
+IMAGE_FETCH_WORKERS = getattr(settings, 'HARRASTUSPASSI_IMAGE_FETCH_WORKERS', 8)
+IMAGE_FETCH_TIMEOUT = getattr(settings, 'HARRASTUSPASSI_IMAGE_FETCH_TIMEOUT', 15)
+
+#  Resized versions of cover images are generated in these widths (pixels) and formats.
+#  WebP is skipped if Pillow has been built without WebP support.
+IMAGE_DERIVATIVE_WIDTHS = getattr(settings, 'HARRASTUSPASSI_IMAGE_DERIVATIVE_WIDTHS', (300, 600, 1200))
+IMAGE_DERIVATIVE_FORMATS = getattr(settings, 'HARRASTUSPASSI_IMAGE_DERIVATIVE_FORMATS', ('webp', 'jpeg'))
+IMAGE_DERIVATIVE_QUALITY = getattr(settings, 'HARRASTUSPASSI_IMAGE_DERIVATIVE_QUALITY', 80)
+#  Each process reads the names of the images with resized versions from the database every
+#  IMAGE_DERIVATIVE_INDEX_INTERVAL seconds. Srcset fields of images without them are null.
+IMAGE_DERIVATIVE_INDEX_INTERVAL = getattr(settings, 'HARRASTUSPASSI_IMAGE_DERIVATIVE_INDEX_INTERVAL', 30)
+#  Generate the resized versions of saved images with the generate_image_derivatives command instead of right
+#  after saving. Srcset fields are null until the versions have been generated. Failed images are retried at most
+#  IMAGE_DERIVATIVE_MAX_ATTEMPTS times, waiting twice as long after each failed attempt.
+IMAGE_DERIVATIVES_DEFERRED = getattr(settings, 'HARRASTUSPASSI_IMAGE_DERIVATIVES_DEFERRED', False)
+IMAGE_DERIVATIVE_MAX_ATTEMPTS = getattr(settings, 'HARRASTUSPASSI_IMAGE_DERIVATIVE_MAX_ATTEMPTS', 3)
+IMAGE_DERIVATIVE_RETRY_DELAY_SECONDS = getattr(settings, 'HARRASTUSPASSI_IMAGE_DERIVATIVE_RETRY_DELAY_SECONDS', 60)
+#  Images uploaded to the cover-image endpoints may be at most this many bytes and pixels
+IMAGE_UPLOAD_MAX_SIZE = getattr(settings, 'HARRASTUSPASSI_IMAGE_UPLOAD_MAX_SIZE', 20 * 1024 * 1024)
+IMAGE_UPLOAD_MAX_PIXELS = getattr(settings, 'HARRASTUSPASSI_IMAGE_UPLOAD_MAX_PIXELS', 50 * 1000 * 1000)
+
+#  Dotted path to the geocoding provider class, see harrastuspassi.geocoding.GeocodingProvider
+GEOCODING_PROVIDER = getattr(settings, 'HARRASTUSPASSI_GEOCODING_PROVIDER',
+                             'harrastuspassi.geocoding.GoogleGeocodingProvider')
+#  Geocoding results are cached for this many days, failed lookups for a shorter time
+GEOCODING_CACHE_TTL_DAYS = getattr(settings, 'HARRASTUSPASSI_GEOCODING_CACHE_TTL_DAYS', 90)
+GEOCODING_NEGATIVE_CACHE_TTL_DAYS = getattr(settings, 'HARRASTUSPASSI_GEOCODING_NEGATIVE_CACHE_TTL_DAYS', 1)
+#  Batch geocoding uses this many concurrent requests, limited to this many requests per second
+GEOCODING_WORKERS = getattr(settings, 'HARRASTUSPASSI_GEOCODING_WORKERS', 4)
+GEOCODING_RATE_LIMIT = getattr(settings, 'HARRASTUSPASSI_GEOCODING_RATE_LIMIT', 10)
+#  Pending locations are geocoded at most this many times, waiting twice as long after each failed attempt
+GEOCODING_MAX_ATTEMPTS = getattr(settings, 'HARRASTUSPASSI_GEOCODING_MAX_ATTEMPTS', 5)
+GEOCODING_RETRY_DELAY_SECONDS = getattr(settings, 'HARRASTUSPASSI_GEOCODING_RETRY_DELAY_SECONDS', 60)
+
+#  Fraction of requests to profile with harrastuspassi.middleware.ProfilingMiddleware, 0 disables profiling.
+#  Timings of profiled requests are logged and returned in the Server-Timing header.
+PROFILING_SAMPLE_RATE = getattr(settings, 'HARRASTUSPASSI_PROFILING_SAMPLE_RATE', 0)
+PROFILING_SERVER_TIMING = getattr(settings, 'HARRASTUSPASSI_PROFILING_SERVER_TIMING', True)
+
+#  /monitor/metrics is served to requests with the header Authorization: Bearer METRICS_TOKEN, and to requests from
+#  the addresses or networks in METRICS_ALLOWED_IPS. Behind a proxy REMOTE_ADDR is the proxy, use the token instead.
+METRICS_TOKEN = getattr(settings, 'HARRASTUSPASSI_METRICS_TOKEN', None)
+METRICS_ALLOWED_IPS = tuple(getattr(settings, 'HARRASTUSPASSI_METRICS_ALLOWED_IPS', ('127.0.0.1', '::1')))
+
+#  Aliases in DATABASES of PostgreSQL read replicas, see harrastuspassi.db_router. Replicas lagging more than
+#  DATABASE_REPLICA_MAX_LAG seconds are not used, the lag is checked every DATABASE_REPLICA_LAG_CHECK_INTERVAL seconds.
+#  Clients which have written through the API are read from the default database for DATABASE_STICKY_PRIMARY_SECONDS,
+#  which should be longer than the maximum lag.
+DATABASE_REPLICAS = tuple(getattr(settings, 'HARRASTUSPASSI_DATABASE_REPLICAS', ()))
+DATABASE_REPLICA_MAX_LAG = getattr(settings, 'HARRASTUSPASSI_DATABASE_REPLICA_MAX_LAG', 5)
+DATABASE_REPLICA_LAG_CHECK_INTERVAL = getattr(settings, 'HARRASTUSPASSI_DATABASE_REPLICA_LAG_CHECK_INTERVAL', 5)
+DATABASE_STICKY_PRIMARY_SECONDS = getattr(settings, 'HARRASTUSPASSI_DATABASE_STICKY_PRIMARY_SECONDS', 30)
+
+#  Each process using the harrastuspassi.db.backends.postgis_pool database backend keeps at most DATABASE_POOL_MAX_SIZE
+#  connections per database, and waits at most DATABASE_POOL_TIMEOUT seconds for one to be free. Connections idle for
+#  DATABASE_POOL_HEALTH_CHECK_AFTER seconds are checked before reuse, connections older than DATABASE_POOL_MAX_LIFETIME
+#  seconds are replaced.
+DATABASE_POOL_MAX_SIZE = getattr(settings, 'HARRASTUSPASSI_DATABASE_POOL_MAX_SIZE', 10)
+DATABASE_POOL_TIMEOUT = getattr(settings, 'HARRASTUSPASSI_DATABASE_POOL_TIMEOUT', 10)
+DATABASE_POOL_HEALTH_CHECK_AFTER = getattr(settings, 'HARRASTUSPASSI_DATABASE_POOL_HEALTH_CHECK_AFTER', 30)
+DATABASE_POOL_MAX_LIFETIME = getattr(settings, 'HARRASTUSPASSI_DATABASE_POOL_MAX_LIFETIME', 60 * 60)
+
+#  Database queries of API requests are cancelled after STATEMENT_TIMEOUT seconds, or the timeout of the view in
+#  STATEMENT_TIMEOUTS by names like 'HobbyEventViewSet.list' or 'HobbyEventViewSet', see api.StatementTimeoutMixin.
+#  None disables the timeout. Requests with a cancelled query return 503 with Retry-After STATEMENT_TIMEOUT_RETRY_AFTER.
+STATEMENT_TIMEOUT = getattr(settings, 'HARRASTUSPASSI_STATEMENT_TIMEOUT', 30)
+STATEMENT_TIMEOUTS = getattr(settings, 'HARRASTUSPASSI_STATEMENT_TIMEOUTS', {})
+STATEMENT_TIMEOUT_RETRY_AFTER = getattr(settings, 'HARRASTUSPASSI_STATEMENT_TIMEOUT_RETRY_AFTER', 5)
+
+#  Serve the hobby event list from the denormalized HobbyEventListing table and keep the table up to date.
+#  Run the refresh_hobby_event_listings command once after enabling.
+HOBBY_EVENT_LISTING_ENABLED = getattr(settings, 'HARRASTUSPASSI_HOBBY_EVENT_LISTING_ENABLED', False)
+
+#  Responses are compressed with brotli or gzip by harrastuspassi.middleware.CompressionMiddleware when they are
+#  at least COMPRESSION_MIN_SIZE bytes. Compressed responses of anonymous GET requests up to COMPRESSION_CACHE_MAX_SIZE
+#  bytes are cached for COMPRESSION_CACHE_TIMEOUT seconds by their content, so identical responses are compressed once.
+COMPRESSION_MIN_SIZE = getattr(settings, 'HARRASTUSPASSI_COMPRESSION_MIN_SIZE', 200)
+COMPRESSION_BROTLI_QUALITY = getattr(settings, 'HARRASTUSPASSI_COMPRESSION_BROTLI_QUALITY', 5)
+COMPRESSION_CACHE_MAX_SIZE = getattr(settings, 'HARRASTUSPASSI_COMPRESSION_CACHE_MAX_SIZE', 1024 * 1024)
+COMPRESSION_CACHE_TIMEOUT = getattr(settings, 'HARRASTUSPASSI_COMPRESSION_CACHE_TIMEOUT', 600)
+
+#  Serve MEDIA_URL with harrastuspassi.views.media.serve_media: django sends the files itself, x-accel-redirect
+#  (nginx) and x-sendfile (Apache, lighttpd) let the web server send them. None serves media only when DEBUG is on.
+#  With x-accel-redirect, MEDIA_ACCEL_REDIRECT_LOCATION is the internal nginx location aliased to MEDIA_ROOT.
+MEDIA_SERVING = getattr(settings, 'HARRASTUSPASSI_MEDIA_SERVING', None)
+MEDIA_ACCEL_REDIRECT_LOCATION = getattr(settings, 'HARRASTUSPASSI_MEDIA_ACCEL_REDIRECT_LOCATION', '/protected-media/')
+#  Browser cache lifetime in seconds of media files which are not content-addressed
+MEDIA_CACHE_MAX_AGE = getattr(settings, 'HARRASTUSPASSI_MEDIA_CACHE_MAX_AGE', 60 * 60)
+
+#  Uploads to harrastuspassi.storage.MediaStorage larger than S3_MULTIPART_THRESHOLD bytes are split into parts of
+#  S3_MULTIPART_CHUNK_SIZE bytes, which are uploaded using S3_UPLOAD_CONCURRENCY threads
+S3_MULTIPART_THRESHOLD = getattr(settings, 'HARRASTUSPASSI_S3_MULTIPART_THRESHOLD', 8 * 1024 * 1024)
+S3_MULTIPART_CHUNK_SIZE = getattr(settings, 'HARRASTUSPASSI_S3_MULTIPART_CHUNK_SIZE', 8 * 1024 * 1024)
+S3_UPLOAD_CONCURRENCY = getattr(settings, 'HARRASTUSPASSI_S3_UPLOAD_CONCURRENCY', 4)
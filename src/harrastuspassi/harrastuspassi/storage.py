@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+""" Storage for media files in an S3-compatible object storage, so that API nodes do not need a shared
+    MEDIA_ROOT. Enable with DEFAULT_FILE_STORAGE = 'harrastuspassi.storage.MediaStorage' and configure
+    the bucket with the AWS_* settings of django-storages, see the README.
+"""
+import os
+
+from boto3.s3.transfer import TransferConfig
+from storages.backends.s3boto3 import S3Boto3Storage
+from storages.utils import setting
+
+from harrastuspassi import settings
+from harrastuspassi.images import IMMUTABLE_MAX_AGE, is_content_addressed
+
+
+class MediaStorage(S3Boto3Storage):
+    """ Files are uploaded in parts in parallel once they are larger than HARRASTUSPASSI_S3_MULTIPART_THRESHOLD.
+        Content-addressed files are stored with an immutable Cache-Control header for CDNs and browsers.
+    """
+
+    def __init__(self, **settings_overrides):
+        super().__init__(**settings_overrides)
+        self.transfer_config = TransferConfig(
+            multipart_threshold=settings.S3_MULTIPART_THRESHOLD,
+            multipart_chunksize=settings.S3_MULTIPART_CHUNK_SIZE,
+            max_concurrency=settings.S3_UPLOAD_CONCURRENCY,
+        )
+
+    def get_default_settings(self):
+        default_settings = super().get_default_settings()
+        # Uploaded files with the same name must not replace each other, like with the file system storage
+        default_settings['file_overwrite'] = setting('AWS_S3_FILE_OVERWRITE', False)
+        return default_settings
+
+    def get_object_parameters(self, name):
+        parameters = super().get_object_parameters(name)
+        if is_content_addressed(name):
+            parameters.setdefault('CacheControl', f'public, max-age={IMMUTABLE_MAX_AGE}, immutable')
+        else:
+            parameters.setdefault('CacheControl', f'public, max-age={settings.MEDIA_CACHE_MAX_AGE}')
+        return parameters
+
+    def _save(self, name, content):
+        cleaned_name = self._clean_name(name)
+        name = self._normalize_name(cleaned_name)
+        parameters = self._get_write_parameters(name, content)
+        # Like S3Boto3Storage._save, only the upload differs
+        if (self.gzip and
+                parameters['ContentType'] in self.gzip_content_types and
+                'ContentEncoding' not in parameters):
+            content = self._compress_content(content)
+            parameters['ContentEncoding'] = 'gzip'
+        content.seek(0, os.SEEK_SET)
+        # The connection is per thread and its client is thread-safe, unlike the shared bucket resource.
+        # ImageFetcher stores images from several threads.
+        self.connection.meta.client.upload_fileobj(
+            content, self.bucket_name, name, ExtraArgs=parameters, Config=self.transfer_config)
+        return cleaned_name
@@ -1,9 +1,23 @@
 
+from datetime import datetime, time, timedelta
+
 from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
 from guardian.shortcuts import get_objects_for_user, get_users_with_perms, assign_perm, remove_perm
-from harrastuspassi.models import Hobby, Promotion, Location, Organizer
+from harrastuspassi import settings
+from harrastuspassi.geocoding import format_address, geocode_addresses
+from harrastuspassi.images import ensure_derivatives, queue_derivatives
+from harrastuspassi.listings import schedule_refresh
+from harrastuspassi.metrics import time_permission_sync
+from harrastuspassi.models import (
+    Benefit, Hobby, HobbyCategory, ImageDerivativeJob, Promotion, PromotionUsageStatistic, Location, Organizer
+)
 
 
+@time_permission_sync
 def update_hobby_permissions(hobby_id):
     hobby = Hobby.objects.get(pk=hobby_id)
 
@@ -33,6 +47,7 @@ def update_hobby_permissions(hobby_id):
     assign_perm('change_hobby', users_to_assign_perm, hobby)
 
 
+@time_permission_sync
 def update_user_hobby_permissions(user_ids):
     users = get_user_model().objects.filter(id__in=user_ids)
 
@@ -57,6 +72,7 @@ def update_user_hobby_permissions(user_ids):
         assign_perm('change_hobby', user, hobbies_to_assign_perm)
 
 
+@time_permission_sync
 def update_promotion_permissions(promotion_id):
     promotion = Promotion.objects.get(pk=promotion_id)
 
@@ -86,6 +102,7 @@ def update_promotion_permissions(promotion_id):
     assign_perm('change_promotion', users_to_assign_perm, promotion)
 
 
+@time_permission_sync
 def update_user_promotion_permissions(user_ids):
     users = get_user_model().objects.filter(id__in=user_ids)
 
@@ -110,6 +127,7 @@ def update_user_promotion_permissions(user_ids):
         assign_perm('change_promotion', user, promotions_to_assign_perm)
 
 
+@time_permission_sync
 def update_location_permissions(location_id):
     location = Location.objects.get(pk=location_id)
 
@@ -139,6 +157,7 @@ def update_location_permissions(location_id):
     assign_perm('change_location', users_to_assign_perm, location)
 
 
+@time_permission_sync
 def update_user_location_permissions(user_ids):
     users = get_user_model().objects.filter(id__in=user_ids)
 
@@ -163,6 +182,7 @@ def update_user_location_permissions(user_ids):
         assign_perm('change_location', user, locations_to_assign_perm)
 
 
+@time_permission_sync
 def update_organizer_permissions(organizer_id):
     organizer = Organizer.objects.get(pk=organizer_id)
 
@@ -192,6 +212,7 @@ def update_organizer_permissions(organizer_id):
     assign_perm('change_organizer', users_to_assign_perm, organizer)
 
 
+@time_permission_sync
 def update_user_organizer_permissions(user_ids):
     users = get_user_model().objects.filter(id__in=user_ids)
 
@@ -214,3 +235,113 @@ def update_user_organizer_permissions(user_ids):
 
         remove_perm('change_organizer', user, organizers_to_remove_perm)
         assign_perm('change_organizer', user, organizers_to_assign_perm)
+
+
+def geocode_pending_locations(limit=None):
+    """ Geocode locations waiting for coordinates. Locations whose address does not exist fail
+        at once, failed lookups are retried with exponential backoff until GEOCODING_MAX_ATTEMPTS
+        is reached. Returns the number of locations handled.
+    """
+    now = timezone.now()
+    locations = (
+        Location.objects
+        .filter(geocoding_status=Location.GEOCODING_PENDING, geocoding_next_attempt_at__lte=now)
+        .order_by('geocoding_next_attempt_at')
+        .only('id', 'address', 'zip_code', 'city', 'geocoding_attempts')
+    )
+    if limit:
+        locations = locations[:limit]
+    locations = list(locations)
+    if not locations:
+        return 0
+    formatted_addresses = {
+        location.pk: format_address(location.address, location.zip_code, location.city) for location in locations
+    }
+    coordinates_by_address = geocode_addresses(formatted_addresses.values())
+
+    for location in locations:
+        address = formatted_addresses[location.pk]
+        coordinates = coordinates_by_address.get(address)
+        attempts = location.geocoding_attempts + 1
+        if coordinates is not None:
+            changes = {'coordinates': coordinates, 'geocoding_status': Location.GEOCODING_DONE,
+                       'geocoding_next_attempt_at': None}
+        elif address in coordinates_by_address or attempts >= settings.GEOCODING_MAX_ATTEMPTS:
+            # Retrying an address which does not exist would only hit the negative cache
+            changes = {'geocoding_status': Location.GEOCODING_FAILED, 'geocoding_next_attempt_at': None}
+        else:
+            retry_delay = settings.GEOCODING_RETRY_DELAY_SECONDS * 2 ** (attempts - 1)
+            changes = {'geocoding_next_attempt_at': now + timedelta(seconds=retry_delay)}
+        # Only update locations which are still pending with the same address, coordinates
+        # may have been given or the address changed by the user in the meantime
+        Location.objects.filter(
+            pk=location.pk,
+            geocoding_status=Location.GEOCODING_PENDING,
+            address=location.address,
+            zip_code=location.zip_code,
+            city=location.city,
+        ).update(geocoding_attempts=attempts, updated_at=now, **changes)
+    schedule_refresh(Hobby.objects.filter(location__in=locations).values_list('id', flat=True))
+    return len(locations)
+
+
+def generate_pending_image_derivatives(limit=None):
+    """ Generate the resized versions of images queued by images.schedule_derivatives and
+        queue_missing_image_derivatives. Failed images are retried with exponential backoff until
+        IMAGE_DERIVATIVE_MAX_ATTEMPTS is reached. Returns the number of images handled.
+    """
+    now = timezone.now()
+    jobs = ImageDerivativeJob.objects.filter(next_attempt_at__lte=now).order_by('next_attempt_at')
+    if limit:
+        jobs = jobs[:limit]
+    jobs = list(jobs)
+    for job in jobs:
+        if ensure_derivatives(job.image_name):
+            continue
+        job.attempts += 1
+        if job.attempts >= settings.IMAGE_DERIVATIVE_MAX_ATTEMPTS:
+            job.next_attempt_at = None
+        else:
+            retry_delay = settings.IMAGE_DERIVATIVE_RETRY_DELAY_SECONDS * 2 ** (job.attempts - 1)
+            job.next_attempt_at = now + timedelta(seconds=retry_delay)
+        job.save(update_fields=['attempts', 'next_attempt_at', 'updated_at'])
+    return len(jobs)
+
+
+def queue_missing_image_derivatives():
+    """ Queue the cover images without resized versions in the current widths and formats,
+        like the ones saved before the versions were generated. Returns the number of images queued.
+    """
+    image_names = set()
+    for model in (Hobby, HobbyCategory, Promotion):
+        image_names.update(model.objects.exclude(cover_image='').exclude(cover_image__isnull=True)
+                           .values_list('cover_image', flat=True).distinct())
+    return queue_derivatives(image_names)
+
+
+def update_promotion_statistics(days=None):
+    """ Recalculate the daily usage statistics of promotions for the given number of most recent days,
+        or for all days. Days are in the local time zone. Returns the number of statistics rows.
+    """
+    benefits = Benefit.objects.all()
+    statistics = PromotionUsageStatistic.objects.all()
+    if days:
+        since = timezone.localdate() - timedelta(days=days - 1)
+        # Filtering by created_at instead of the truncated date lets PostgreSQL skip old partitions
+        since_datetime = timezone.make_aware(datetime.combine(since, time()))
+        benefits = benefits.filter(created_at__gte=since_datetime)
+        statistics = statistics.filter(date__gte=since)
+    rows = (
+        benefits
+        .annotate(date=TruncDate('created_at'))
+        .values('promotion_id', 'date')
+        .annotate(used_count=Count('id'))
+        .order_by()
+    )
+    with transaction.atomic():
+        statistics.delete()
+        created = PromotionUsageStatistic.objects.bulk_create(
+            PromotionUsageStatistic(promotion_id=row['promotion_id'], date=row['date'], used_count=row['used_count'])
+            for row in rows.iterator()
+        )
+    return len(created)
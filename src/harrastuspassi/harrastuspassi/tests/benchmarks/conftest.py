@@ -0,0 +1,290 @@
+""" Benchmarks measuring the query count, latency and memory use of the API endpoints.
+
+    The benchmarks are skipped unless HARRASTUSPASSI_BENCHMARK is set, because seeding the
+    database takes a while. Run them on their own, other tests flushing the database would
+    remove the seeded data:
+
+        HARRASTUSPASSI_BENCHMARK=1 pytest harrastuspassi/tests/benchmarks
+
+    Environment variables:
+        HARRASTUSPASSI_BENCHMARK_SCALE      fraction of the full data volume to seed, default 1.0
+                                            (100k hobbies, 1M events, a 5-level category tree)
+        HARRASTUSPASSI_BENCHMARK_ROUNDS     timed requests per benchmark, default 10
+        HARRASTUSPASSI_BENCHMARK_TOLERANCE  allowed relative regression of latency and memory, default 0.2
+        HARRASTUSPASSI_BENCHMARK_BASELINE   baseline file, default baseline.json next to this file
+        HARRASTUSPASSI_BENCHMARK_UPDATE     write the results of this run as the new baseline
+
+    Query counts must never exceed the baseline. Benchmarks missing from the baseline fail
+    unless HARRASTUSPASSI_BENCHMARK_UPDATE is set.
+"""
+import datetime
+import json
+import os
+import random
+import statistics
+import time
+import tracemalloc
+from io import StringIO
+from pathlib import Path
+from typing import NamedTuple
+
+import pytest
+from django.contrib.gis.geos import Point
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from harrastuspassi.models import (
+    Hobby,
+    HobbyCategory,
+    HobbyEvent,
+    Location,
+    Municipality,
+    Organizer,
+    Promotion,
+)
+
+BENCHMARK_ENABLED = bool(os.environ.get('HARRASTUSPASSI_BENCHMARK'))
+SCALE = float(os.environ.get('HARRASTUSPASSI_BENCHMARK_SCALE', 1.0))
+ROUNDS = int(os.environ.get('HARRASTUSPASSI_BENCHMARK_ROUNDS', 10))
+TOLERANCE = float(os.environ.get('HARRASTUSPASSI_BENCHMARK_TOLERANCE', 0.2))
+BASELINE_PATH = Path(os.environ.get('HARRASTUSPASSI_BENCHMARK_BASELINE', Path(__file__).parent / 'baseline.json'))
+UPDATE_BASELINE = bool(os.environ.get('HARRASTUSPASSI_BENCHMARK_UPDATE'))
+
+DATA_SOURCE = 'benchmark'
+HOBBY_COUNT = max(1, int(100000 * SCALE))
+EVENTS_PER_HOBBY = 10
+ORGANIZER_COUNT = max(1, HOBBY_COUNT // 100)
+LOCATION_COUNT = max(1, HOBBY_COUNT // 20)
+PROMOTION_COUNT = max(1, HOBBY_COUNT // 100)
+CATEGORY_ROOT_COUNT = 8
+CATEGORY_CHILD_COUNT = 3
+CATEGORY_LEVELS = 5
+BATCH_SIZE = 5000
+
+
+def pytest_collection_modifyitems(config, items):
+    if BENCHMARK_ENABLED:
+        return
+    skip_benchmark = pytest.mark.skip(reason='HARRASTUSPASSI_BENCHMARK not set')
+    benchmark_dir = Path(__file__).parent
+    for item in items:
+        if benchmark_dir in Path(str(item.fspath)).parents:
+            item.add_marker(skip_benchmark)
+
+
+class BenchmarkData(NamedTuple):
+    municipality: Municipality
+    small_municipality: Municipality
+    hobby: Hobby
+    promotion: Promotion
+    root_category: HobbyCategory
+    leaf_category: HobbyCategory
+    point: Point
+
+
+def random_point(rng):
+    # Somewhere in southern Finland
+    return Point(rng.uniform(21.0, 30.0), rng.uniform(60.0, 63.0))
+
+
+def create_category_tree():
+    """ Bulk create a category tree with precalculated MPTT fields, one level at a time """
+    categories_by_level = [[] for _ in range(CATEGORY_LEVELS)]
+    next_tree_id = (HobbyCategory.objects.order_by('-tree_id').values_list('tree_id', flat=True).first() or 0) + 1
+
+    def add_node(name, parent, tree_id, level, lft):
+        category = HobbyCategory(name=name, parent=parent, tree_id=tree_id, level=level, lft=lft,
+                                 data_source=DATA_SOURCE)
+        categories_by_level[level].append(category)
+        rght = lft + 1
+        if level < CATEGORY_LEVELS - 1:
+            for child_number in range(CATEGORY_CHILD_COUNT):
+                rght = add_node(f'{name}.{child_number}', category, tree_id, level + 1, rght) + 1
+        category.rght = rght
+        return rght
+
+    for root_number in range(CATEGORY_ROOT_COUNT):
+        add_node(f'Category {root_number}', None, next_tree_id + root_number, 0, 1)
+    for categories in categories_by_level:
+        for category in categories:
+            # parents got their ids when the previous level was created
+            category.parent_id = category.parent.pk if category.parent else None
+        HobbyCategory.objects.bulk_create(categories, batch_size=BATCH_SIZE)
+    return categories_by_level
+
+
+def seed(rng):
+    municipality = Municipality.objects.create(name='Benchmark municipality')
+    small_municipality = Municipality.objects.create(name='Small benchmark municipality')
+    organizers = Organizer.objects.bulk_create(
+        [Organizer(name=f'Organizer {i}', data_source=DATA_SOURCE) for i in range(ORGANIZER_COUNT)],
+        batch_size=BATCH_SIZE)
+    locations = Location.objects.bulk_create(
+        [
+            Location(name=f'Location {i}', address=f'Katu {i}', zip_code='00100', city='Helsinki',
+                     coordinates=random_point(rng), data_source=DATA_SOURCE)
+            for i in range(LOCATION_COUNT)
+        ],
+        batch_size=BATCH_SIZE)
+    leaf_categories = create_category_tree()[-1]
+
+    category_through = Hobby.categories.through
+    today = datetime.date.today()
+    for batch_start in range(0, HOBBY_COUNT, BATCH_SIZE):
+        hobbies = Hobby.objects.bulk_create([
+            Hobby(
+                name=f'Hobby {i}',
+                description='Lorem ipsum dolor sit amet ' * 10,
+                location=rng.choice(locations),
+                organizer=rng.choice(organizers),
+                # One percent of the hobbies belong to the small municipality
+                municipality=small_municipality if i % 100 == 0 else municipality,
+                data_source=DATA_SOURCE,
+                origin_id=str(i),
+            )
+            for i in range(batch_start, min(batch_start + BATCH_SIZE, HOBBY_COUNT))
+        ])
+        category_through.objects.bulk_create([
+            category_through(hobby_id=hobby.pk, hobbycategory_id=category.pk)
+            for hobby in hobbies
+            for category in rng.sample(leaf_categories, 2)
+        ])
+        events = []
+        for hobby in hobbies:
+            first_date = today + datetime.timedelta(days=rng.randint(-30, 30))
+            for week in range(EVENTS_PER_HOBBY):
+                start_date = first_date + datetime.timedelta(weeks=week)
+                events.append(HobbyEvent(
+                    hobby=hobby, start_date=start_date, end_date=start_date, start_weekday=start_date.isoweekday(),
+                    start_time=datetime.time(17, 0), end_time=datetime.time(18, 30), data_source=DATA_SOURCE))
+        HobbyEvent.objects.bulk_create(events, batch_size=BATCH_SIZE)
+
+    Promotion.objects.bulk_create([
+        Promotion(
+            name=f'Promotion {i}', description='Lorem ipsum', start_date=today, start_time=datetime.time(0, 0),
+            end_date=today + datetime.timedelta(days=365), end_time=datetime.time(0, 0),
+            organizer=rng.choice(organizers), location=rng.choice(locations), municipality=municipality,
+            available_count=100)
+        for i in range(PROMOTION_COUNT)
+    ], batch_size=BATCH_SIZE)
+    call_command('update_hobby_next_event', stdout=StringIO())
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+@pytest.fixture(scope='session')
+def benchmark_data(django_db_setup, django_db_blocker):
+    """ Seeded once per session and kept when the test database is reused """
+    with django_db_blocker.unblock():
+        if not Hobby.objects.filter(data_source=DATA_SOURCE).exists():
+            seed(random.Random(0))
+        root_category = HobbyCategory.objects.filter(data_source=DATA_SOURCE, level=0).order_by('id').first()
+        return BenchmarkData(
+            municipality=Municipality.objects.get(name='Benchmark municipality'),
+            small_municipality=Municipality.objects.get(name='Small benchmark municipality'),
+            hobby=Hobby.objects.filter(data_source=DATA_SOURCE).order_by('id').first(),
+            promotion=Promotion.objects.order_by('id').first(),
+            root_category=root_category,
+            leaf_category=root_category.get_descendants().filter(level=CATEGORY_LEVELS - 1).first(),
+            point=Point(24.94, 60.17),
+        )
+
+
+class BenchmarkResult(NamedTuple):
+    queries: int
+    p50: float
+    p95: float
+    peak_memory: int
+
+    def as_dict(self):
+        return self._asdict()
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def measure(request_function, rounds=ROUNDS):
+    """ Run request_function once untimed to warm up caches, then once with query capturing,
+        once with memory tracing and the given number of rounds timed.
+    """
+    request_function()
+    with CaptureQueriesContext(connection) as captured_queries:
+        request_function()
+    tracemalloc.start()
+    try:
+        request_function()
+        _current, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    durations = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        request_function()
+        durations.append(time.perf_counter() - start)
+    return BenchmarkResult(
+        queries=len(captured_queries),
+        p50=statistics.median(durations),
+        p95=percentile(durations, 0.95),
+        peak_memory=peak_memory,
+    )
+
+
+def find_regressions(result, baseline):
+    regressions = []
+    if result.queries > baseline['queries']:
+        regressions.append(f'queries {result.queries} > {baseline["queries"]}')
+    for metric in ('p95', 'peak_memory'):
+        value, baseline_value = getattr(result, metric), baseline[metric]
+        if value > baseline_value * (1 + TOLERANCE):
+            regressions.append(f'{metric} {value:.4g} > {baseline_value:.4g} (+{TOLERANCE:.0%})')
+    return regressions
+
+
+class BenchmarkRecorder:
+
+    def __init__(self, baseline_path):
+        self.baseline_path = baseline_path
+        self.baseline = json.loads(baseline_path.read_text()) if baseline_path.exists() else {}
+        self.results = {}
+
+    def record(self, name, result):
+        """ Store the result and fail on regressions against the baseline """
+        self.results[name] = result.as_dict()
+        if UPDATE_BASELINE:
+            return
+        if name not in self.baseline:
+            pytest.fail(f'{name} has no baseline in {self.baseline_path},'
+                        ' record one with HARRASTUSPASSI_BENCHMARK_UPDATE=1')
+        regressions = find_regressions(result, self.baseline[name])
+        if regressions:
+            pytest.fail(f'{name} regressed: ' + ', '.join(regressions))
+
+    def write_baseline(self):
+        baseline = dict(self.baseline)
+        baseline.update(self.results)
+        self.baseline_path.write_text(json.dumps(baseline, indent=2, sort_keys=True) + '\n')
+
+
+@pytest.fixture(scope='session')
+def benchmark_recorder(pytestconfig):
+    recorder = BenchmarkRecorder(BASELINE_PATH)
+    # Reported by pytest_terminal_summary
+    pytestconfig.benchmark_recorder = recorder
+    yield recorder
+    if UPDATE_BASELINE and recorder.results:
+        recorder.write_baseline()
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    recorder = getattr(config, 'benchmark_recorder', None)
+    if recorder is None or not recorder.results:
+        return
+    terminalreporter.write_sep('-', 'benchmark results')
+    for name, result in sorted(recorder.results.items()):
+        terminalreporter.write_line(
+            f'{name}: {result["queries"]} queries, p50 {result["p50"] * 1000:.1f} ms,'
+            f' p95 {result["p95"] * 1000:.1f} ms, peak memory {result["peak_memory"] / 1024:.0f} KiB'
+        )
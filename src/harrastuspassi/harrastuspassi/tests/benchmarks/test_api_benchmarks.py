@@ -0,0 +1,57 @@
+import pytest
+from django.urls import reverse
+
+from harrastuspassi.tests.benchmarks.conftest import measure
+
+# (benchmark name, url name, url kwargs, query parameters, authenticated)
+# The url kwargs and query parameters are formatted with the seeded BenchmarkData
+ENDPOINTS = [
+    ('hobby-list-v1', 'hobby-list', {'version': 'v1'}, {}, False),
+    ('hobby-list-v1-include', 'hobby-list', {'version': 'v1'},
+     {'include': ['location_detail', 'organizer_detail']}, False),
+    ('hobby-list-v1-nearest', 'hobby-list', {'version': 'v1'},
+     {'ordering': 'nearest', 'near_latitude': '{data.point.y}', 'near_longitude': '{data.point.x}'}, False),
+    ('hobby-list-v1-category', 'hobby-list', {'version': 'v1'}, {'category': '{data.root_category.pk}'}, False),
+    ('hobby-list-v1-authenticated', 'hobby-list', {'version': 'v1'}, {}, True),
+    ('hobby-list-pre1-category', 'hobby-list', {'version': 'pre1'}, {'category': '{data.leaf_category.pk}'}, False),
+    ('hobby-detail-pre2', 'hobby-detail', {'version': 'pre2', 'pk': '{data.hobby.pk}'}, {}, False),
+    ('hobbyevent-list-v1', 'hobbyevent-list', {'version': 'v1'}, {}, False),
+    ('hobbyevent-list-v1-include', 'hobbyevent-list', {'version': 'v1'}, {'include': 'hobby_detail'}, False),
+    ('hobbyevent-list-v1-hobby', 'hobbyevent-list', {'version': 'v1'}, {'hobby': '{data.hobby.pk}'}, False),
+    ('hobbycategory-list-pre2', 'hobbycategory-list', {'version': 'pre2'}, {}, False),
+    ('hobbycategory-list-pre2-tree', 'hobbycategory-list', {'version': 'pre2'},
+     {'include': 'child_categories', 'parent': 'null'}, False),
+    ('promotion-list-pre2', 'promotion-list', {'version': 'pre2'}, {}, False),
+    ('promotion-list-pre2-include', 'promotion-list', {'version': 'pre2'},
+     {'include': ['location_detail', 'organizer_detail']}, False),
+    ('promotion-statistics-pre2', 'promotion-statistics', {'version': 'pre2', 'pk': '{data.promotion.pk}'}, {}, False),
+    ('location-list-v1-authenticated', 'location-list', {'version': 'v1'}, {}, True),
+    ('organizer-list-v1-authenticated', 'organizer-list', {'version': 'v1'}, {}, True),
+]
+
+
+def format_value(value, data):
+    if isinstance(value, list):
+        return [format_value(item, data) for item in value]
+    return value.format(data=data) if isinstance(value, str) else value
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('name,url_name,url_kwargs,params,authenticated', ENDPOINTS, ids=[e[0] for e in ENDPOINTS])
+def test_api_endpoint(name, url_name, url_kwargs, params, authenticated, benchmark_data, benchmark_recorder,
+                      api_client, user, user_api_client):
+    if authenticated:
+        # Gives the user permissions to the hobbies of the small municipality
+        benchmark_data.small_municipality.moderators.add(user)
+        client = user_api_client
+    else:
+        client = api_client
+    url = reverse(url_name, kwargs={key: format_value(value, benchmark_data) for key, value in url_kwargs.items()})
+    params = {key: format_value(value, benchmark_data) for key, value in params.items()}
+
+    def request():
+        response = client.get(url, params)
+        assert response.status_code == 200, response.content[:500]
+        return response
+
+    benchmark_recorder.record(name, measure(request))
@@ -0,0 +1,30 @@
+import json
+
+import pytest
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+
+from harrastuspassi.renderers import FastJSONRenderer
+from harrastuspassi.tests.benchmarks.conftest import measure
+
+# (benchmark name, url name, query parameters), rendered with each renderer
+PAGES = [
+    ('hobby-list-v1', 'hobby-list', {'page_size': 500}),
+    ('hobbyevent-list-v1', 'hobbyevent-list', {'page_size': 500}),
+    ('hobbyevent-list-v1-include', 'hobbyevent-list', {'page_size': 500, 'include': 'hobby_detail'}),
+]
+RENDERERS = [('json', JSONRenderer), ('fastjson', FastJSONRenderer)]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('name,url_name,params', PAGES, ids=[page[0] for page in PAGES])
+@pytest.mark.parametrize('renderer_name,renderer_class', RENDERERS, ids=[renderer[0] for renderer in RENDERERS])
+def test_renderer(name, url_name, params, renderer_name, renderer_class, benchmark_data, benchmark_recorder,
+                  api_client):
+    response = api_client.get(reverse(url_name, kwargs={'version': 'v1'}), params)
+    assert response.status_code == 200
+    data = response.data
+    renderer = renderer_class()
+    assert json.loads(renderer.render(data)) == json.loads(JSONRenderer().render(data))
+
+    benchmark_recorder.record(f'render-{name}-{renderer_name}', measure(lambda: renderer.render(data)))
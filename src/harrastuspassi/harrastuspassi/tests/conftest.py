@@ -5,6 +5,8 @@ from django.contrib.auth import get_user_model
 from django.contrib.gis.geos import Point
 from rest_framework.test import APIClient
 
+from harrastuspassi import settings
+from harrastuspassi.geocoding import GeocodingError, GeocodingProvider
 from harrastuspassi.models import (
     Hobby,
     HobbyCategory,
@@ -19,6 +21,27 @@ FROZEN_DATE = '2022-02-22'
 FROZEN_DATETIME = '2022-02-22 16:00:00'
 
 
+class StubGeocodingProvider(GeocodingProvider):
+    """ Geocodes every address containing 'Sammonkatu', records the addresses it was asked for """
+    calls = []
+
+    def geocode(self, address):
+        self.calls.append(address)
+        if 'fail' in address:
+            raise GeocodingError()
+        if 'Sammonkatu' in address:
+            return Point(23.79, 61.49)
+        return None
+
+
+@pytest.fixture
+def geocoding_provider(monkeypatch):
+    monkeypatch.setattr(settings, 'GEOCODING_PROVIDER', 'harrastuspassi.tests.conftest.StubGeocodingProvider')
+    monkeypatch.setattr(settings, 'GEOCODING_RATE_LIMIT', 0)
+    StubGeocodingProvider.calls = []
+    return StubGeocodingProvider
+
+
 @pytest.fixture
 def api_client():
     return APIClient()
@@ -0,0 +1,115 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from django.core.exceptions import ValidationError
+from django.db import connections, transaction
+from django.db.models import F
+from harrastuspassi.models import Benefit, Promotion, PromotionCounterShard
+
+#  The number of redemptions can be raised to stress test a real database, for example
+#  HARRASTUSPASSI_REDEMPTION_COUNT=5000 pytest harrastuspassi/tests/test_benefit_redemption.py
+REDEMPTION_COUNT = int(os.environ.get('HARRASTUSPASSI_REDEMPTION_COUNT', 200))
+REDEMPTION_WORKERS = int(os.environ.get('HARRASTUSPASSI_REDEMPTION_WORKERS', 20))
+
+
+def redeem_concurrently(promotion_id, count):
+    """ Try to create count benefits from parallel database connections, returns the number of successes """
+    def redeem(_):
+        try:
+            Benefit.objects.create(promotion=Promotion.objects.get(pk=promotion_id))
+            return True
+        except ValidationError:
+            return False
+        finally:
+            connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=REDEMPTION_WORKERS) as executor:
+        return sum(executor.map(redeem, range(count)))
+
+
+@pytest.mark.django_db
+def test_redeem(promotion):
+    Promotion.objects.filter(pk=promotion.pk).update(available_count=2, used_count=1)
+    promotion.refresh_from_db()
+    assert promotion.redeem()
+    assert promotion.used_count == 2
+    assert not promotion.redeem()
+    promotion.refresh_from_db()
+    assert promotion.used_count == 2
+
+
+@pytest.mark.django_db
+def test_benefit_is_not_created_for_used_up_promotion(promotion):
+    Promotion.objects.filter(pk=promotion.pk).update(available_count=1, used_count=1)
+    with pytest.raises(ValidationError):
+        Benefit.objects.create(promotion=promotion)
+    assert not Benefit.objects.exists()
+
+
+@pytest.mark.django_db
+def test_enable_counter_shards(promotion):
+    Promotion.objects.filter(pk=promotion.pk).update(available_count=10, used_count=4)
+    promotion.refresh_from_db()
+    promotion.enable_counter_shards(3)
+    shards = PromotionCounterShard.objects.filter(promotion=promotion).order_by('shard')
+    assert [shard.available_count for shard in shards] == [4, 3, 3]
+    assert [shard.used_count for shard in shards] == [4, 0, 0]
+
+    for _ in range(6):
+        assert promotion.redeem()
+    assert not promotion.redeem()
+    assert promotion.is_used_up()
+    with pytest.raises(ValidationError):
+        Benefit.objects.create(promotion=promotion)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_redemptions_never_exceed_available_count(promotion):
+    available_count = REDEMPTION_COUNT * 3 // 4
+    Promotion.objects.filter(pk=promotion.pk).update(available_count=available_count, used_count=0)
+    assert redeem_concurrently(promotion.pk, REDEMPTION_COUNT) == available_count
+    promotion.refresh_from_db()
+    assert promotion.used_count == available_count
+    assert Benefit.objects.filter(promotion=promotion).count() == available_count
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_sharded_redemptions_never_exceed_available_count(promotion):
+    available_count = REDEMPTION_COUNT * 3 // 4
+    Promotion.objects.filter(pk=promotion.pk).update(available_count=available_count, used_count=0)
+    promotion.refresh_from_db()
+    promotion.enable_counter_shards(8)
+    assert redeem_concurrently(promotion.pk, REDEMPTION_COUNT) == available_count
+    promotion.sync_counter_shards()
+    assert promotion.used_count == available_count
+    assert Benefit.objects.filter(promotion=promotion).count() == available_count
+
+
+@pytest.mark.django_db(transaction=True)
+def test_sharded_redemption_waits_for_shard_with_capacity(promotion):
+    Promotion.objects.filter(pk=promotion.pk).update(available_count=6, used_count=0)
+    promotion.refresh_from_db()
+    promotion.enable_counter_shards(2)
+    nearly_used_up_shard, free_shard = PromotionCounterShard.objects.filter(promotion=promotion).order_by('id')
+    PromotionCounterShard.objects.filter(pk=nearly_used_up_shard.pk).update(used_count=F('available_count') - 1)
+
+    def redeem():
+        try:
+            return Promotion.objects.get(pk=promotion.pk).redeem()
+        finally:
+            connections.close_all()
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    with transaction.atomic():
+        # Other redemptions use up the nearly used up shard and hold the free shard
+        PromotionCounterShard.objects.filter(pk=nearly_used_up_shard.pk).update(used_count=F('used_count') + 1)
+        list(PromotionCounterShard.objects.select_for_update().filter(pk=free_shard.pk))
+        future = executor.submit(redeem)
+        # Let the redemption find every shard locked
+        time.sleep(0.5)
+    assert future.result(timeout=10)
+    executor.shutdown()
+    free_shard.refresh_from_db()
+    assert free_shard.used_count == 1
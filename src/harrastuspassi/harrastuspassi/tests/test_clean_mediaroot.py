@@ -0,0 +1,43 @@
+import os
+import pytest
+from django.core.management import call_command
+from harrastuspassi.images import get_derivative_name
+from harrastuspassi.models import Hobby
+
+
+@pytest.fixture
+def media_root(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+    return tmp_path
+
+
+def create_media_file(media_root, name):
+    path = media_root / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b'foo')
+    return path
+
+
+@pytest.mark.django_db
+def test_clean_mediaroot_removes_only_unreferenced_files(media_root, hobby):
+    Hobby.objects.filter(pk=hobby.pk).update(cover_image='hobby_images/referenced.jpg')
+    referenced = create_media_file(media_root, 'hobby_images/referenced.jpg')
+    derivative = create_media_file(media_root, get_derivative_name('hobby_images/referenced.jpg', 300, 'jpeg'))
+    unreferenced = create_media_file(media_root, 'hobby_images/unreferenced.jpg')
+    cached = create_media_file(media_root, 'cache/foo.jpg')
+
+    call_command('clean_mediaroot', '--dry-run')
+    assert os.path.exists(unreferenced)
+
+    call_command('clean_mediaroot', '--noinput')
+    assert os.path.exists(referenced)
+    assert os.path.exists(derivative)
+    assert os.path.exists(cached)
+    assert not os.path.exists(unreferenced)
+
+
+@pytest.mark.django_db
+def test_clean_mediaroot_older_than(media_root):
+    recent = create_media_file(media_root, 'hobby_images/recent.jpg')
+    call_command('clean_mediaroot', '--noinput', '--older-than', '1')
+    assert os.path.exists(recent)
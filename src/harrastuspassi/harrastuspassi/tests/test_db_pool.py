@@ -0,0 +1,104 @@
+import threading
+from contextlib import contextmanager
+
+import psycopg2
+import pytest
+from django.db import connection
+from psycopg2 import extensions
+from harrastuspassi.db.pool import ConnectionPool, PoolTimeout
+
+
+class FakeConnection:
+    """ Enough of a psycopg2 connection for the pool """
+
+    def __init__(self):
+        self.closed = 0
+        self.autocommit = True
+        self.transaction_status = extensions.TRANSACTION_STATUS_IDLE
+        self.is_broken = False
+
+    def get_transaction_status(self):
+        return self.transaction_status
+
+    def rollback(self):
+        self.transaction_status = extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+    @contextmanager
+    def cursor(self):
+        if self.is_broken:
+            raise psycopg2.OperationalError('server closed the connection unexpectedly')
+        yield FakeCursor()
+
+
+class FakeCursor:
+
+    def execute(self, sql):
+        pass
+
+
+def create_pool(**kwargs):
+    options = {'max_size': 2, 'timeout': 0.1, 'max_lifetime': 60, 'health_check_after': 0, **kwargs}
+    return ConnectionPool('default', 'harrastuspassi', **options)
+
+
+def test_pool_reuses_connections():
+    pool = create_pool()
+    first_connection = pool.acquire(FakeConnection)
+    first_connection.transaction_status = extensions.TRANSACTION_STATUS_INTRANS
+    pool.release(first_connection)
+    # Transactions left open are rolled back
+    assert first_connection.transaction_status == extensions.TRANSACTION_STATUS_IDLE
+    assert pool.acquire(FakeConnection) is first_connection
+
+
+def test_pool_size_is_bounded():
+    pool = create_pool(timeout=5)
+    connections = [pool.acquire(FakeConnection), pool.acquire(FakeConnection)]
+    waiting_thread_connections = []
+    waiting_thread = threading.Thread(target=lambda: waiting_thread_connections.append(pool.acquire(FakeConnection)))
+    waiting_thread.start()
+    pool.release(connections[0])
+    waiting_thread.join()
+    assert waiting_thread_connections == [connections[0]]
+
+    pool.timeout = 0.1
+    with pytest.raises(PoolTimeout):
+        pool.acquire(FakeConnection)
+
+
+def test_pool_replaces_unusable_connections():
+    pool = create_pool()
+    broken_connection = pool.acquire(FakeConnection)
+    pool.release(broken_connection)
+    broken_connection.is_broken = True
+    replacing_connection = pool.acquire(FakeConnection)
+    assert replacing_connection is not broken_connection
+    assert broken_connection.closed
+
+    pool.max_lifetime = 0
+    pool.release(replacing_connection)
+    assert pool.acquire(FakeConnection) is not replacing_connection
+    assert replacing_connection.closed
+
+    # Connections of a failed atomic block are not reused
+    pool.max_lifetime = 60
+    closed_in_transaction = pool.acquire(FakeConnection)
+    pool.release(closed_in_transaction, reusable=False)
+    assert closed_in_transaction.closed
+
+
+@pytest.mark.skipif(not hasattr(connection, 'pool'), reason='Needs the postgis_pool database backend')
+@pytest.mark.django_db(transaction=True)
+def test_closed_connection_is_returned_to_pool():
+    """ Django closes the connection at the end of each request when CONN_MAX_AGE is 0 """
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+    pooled_connection = connection.connection
+    connection.close()
+    assert not pooled_connection.closed
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+    assert connection.connection is pooled_connection
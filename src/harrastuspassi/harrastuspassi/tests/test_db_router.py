@@ -0,0 +1,85 @@
+import pytest
+from django.conf import settings as django_settings
+from django.urls import reverse
+from harrastuspassi import db_router, settings
+from harrastuspassi.models import Organizer
+
+
+@pytest.fixture
+def replica_lag(monkeypatch, mocker):
+    monkeypatch.setattr(settings, 'DATABASE_REPLICAS', ('replica',))
+    mocker.patch.dict(db_router._replica_lags, clear=True)
+    return mocker.patch('harrastuspassi.db_router.get_replica_lag', return_value=0.0)
+
+
+@pytest.fixture
+def use_replica(mocker):
+    # The replica is not configured in the tests, only the routing decisions are checked
+    return mocker.patch('harrastuspassi.db_router.use_replica')
+
+
+@pytest.mark.django_db
+def test_anonymous_reads_use_replica(api_client, user_api_client, replica_lag, use_replica):
+    url = reverse('organizer-list')
+    assert api_client.get(url).status_code == 200
+    use_replica.assert_called_once_with('replica')
+
+    assert user_api_client.get(url).status_code == 200
+    use_replica.assert_called_with(None)
+
+
+@pytest.mark.django_db
+def test_reads_after_write_use_primary(api_client, user_api_client, replica_lag, use_replica):
+    response = user_api_client.post(reverse('organizer-list'), data={'name': 'Organizer'}, format='json')
+    assert response.status_code == 201
+    sticky_cookie = response.cookies[db_router.STICKY_PRIMARY_COOKIE]
+    assert sticky_cookie['max-age'] == settings.DATABASE_STICKY_PRIMARY_SECONDS
+
+    # The client keeps the cookie after logging out
+    api_client.cookies[db_router.STICKY_PRIMARY_COOKIE] = sticky_cookie.value
+    assert api_client.get(reverse('organizer-list')).status_code == 200
+    use_replica.assert_called_with(None)
+
+
+@pytest.mark.django_db
+def test_lagging_replica_is_not_used(api_client, replica_lag, use_replica, monkeypatch):
+    monkeypatch.setattr(settings, 'DATABASE_REPLICA_LAG_CHECK_INTERVAL', 60)
+    replica_lag.return_value = settings.DATABASE_REPLICA_MAX_LAG + 1
+    url = reverse('organizer-list')
+    api_client.get(url)
+    use_replica.assert_called_with(None)
+
+    # The lag is checked again only after the interval
+    replica_lag.return_value = 0.0
+    api_client.get(url)
+    use_replica.assert_called_with(None)
+    assert replica_lag.call_count == 1
+
+    # Replicas which cannot be reached are not used either
+    monkeypatch.setattr(settings, 'DATABASE_REPLICA_LAG_CHECK_INTERVAL', 0)
+    replica_lag.return_value = None
+    api_client.get(url)
+    use_replica.assert_called_with(None)
+
+
+def test_instances_are_written_to_default_database():
+    router = db_router.ReplicaRouter()
+    organizer = Organizer(name='Organizer')
+    organizer._state.db = 'replica'
+    assert router.db_for_write(Organizer, instance=organizer) == 'default'
+
+
+@pytest.mark.skipif('replica' not in django_settings.DATABASES,
+                    reason='Needs a second database configured as DATABASES["replica"]')
+@pytest.mark.django_db(transaction=True)
+def test_anonymous_reads_come_from_replica(api_client, user_api_client, monkeypatch):
+    """ With two local databases the rows only in the second one show which database was read """
+    monkeypatch.setattr(settings, 'DATABASE_REPLICAS', ('replica',))
+    Organizer.objects.using('replica').create(name='Only in the replica')
+    try:
+        response = api_client.get(reverse('organizer-list'))
+        assert [organizer['name'] for organizer in response.data] == ['Only in the replica']
+        response = user_api_client.get(reverse('organizer-list'))
+        assert response.data == []
+    finally:
+        Organizer.objects.using('replica').all().delete()
@@ -0,0 +1,62 @@
+import datetime
+import pytest
+from django.utils import timezone
+from harrastuspassi import settings
+from harrastuspassi.geocoding import (
+    GeocodingError,
+    geocode_addresses,
+    get_coordinates_from_address,
+    normalize_address,
+)
+from harrastuspassi.models import GeocodedAddress
+
+
+def test_normalize_address():
+    assert normalize_address('Sammonkatu 64,+33540+TAMPERE ') == 'sammonkatu 64 33540 tampere'
+    assert normalize_address('sammonkatu  64, 33540 Tampere') == 'sammonkatu 64 33540 tampere'
+
+
+@pytest.mark.django_db
+def test_geocoding_results_are_cached(geocoding_provider):
+    coordinates = get_coordinates_from_address('Sammonkatu 64,+33540+Tampere')
+    assert coordinates.coords == (23.79, 61.49)
+    assert get_coordinates_from_address('SAMMONKATU 64, 33540 TAMPERE').coords == (23.79, 61.49)
+    assert len(geocoding_provider.calls) == 1
+
+    # addresses which do not exist are cached too
+    for _ in range(2):
+        with pytest.raises(GeocodingError):
+            get_coordinates_from_address('Olematon katu 1')
+    assert len(geocoding_provider.calls) == 2
+
+
+@pytest.mark.django_db
+def test_expired_results_are_geocoded_again(geocoding_provider):
+    get_coordinates_from_address('Olematon katu 1')
+    expired_at = timezone.now() - datetime.timedelta(days=settings.GEOCODING_NEGATIVE_CACHE_TTL_DAYS + 1)
+    GeocodedAddress.objects.update(updated_at=expired_at)
+    with pytest.raises(GeocodingError):
+        get_coordinates_from_address('Olematon katu 1')
+    assert len(geocoding_provider.calls) == 2
+
+
+@pytest.mark.django_db
+def test_geocode_addresses(geocoding_provider):
+    get_coordinates_from_address('Sammonkatu 64, Tampere')
+    results = geocode_addresses([
+        'Sammonkatu 64, Tampere',
+        'sammonkatu 64 tampere',
+        'Sammonkatu 1, Tampere',
+        'Olematon katu 1',
+        'fail',
+    ])
+    assert results['Sammonkatu 64, Tampere'].coords == (23.79, 61.49)
+    assert results['sammonkatu 64 tampere'].coords == (23.79, 61.49)
+    assert results['Sammonkatu 1, Tampere'].coords == (23.79, 61.49)
+    assert results['Olematon katu 1'] is None
+    # failed lookups are told apart from addresses which do not exist
+    assert 'fail' not in results
+    assert sorted(geocoding_provider.calls) == [
+        'Olematon katu 1', 'Sammonkatu 1, Tampere', 'Sammonkatu 64, Tampere', 'fail']
+    # failed lookups are not cached
+    assert not GeocodedAddress.objects.filter(address='fail').exists()
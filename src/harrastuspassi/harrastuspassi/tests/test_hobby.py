@@ -1,5 +1,7 @@
 import pytest
+from django.core.files.base import ContentFile
 from django.db import IntegrityError
+from harrastuspassi.models import Hobby
 
 
 @pytest.mark.django_db
@@ -7,3 +9,40 @@ def test_hobby_without_name(hobby):
     hobby.name = None
     with pytest.raises(IntegrityError):
         hobby.save()
+
+
+@pytest.fixture
+def media_root(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+    return tmp_path
+
+
+@pytest.mark.django_db(transaction=True)
+def test_replaced_cover_image_is_deleted(media_root, hobby):
+    hobby.cover_image = ContentFile(b'old', name='old.jpg')
+    hobby.save()
+    old_path = media_root / hobby.cover_image.name
+    assert old_path.exists()
+
+    hobby = Hobby.objects.get(pk=hobby.pk)
+    hobby.save()
+    assert old_path.exists()
+
+    hobby.cover_image = ContentFile(b'new', name='new.jpg')
+    hobby.save()
+    assert not old_path.exists()
+    assert (media_root / hobby.cover_image.name).exists()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_shared_cover_image_is_not_deleted(media_root, hobby, location, organizer):
+    hobby.cover_image = ContentFile(b'shared', name='shared.jpg')
+    hobby.save()
+    other_hobby = Hobby.objects.create(
+        name='Other Hobby', location=location, organizer=organizer, cover_image=hobby.cover_image.name)
+    shared_path = media_root / hobby.cover_image.name
+
+    hobby.delete()
+    assert shared_path.exists()
+    other_hobby.delete()
+    assert not shared_path.exists()
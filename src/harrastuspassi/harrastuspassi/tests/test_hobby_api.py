@@ -1,7 +1,12 @@
 import pytest
+from io import BytesIO
 from django.contrib.gis.geos import Point
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.urls import reverse
+from PIL import Image
+from harrastuspassi import settings
 from harrastuspassi.models import Hobby, Location
+from harrastuspassi.serializers import ExtraDataMixin, HobbySerializer, LRUCache
 from rest_framework.exceptions import ErrorDetail
 
 
@@ -370,3 +375,113 @@ def test_price_type_filter(user_api_client, location, organizer, municipality):
     assert response.status_code == 200
     assert len(response.data) == 1
     assert response.data[0]['name'] == one_time_type_hobby.name
+
+
+@pytest.mark.django_db
+def test_hobby_serializer_fields_are_compiled_once(mocker, api_client, hobby):
+    """ Extra fields are compiled on the first request with the same includes and reused after that """
+    url = reverse('hobby-list')
+    includes = {'include': ['location_detail', 'organizer_detail']}
+    api_client.get(url, includes)
+    get_extra_fields = mocker.spy(HobbySerializer, 'get_extra_fields')
+    response = api_client.get(url, includes)
+    assert response.status_code == 200
+    assert response.data[0]['location']['id'] == hobby.location.pk
+    assert response.data[0]['organizer']['id'] == hobby.organizer.pk
+    assert get_extra_fields.call_count == 0
+
+    # Other includes are compiled separately
+    response = api_client.get(url, {'include': 'location_detail'})
+    assert response.data[0]['location']['id'] == hobby.location.pk
+    assert response.data[0]['organizer'] == hobby.organizer.pk
+
+
+@pytest.mark.django_db
+def test_unknown_parameters_do_not_fill_compiled_fields(api_client, hobby):
+    url = reverse('hobby-list')
+    api_client.get(url, {'fields': 'id,name'})
+    compiled_count = len(ExtraDataMixin._compiled_fields)
+    for i in range(5):
+        response = api_client.get(url, {'fields': f'id,name,unknown{i}', 'include': f'unknown{i}'})
+        assert response.data == [{'id': hobby.pk, 'name': hobby.name}]
+    assert len(ExtraDataMixin._compiled_fields) == compiled_count
+
+
+def test_lru_cache():
+    cache = LRUCache(2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    # The least recently used value is dropped
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c'), len(cache)) == (1, 3, 2)
+
+
+@pytest.mark.django_db
+def test_hobby_sparse_fieldset(api_client, hobby):
+    url = reverse('hobby-list')
+    response = api_client.get(url, {'fields': 'id,name', 'include': 'location_detail'})
+    assert response.status_code == 200
+    assert response.data == [{'id': hobby.pk, 'name': hobby.name}]
+
+    response = api_client.get(url, {'omit': 'description,permissions'})
+    assert response.status_code == 200
+    assert 'description' not in response.data[0]
+    assert 'permissions' not in response.data[0]
+    assert response.data[0]['name'] == hobby.name
+
+    # The objects nested with include are returned with all fields
+    response = api_client.get(url, {'fields': 'id,location', 'include': 'location_detail'})
+    assert response.data[0]['location']['name'] == hobby.location.name
+
+
+@pytest.fixture
+def media_root(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+    return tmp_path
+
+
+def create_image_upload(size=(40, 20), image_format='PNG', name='cover.png'):
+    image_buffer = BytesIO()
+    Image.new('RGB', size).save(image_buffer, format=image_format)
+    return SimpleUploadedFile(name, image_buffer.getvalue())
+
+
+@pytest.mark.django_db
+def test_hobby_cover_image_upload(user_api_client, valid_hobby_data, media_root):
+    response = user_api_client.post(reverse('hobby-list'), data=valid_hobby_data, format='json')
+    assert response.status_code == 201
+    url = reverse('hobby-upload-cover-image', kwargs={'pk': response.data['id']})
+    response = user_api_client.put(url, {'cover_image': create_image_upload(name='cover.PNG')}, format='multipart')
+    assert response.status_code == 200
+    hobby = Hobby.objects.get(pk=response.data['id'])
+    # Stored by the digest of the content with the extension of the detected format
+    assert hobby.cover_image.name.startswith('hobby_images/')
+    assert hobby.cover_image.name.endswith('.png')
+    assert response.data['cover_image'].endswith(hobby.cover_image.name)
+    assert (media_root / hobby.cover_image.name).exists()
+
+
+@pytest.mark.django_db
+def test_hobby_cover_image_upload_is_validated(user_api_client, api_client, valid_hobby_data, media_root, monkeypatch):
+    response = user_api_client.post(reverse('hobby-list'), data=valid_hobby_data, format='json')
+    hobby_id = response.data['id']
+    url = reverse('hobby-upload-cover-image', kwargs={'pk': hobby_id})
+
+    response = api_client.put(url, {'cover_image': create_image_upload()}, format='multipart')
+    assert response.status_code in (401, 403)
+
+    invalid_upload = SimpleUploadedFile('cover.png', b'not an image')
+    response = user_api_client.put(url, {'cover_image': invalid_upload}, format='multipart')
+    assert response.status_code == 400
+    assert 'cover_image' in response.data
+
+    response = user_api_client.put(url, {'cover_image': create_image_upload(image_format='BMP')}, format='multipart')
+    assert response.status_code == 400
+
+    # The dimensions are read from the header of the image
+    monkeypatch.setattr(settings, 'IMAGE_UPLOAD_MAX_PIXELS', 100)
+    response = user_api_client.put(url, {'cover_image': create_image_upload()}, format='multipart')
+    assert response.status_code == 400
+    assert not Hobby.objects.get(pk=hobby_id).cover_image
@@ -0,0 +1,114 @@
+import datetime
+import pytest
+from freezegun import freeze_time
+from django.urls import reverse
+from django.utils import timezone
+from harrastuspassi import settings
+from harrastuspassi.listings import deferred_refresh, refresh_hobby_event_listings
+from harrastuspassi.management.commands.import_linkedcourses import Command as LinkedCoursesImportCommand, PendingImage
+from harrastuspassi.models import HobbyEvent, HobbyEventListing
+from harrastuspassi.tests.conftest import FROZEN_DATE
+
+
+@pytest.fixture
+def listings_enabled(monkeypatch):
+    monkeypatch.setattr(settings, 'HOBBY_EVENT_LISTING_ENABLED', True)
+
+
+def get_events(api_client, listings_enabled, monkeypatch, query):
+    monkeypatch.setattr(settings, 'HOBBY_EVENT_LISTING_ENABLED', listings_enabled)
+    response = api_client.get(f'{reverse("hobbyevent-list")}?{query}')
+    assert response.status_code == 200
+    return response.json()
+
+
+@freeze_time(FROZEN_DATE)
+@pytest.mark.parametrize('query', [
+    '',
+    'include=hobby_detail',
+    'include=hobby_detail&ordering=nearest&near_latitude=1.0&near_longitude=1.0',
+    'start_time_from=17:00&start_time_to=19:00',
+    'search=midwayland',
+])
+@pytest.mark.django_db(transaction=True)
+def test_listing_matches_hobby_events(listings_enabled, monkeypatch, api_client, query, hobby_far_with_events,
+                                      hobby_midway_with_events, hobby_near_with_events):
+    expected = get_events(api_client, False, monkeypatch, query)
+    events = get_events(api_client, True, monkeypatch, query)
+    assert expected
+    if 'ordering' not in query:
+        # the events start at the same time
+        expected.sort(key=lambda event: event['id'])
+        events.sort(key=lambda event: event['id'])
+    assert events == expected
+
+
+@freeze_time(FROZEN_DATE)
+@pytest.mark.django_db(transaction=True)
+def test_listing_filter_by_category(listings_enabled, api_client, hobbycategory_hierarchy_root, hobby_with_events,
+                                    hobby_with_events2):
+    child_category = hobbycategory_hierarchy_root.get_children().first()
+    hobby_with_events.categories.set([child_category])
+    response = api_client.get(f'{reverse("hobbyevent-list")}?category={hobbycategory_hierarchy_root.pk}')
+    assert response.status_code == 200
+    assert [event['id'] for event in response.data] == [hobby_with_events.next_event_id]
+
+
+@freeze_time(FROZEN_DATE)
+@pytest.mark.django_db(transaction=True)
+def test_listing_is_refreshed_on_change(listings_enabled, hobby_with_events):
+    listing = HobbyEventListing.objects.get(event=hobby_with_events.next_event)
+    assert listing.is_next_event
+    assert HobbyEventListing.objects.filter(hobby=hobby_with_events).count() == 2
+
+    hobby_with_events.name = 'Renamed hobby'
+    hobby_with_events.save()
+    location = hobby_with_events.location
+    location.name = 'Renamed location'
+    location.save()
+    listing.refresh_from_db()
+    assert listing.hobby_name == 'Renamed hobby'
+    assert listing.location_name == 'Renamed location'
+
+    HobbyEvent.objects.filter(hobby=hobby_with_events).exclude(pk=listing.pk).delete()
+    assert HobbyEventListing.objects.filter(hobby=hobby_with_events).count() == 1
+
+
+@freeze_time(FROZEN_DATE)
+@pytest.mark.django_db(transaction=True)
+def test_deferred_refresh(listings_enabled, hobby, frozen_date):
+    with deferred_refresh():
+        for week in range(3):
+            start_date = frozen_date + datetime.timedelta(weeks=week)
+            HobbyEvent.objects.create(hobby=hobby, start_date=start_date, start_time='18:00',
+                                      end_date=start_date, end_time='19:00')
+        assert not HobbyEventListing.objects.exists()
+    assert HobbyEventListing.objects.filter(hobby=hobby).count() == 3
+
+
+@freeze_time(FROZEN_DATE)
+@pytest.mark.django_db(transaction=True)
+def test_listing_is_refreshed_on_imported_cover_image(listings_enabled, mocker, hobby_with_events):
+    image_fetcher_class = mocker.patch('harrastuspassi.management.commands.import_linkedcourses.ImageFetcher')
+    image_fetcher = image_fetcher_class.return_value.__enter__.return_value
+    image_fetcher.fetch_many.return_value = {'https://example.com/new.jpg': 'hobby_images/new.jpg'}
+    command = LinkedCoursesImportCommand()
+    # Only the image of the hobby changed upstream
+    command.pending_images = [PendingImage(hobby_with_events.pk, 'https://example.com/new.jpg', timezone.now())]
+    with deferred_refresh():
+        command.handle_pending_images()
+        assert not HobbyEventListing.objects.filter(cover_image='hobby_images/new.jpg').exists()
+    listings = HobbyEventListing.objects.filter(hobby=hobby_with_events)
+    assert listings.count() == 2
+    assert {listing.cover_image.name for listing in listings} == {'hobby_images/new.jpg'}
+
+
+@freeze_time(FROZEN_DATE)
+@pytest.mark.django_db
+def test_refresh_drops_past_events(hobby_with_events, frozen_date):
+    assert refresh_hobby_event_listings() == 2
+    with freeze_time(frozen_date + datetime.timedelta(days=1)):
+        # the next event is kept until update_hobby_next_event moves on
+        assert refresh_hobby_event_listings() == 2
+        hobby_with_events.update_next_event()
+        assert refresh_hobby_event_listings([hobby_with_events.pk]) == 1
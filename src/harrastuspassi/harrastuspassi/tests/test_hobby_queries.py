@@ -0,0 +1,78 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from freezegun import freeze_time
+from harrastuspassi.models import Hobby, HobbyCategory, HobbyEvent
+from harrastuspassi.tests.conftest import FROZEN_DATE
+
+
+def create_hobbies(count, location, organizer, municipality, frozen_date):
+    category = HobbyCategory.objects.create(name='Urheilu', cover_image='category_images/urheilu.jpg')
+    child_category = HobbyCategory.objects.create(name='Jalkapallo', parent=category)
+    for number in range(count):
+        hobby = Hobby.objects.create(
+            name=f'Harrastus {number}', location=location, organizer=organizer, municipality=municipality)
+        hobby.categories.add(child_category)
+        event = HobbyEvent.objects.create(
+            hobby=hobby, start_date=frozen_date, end_date=frozen_date, start_weekday=frozen_date.isoweekday(),
+            start_time='09:00', end_time='10:00')
+        Hobby.objects.filter(pk=hobby.pk).update(next_event=event)
+
+
+def count_queries(client, url, params):
+    with CaptureQueriesContext(connection) as captured_queries:
+        response = client.get(url, params)
+    assert response.status_code == 200
+    return len(captured_queries)
+
+
+@pytest.mark.parametrize('url, params', [
+    ('/api/pre1/hobbies/', {}),
+    ('/api/pre2/hobbies/', {'include': ['location_detail', 'organizer_detail']}),
+    ('/api/v1/hobbies/', {}),
+    ('/api/v1/hobbies/', {'include': ['location_detail', 'organizer_detail']}),
+    ('/api/pre1/hobbyevents/', {'include': 'hobby_detail'}),
+    ('/api/v1/hobbyevents/', {'include': 'hobby_detail'}),
+])
+@freeze_time(FROZEN_DATE)
+@pytest.mark.django_db
+def test_hobby_list_query_count_is_constant(api_client, user_api_client, location, organizer, municipality,
+                                            frozen_date, url, params):
+    """ The number of queries should not depend on the number of listed hobbies """
+    create_hobbies(2, location, organizer, municipality, frozen_date)
+    few_hobbies_query_counts = [count_queries(client, url, params) for client in (api_client, user_api_client)]
+    create_hobbies(8, location, organizer, municipality, frozen_date)
+    many_hobbies_query_counts = [count_queries(client, url, params) for client in (api_client, user_api_client)]
+    assert few_hobbies_query_counts == many_hobbies_query_counts
+
+
+@pytest.mark.django_db
+def test_hobby_cover_image_falls_back_to_category(api_client, hobbycategory_hierarchy_root, hobby):
+    child_category = hobbycategory_hierarchy_root.get_children().first()
+    grandchild_category = HobbyCategory.objects.create(name='Lapsenlapsi', parent=child_category)
+    HobbyCategory.objects.filter(pk=hobbycategory_hierarchy_root.pk).update(cover_image='category_images/root.jpg')
+    HobbyCategory.objects.filter(pk=child_category.pk).update(cover_image='category_images/child.jpg')
+    hobby.categories.add(grandchild_category)
+
+    response = api_client.get(reverse('hobby-detail', kwargs={'pk': hobby.pk}))
+    assert response.status_code == 200
+    # The closest ancestor with an image is used
+    assert response.data['cover_image'].endswith('category_images/child.jpg')
+
+
+@freeze_time(FROZEN_DATE)
+@pytest.mark.django_db
+def test_hobby_sparse_fieldset_prunes_queries(user_api_client, location, organizer, municipality, frozen_date):
+    create_hobbies(2, location, organizer, municipality, frozen_date)
+    url = '/api/v1/hobbies/'
+    all_fields_query_count = count_queries(user_api_client, url, {})
+    with CaptureQueriesContext(connection) as captured_queries:
+        response = user_api_client.get(url, {'fields': 'id,name'})
+    assert response.status_code == 200
+    # No categories, municipality or permissions are needed
+    assert len(captured_queries) < all_fields_query_count
+    hobby_query = next(
+        query['sql'] for query in captured_queries if query['sql'].startswith('SELECT "harrastuspassi_hobby"."id"'))
+    assert '"harrastuspassi_hobby"."description"' not in hobby_query
+    assert 'harrastuspassi_municipality' not in hobby_query
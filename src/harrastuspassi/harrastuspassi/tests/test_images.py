@@ -0,0 +1,132 @@
+import pytest
+from io import BytesIO
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from PIL import Image
+from harrastuspassi import images, settings, tasks
+from harrastuspassi.images import (
+    ImageFetcher,
+    ensure_derivatives,
+    generate_derivatives,
+    get_derivative_formats,
+    get_derivative_name,
+    get_derivative_urls,
+    get_derivatives_key,
+    schedule_derivatives,
+)
+from harrastuspassi.models import ImageDerivativeJob, RemoteImage
+
+
+@pytest.fixture
+def image_storage(tmp_path):
+    return FileSystemStorage(location=str(tmp_path))
+
+
+def mock_response(mocker, status_code=200, content=b'', headers=None):
+    response = mocker.Mock(status_code=status_code, content=content, headers=headers or {})
+    response.raise_for_status = mocker.Mock()
+    return response
+
+
+@pytest.mark.django_db
+def test_identical_images_are_stored_once(mocker, image_storage):
+    with ImageFetcher(storage=image_storage) as image_fetcher:
+        image_fetcher.session.get = mocker.Mock(return_value=mock_response(mocker, content=b'same image'))
+        image_names = image_fetcher.fetch_many(['https://example.com/a.jpg', 'https://example.com/b.JPG'])
+    assert image_names['https://example.com/a.jpg'] == image_names['https://example.com/b.JPG']
+    assert image_names['https://example.com/a.jpg'].endswith('.jpg')
+    assert len(image_storage.listdir('hobby_images')[1]) == 1
+    assert RemoteImage.objects.count() == 2
+
+
+@pytest.mark.django_db
+def test_unmodified_image_is_not_downloaded_again(mocker, image_storage):
+    url = 'https://example.com/a.jpg'
+    with ImageFetcher(storage=image_storage) as image_fetcher:
+        image_fetcher.session.get = mocker.Mock(
+            return_value=mock_response(mocker, content=b'image', headers={'ETag': '"v1"'}))
+        first_name = image_fetcher.fetch_many([url])[url]
+
+        image_fetcher.session.get = mocker.Mock(return_value=mock_response(mocker, status_code=304))
+        second_name = image_fetcher.fetch_many([url])[url]
+    assert first_name == second_name
+    _args, kwargs = image_fetcher.session.get.call_args
+    assert kwargs['headers'] == {'If-None-Match': '"v1"'}
+
+
+def test_derivatives_are_generated_in_configured_widths(image_storage):
+    image_buffer = BytesIO()
+    Image.new('RGBA', (800, 400)).save(image_buffer, format='PNG')
+    name = image_storage.save('hobby_images/cover.png', ContentFile(image_buffer.getvalue()))
+
+    assert generate_derivatives(name, image_storage)
+    for image_format in get_derivative_formats():
+        small = Image.open(image_storage.open(get_derivative_name(name, 300, image_format)))
+        assert small.size == (300, 150)
+        # images are never upscaled
+        large = Image.open(image_storage.open(get_derivative_name(name, 1200, image_format)))
+        assert large.size == (800, 400)
+
+
+@pytest.mark.django_db
+def test_derivatives_are_not_generated_while_serializing(monkeypatch, mocker, image_storage):
+    monkeypatch.setattr(settings, 'IMAGE_DERIVATIVE_INDEX_INTERVAL', 0)
+    mocker.patch.dict(images._images_with_derivatives, clear=True)
+    image_buffer = BytesIO()
+    Image.new('RGB', (800, 400)).save(image_buffer, format='JPEG')
+    name = image_storage.save('hobby_images/older.jpg', ContentFile(image_buffer.getvalue()))
+    image_file = mocker.Mock(storage=image_storage)
+    image_file.name = name
+
+    assert get_derivative_urls(image_file) is None
+    assert not image_storage.exists(get_derivative_name(name, 300, 'jpeg'))
+    assert ensure_derivatives(name, image_storage)
+    assert get_derivative_urls(image_file)['jpeg']['300w'].endswith(get_derivative_name(name, 300, 'jpeg'))
+
+
+@pytest.mark.django_db
+def test_deferred_derivatives_are_generated_by_the_worker(monkeypatch, mocker, image_storage):
+    monkeypatch.setattr(settings, 'IMAGE_DERIVATIVES_DEFERRED', True)
+    monkeypatch.setattr(settings, 'IMAGE_DERIVATIVE_MAX_ATTEMPTS', 2)
+    monkeypatch.setattr(settings, 'IMAGE_DERIVATIVE_INDEX_INTERVAL', 0)
+    mocker.patch('harrastuspassi.images.default_storage', image_storage)
+    mocker.patch.dict(images._images_with_derivatives, clear=True)
+    image_buffer = BytesIO()
+    Image.new('RGB', (800, 400)).save(image_buffer, format='JPEG')
+    name = image_storage.save('hobby_images/cover.jpg', ContentFile(image_buffer.getvalue()))
+    image_file = mocker.Mock(storage=image_storage)
+    image_file.name = name
+
+    schedule_derivatives(name)
+    schedule_derivatives('hobby_images/missing.jpg')
+    schedule_derivatives(name)
+    assert ImageDerivativeJob.objects.count() == 2
+    # Nothing is resized while serializing
+    assert get_derivative_urls(image_file) is None
+    assert not image_storage.exists(get_derivative_name(name, 300, 'jpeg'))
+
+    assert tasks.generate_pending_image_derivatives() == 2
+    assert image_storage.exists(get_derivative_name(name, 300, 'jpeg'))
+    assert get_derivative_urls(image_file)['jpeg']['300w'].endswith(get_derivative_name(name, 300, 'jpeg'))
+    # Generated images are recorded in the database, other processes read them from there
+    assert ImageDerivativeJob.objects.get(image_name=name).derivatives_key == get_derivatives_key()
+    # The missing image is retried later and then given up
+    failed_job = ImageDerivativeJob.objects.get(next_attempt_at__isnull=False)
+    assert failed_job.image_name == 'hobby_images/missing.jpg'
+    assert failed_job.attempts == 1
+    ImageDerivativeJob.objects.filter(pk=failed_job.pk).update(next_attempt_at=failed_job.created_at)
+    assert tasks.generate_pending_image_derivatives() == 1
+    assert ImageDerivativeJob.objects.get(pk=failed_job.pk).next_attempt_at is None
+    assert tasks.generate_pending_image_derivatives() == 0
+
+
+@pytest.mark.django_db
+def test_missing_derivatives_are_queued(hobby):
+    hobby.cover_image = 'hobby_images/older.jpg'
+    hobby.save()
+    ImageDerivativeJob.objects.all().delete()
+    assert tasks.queue_missing_image_derivatives() == 1
+    assert ImageDerivativeJob.objects.get().image_name == 'hobby_images/older.jpg'
+    # Images with derivatives are not queued again
+    ImageDerivativeJob.objects.update(derivatives_key=get_derivatives_key(), next_attempt_at=None)
+    assert tasks.queue_missing_image_derivatives() == 0
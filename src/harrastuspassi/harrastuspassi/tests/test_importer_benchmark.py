@@ -0,0 +1,18 @@
+import pytest
+from io import StringIO
+from django.core.management import call_command
+from harrastuspassi.models import Hobby, HobbyEvent
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('importer', ['linkedcourses', 'lipas'])
+def test_benchmark_importers(importer):
+    stdout = StringIO()
+    call_command('benchmark_importers', '--importer', importer, '--events', '30', '--no-memory', stdout=stdout)
+    output = stdout.getvalue()
+    assert f'import_{importer}: 30 events' in output
+    assert 'events/s' in output
+    assert 'created 0 hobbies' not in output
+    # the benchmark is rolled back
+    assert not Hobby.objects.exists()
+    assert not HobbyEvent.objects.exists()
@@ -2,7 +2,6 @@ import datetime
 import pytest
 from decimal import Decimal
 from freezegun import freeze_time
-from django.core.files.base import ContentFile
 from harrastuspassi.management.commands.import_linkedcourses import Command as LinkedCoursesImportCommand
 from harrastuspassi.models import Hobby, HobbyEvent
 from harrastuspassi.tests.conftest import FROZEN_DATETIME
@@ -14,22 +13,30 @@ pytest_plugins = ['harrastuspassi.tests.fixtures_linkedcourses']
 @pytest.mark.django_db
 def test_event_image_update(mocker, hobby, event_with_images_only, frozen_datetime):
     command = LinkedCoursesImportCommand()
-
-    command.fetch_image = mocker.Mock(return_value=(ContentFile('foo'), 'foo.jpg'), name='fetch_image')
+    image_fetcher_class = mocker.patch('harrastuspassi.management.commands.import_linkedcourses.ImageFetcher')
+    image_fetcher = image_fetcher_class.return_value.__enter__.return_value
+    image_url = event_with_images_only['images'][0]['url']
+    image_fetcher.fetch_many.return_value = {image_url: 'hobby_images/foo.jpg'}
     # New image
     event = event_with_images_only
     event['images'][0]['last_modified_time'] = (frozen_datetime - datetime.timedelta(days=30)).isoformat() + 'Z'
     command.handle_hobby_cover_image(event, hobby)
-    command.fetch_image.assert_called()
-    command.fetch_image.reset_mock()
+    assert [pending_image.url for pending_image in command.pending_images] == [image_url]
+    command.handle_pending_images()
+    image_fetcher.fetch_many.assert_called()
+    image_fetcher.fetch_many.reset_mock()
+    hobby.refresh_from_db()
+    assert hobby.cover_image.name == 'hobby_images/foo.jpg'
     # Same image, same last_modified_time
     command.handle_hobby_cover_image(event, hobby)
-    command.fetch_image.assert_not_called()
-    command.fetch_image.reset_mock()
+    command.handle_pending_images()
+    image_fetcher.fetch_many.assert_not_called()
+    image_fetcher.fetch_many.reset_mock()
     # Same image, newer last_modified_time
     event['images'][0]['last_modified_time'] = (frozen_datetime - datetime.timedelta(days=5)).isoformat() + 'Z'
     command.handle_hobby_cover_image(event, hobby)
-    command.fetch_image.assert_called()
+    command.handle_pending_images()
+    image_fetcher.fetch_many.assert_called()
 
 
 @pytest.mark.django_db
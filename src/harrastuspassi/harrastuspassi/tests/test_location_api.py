@@ -1,7 +1,7 @@
 import pytest
 from django.urls import reverse
-from rest_framework.exceptions import ErrorDetail
-from harrastuspassi import settings
+from django.utils import timezone
+from harrastuspassi import settings, tasks
 from harrastuspassi.models import Location
 
 
@@ -36,15 +36,21 @@ def test_location_list_returns_only_editable_for_authenticated_user(user_api_cli
     assert len(response.data) == 2
 
 
-@pytest.mark.skipif(not settings.GOOGLE_GEOCODING_API_KEY, reason="GOOGLE_GEOCODING_API_KEY not provided!")
 @pytest.mark.django_db
-def test_geocoding_functionality(user_api_client, user2_api_client, api_client, location_data_without_coordinates):
-    """ Posting a location to API without coordinates should fetch the coordinates from Google Geolocoding API """
+def test_geocoding_functionality(geocoding_provider, user_api_client, location_data_without_coordinates):
+    """ Posting a location to API without coordinates should geocode the coordinates in the background """
     api_url = reverse('location-list')
     response = user_api_client.post(api_url, data=location_data_without_coordinates, format='json')
     assert response.status_code == 201
     assert response.data['name'] == location_data_without_coordinates['name']
-    assert response.data['coordinates']
+    assert response.data['coordinates'] is None
+    assert response.data['geocoding_status'] == Location.GEOCODING_PENDING
+    assert not geocoding_provider.calls
+
+    assert tasks.geocode_pending_locations() == 1
+    response = user_api_client.get(reverse('location-detail', kwargs={'pk': response.data['id']}))
+    assert response.data['geocoding_status'] == Location.GEOCODING_DONE
+    assert response.data['coordinates']['coordinates'] == [23.79, 61.49]
 
     # Creating a location with user provided coordinates should still be possible
     Location.objects.all().delete()
@@ -56,17 +62,64 @@ def test_geocoding_functionality(user_api_client, user2_api_client, api_client,
     response = user_api_client.post(api_url, data=location_data_with_coordinates, format='json')
     assert response.status_code == 201
     assert response.data['coordinates']['coordinates'] == [1.0, 1.0]
+    assert response.data['geocoding_status'] == ''
+
+
+@pytest.mark.django_db
+def test_geocoding_is_retried_with_backoff(monkeypatch, geocoding_provider, user_api_client,
+                                           location_data_without_coordinates):
+    monkeypatch.setattr(settings, 'GEOCODING_MAX_ATTEMPTS', 2)
+    # The geocoding service fails for this address
+    location_data_without_coordinates['address'] = 'fail'
+    response = user_api_client.post(reverse('location-list'), data=location_data_without_coordinates, format='json')
+    assert response.status_code == 201
+    location = Location.objects.get(pk=response.data['id'])
+
+    assert tasks.geocode_pending_locations() == 1
+    location.refresh_from_db()
+    assert location.geocoding_status == Location.GEOCODING_PENDING
+    assert location.geocoding_attempts == 1
+    assert location.geocoding_next_attempt_at > timezone.now()
+    # the location is not retried before the backoff delay has passed
+    assert tasks.geocode_pending_locations() == 0
+
+    Location.objects.update(geocoding_next_attempt_at=timezone.now())
+    assert tasks.geocode_pending_locations() == 1
+    location.refresh_from_db()
+    assert location.geocoding_status == Location.GEOCODING_FAILED
+    assert location.coordinates is None
+
 
+@pytest.mark.django_db
+def test_address_not_found_is_not_retried(geocoding_provider, user_api_client, location_data_without_coordinates):
     # Geocoding a faulty address should fail gracefully
     location_data_without_coordinates['address'] = 'Sangen kelvoton osoite'
     location_data_without_coordinates['city'] = 'Tuskin kaupunki'
     location_data_without_coordinates['zip_code'] = '00000'
+    response = user_api_client.post(reverse('location-list'), data=location_data_without_coordinates, format='json')
+    assert response.status_code == 201
 
-    response = user_api_client.post(api_url, data=location_data_without_coordinates, format='json')
-    assert response.status_code == 400
-    expected_error = [
-        ErrorDetail(
-            string='This address could not be geocoded. Please confirm your address is right, or try again later.',
-            code='invalid')
-    ]
-    assert response.data == expected_error
+    assert tasks.geocode_pending_locations() == 1
+    location = Location.objects.get(pk=response.data['id'])
+    assert location.geocoding_status == Location.GEOCODING_FAILED
+    assert location.geocoding_attempts == 1
+    assert location.coordinates is None
+    assert len(geocoding_provider.calls) == 1
+
+
+@pytest.mark.django_db
+def test_updated_coordinates_are_not_geocoded(geocoding_provider, user_api_client, location_data_without_coordinates):
+    response = user_api_client.post(reverse('location-list'), data=location_data_without_coordinates, format='json')
+    detail_url = reverse('location-detail', kwargs={'pk': response.data['id']})
+    response = user_api_client.patch(detail_url, data={'coordinates': {'type': 'Point', 'coordinates': [1, 1]}},
+                                     format='json')
+    assert response.status_code == 200
+    assert response.data['geocoding_status'] == Location.GEOCODING_DONE
+    assert tasks.geocode_pending_locations() == 0
+    assert Location.objects.get().coordinates.coords == (1.0, 1.0)
+
+    # Changing the address geocodes the location again
+    response = user_api_client.patch(detail_url, data={'address': 'Sammonkatu 1'}, format='json')
+    assert response.data['geocoding_status'] == Location.GEOCODING_PENDING
+    assert tasks.geocode_pending_locations() == 1
+    assert Location.objects.get().coordinates.coords == (23.79, 61.49)
@@ -0,0 +1,62 @@
+import pytest
+from django.http import Http404
+from django.test import RequestFactory
+from harrastuspassi import settings
+from harrastuspassi.views.media import serve_media
+
+DIGEST = 'a' * 64
+
+
+@pytest.fixture
+def media_root(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+    (tmp_path / 'hobby_images' / 'derivatives').mkdir(parents=True)
+    (tmp_path / 'hobby_images' / 'uploaded.jpg').write_bytes(b'uploaded')
+    (tmp_path / 'hobby_images' / f'{DIGEST}.jpg').write_bytes(b'imported')
+    (tmp_path / 'hobby_images' / 'derivatives' / f'{DIGEST}_300w.webp').write_bytes(b'derivative')
+    return tmp_path
+
+
+def get(path):
+    return serve_media(RequestFactory().get(f'/media/{path}'), path)
+
+
+def test_serve_media_django(monkeypatch, media_root):
+    monkeypatch.setattr(settings, 'MEDIA_SERVING', 'django')
+    response = get('hobby_images/uploaded.jpg')
+    assert response.status_code == 200
+    assert b''.join(response.streaming_content) == b'uploaded'
+    assert response['Content-Type'] == 'image/jpeg'
+    assert response['Cache-Control'] == f'public, max-age={settings.MEDIA_CACHE_MAX_AGE}'
+
+
+@pytest.mark.parametrize('path', [f'hobby_images/{DIGEST}.jpg', f'hobby_images/derivatives/{DIGEST}_300w.webp'])
+def test_serve_media_content_addressed(monkeypatch, media_root, path):
+    monkeypatch.setattr(settings, 'MEDIA_SERVING', 'django')
+    response = get(path)
+    assert response.status_code == 200
+    assert 'immutable' in response['Cache-Control']
+
+
+def test_serve_media_x_accel_redirect(monkeypatch, media_root):
+    monkeypatch.setattr(settings, 'MEDIA_SERVING', 'x-accel-redirect')
+    response = get('hobby_images/uploaded.jpg')
+    assert response.status_code == 200
+    assert response.content == b''
+    assert response['X-Accel-Redirect'] == '/protected-media/hobby_images/uploaded.jpg'
+    assert response['Content-Type'] == 'image/jpeg'
+
+
+def test_serve_media_x_sendfile(monkeypatch, media_root):
+    monkeypatch.setattr(settings, 'MEDIA_SERVING', 'x-sendfile')
+    response = get('hobby_images/uploaded.jpg')
+    assert response.content == b''
+    assert response['X-Sendfile'] == str(media_root / 'hobby_images' / 'uploaded.jpg')
+
+
+@pytest.mark.parametrize('path', ['hobby_images/missing.jpg', 'hobby_images', '../secret.txt'])
+def test_serve_media_not_found(monkeypatch, media_root, path):
+    monkeypatch.setattr(settings, 'MEDIA_SERVING', 'x-accel-redirect')
+    (media_root.parent / 'secret.txt').write_bytes(b'secret')
+    with pytest.raises(Http404):
+        get(path)
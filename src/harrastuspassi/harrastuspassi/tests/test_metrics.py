@@ -0,0 +1,67 @@
+import pytest
+from django.urls import reverse
+from prometheus_client import REGISTRY
+from harrastuspassi import settings
+from harrastuspassi.metrics import count_importer_row
+from harrastuspassi.models import Hobby, Location
+
+
+def get_sample_value(name, labels=None):
+    return REGISTRY.get_sample_value(name, labels or {}) or 0
+
+
+@pytest.mark.django_db
+def test_request_duration(api_client, hobby):
+    labels = {'view': 'HobbyViewSet.list', 'method': 'GET', 'status': '200'}
+    count = get_sample_value('harrastuspassi_request_duration_seconds_count', labels)
+    response = api_client.get(reverse('hobby-list'))
+    assert response.status_code == 200
+    assert get_sample_value('harrastuspassi_request_duration_seconds_count', labels) == count + 1
+
+
+@pytest.mark.django_db
+def test_metrics_endpoint(api_client, location):
+    Location.objects.filter(pk=location.pk).update(geocoding_status=Location.GEOCODING_PENDING)
+    response = api_client.get(reverse('metrics'))
+    assert response.status_code == 200
+    content = response.content.decode()
+    assert 'harrastuspassi_geocoding_pending_locations 1.0' in content
+    assert 'harrastuspassi_request_duration_seconds_bucket' in content
+
+
+@pytest.mark.django_db
+def test_metrics_endpoint_access(api_client, monkeypatch):
+    url = reverse('metrics')
+    assert api_client.get(url, REMOTE_ADDR='203.0.113.1').status_code == 403
+    monkeypatch.setattr(settings, 'METRICS_ALLOWED_IPS', ('203.0.113.0/24',))
+    assert api_client.get(url, REMOTE_ADDR='203.0.113.1').status_code == 200
+
+    monkeypatch.setattr(settings, 'METRICS_ALLOWED_IPS', ())
+    monkeypatch.setattr(settings, 'METRICS_TOKEN', 'secret')
+    assert api_client.get(url, HTTP_AUTHORIZATION='Bearer wrong').status_code == 403
+    assert api_client.get(url, HTTP_AUTHORIZATION='Bearer secret').status_code == 200
+
+
+@pytest.mark.django_db
+def test_permission_sync_duration(location, organizer, municipality):
+    labels = {'task': 'update_hobby_permissions'}
+    count = get_sample_value('harrastuspassi_permission_sync_duration_seconds_count', labels)
+    Hobby.objects.create(name='Metrics hobby', location=location, organizer=organizer, municipality=municipality)
+    assert get_sample_value('harrastuspassi_permission_sync_duration_seconds_count', labels) == count + 1
+
+
+def test_count_importer_row():
+    def get_count(result):
+        return get_sample_value('harrastuspassi_importer_rows_total', {'importer': 'test', 'result': result})
+
+    processed, skipped, failed = get_count('processed'), get_count('skipped'), get_count('failed')
+    with count_importer_row('test'):
+        pass
+    with count_importer_row('test') as row:
+        row.skip()
+    with pytest.raises(ValueError):
+        with count_importer_row('test'):
+            raise ValueError()
+    assert get_count('processed') == processed + 1
+    assert get_count('skipped') == skipped + 1
+    assert get_count('failed') == failed + 1
@@ -0,0 +1,87 @@
+import gzip
+
+import brotli
+import pytest
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory
+from django.urls import reverse
+from rest_framework.test import APIClient
+from harrastuspassi import middleware, settings
+from harrastuspassi.middleware import CompressionMiddleware, get_accepted_encoding
+
+
+@pytest.mark.django_db
+def test_profiling_disabled(hobby):
+    response = APIClient().get(reverse('hobby-list'))
+    assert response.status_code == 200
+    assert 'Server-Timing' not in response
+
+
+@pytest.mark.django_db
+def test_profiling_server_timing(monkeypatch, caplog, hobby):
+    monkeypatch.setattr(settings, 'PROFILING_SAMPLE_RATE', 1.0)
+    with caplog.at_level('INFO', logger='harrastuspassi.middleware'):
+        response = APIClient().get(reverse('hobby-list'))
+    assert response.status_code == 200
+    timings = dict(timing.split(';', 1) for timing in response['Server-Timing'].split(', '))
+    assert set(timings) == {'db', 'view', 'serializer', 'render', 'total', 'queries'}
+    assert int(timings['queries'].split('"')[1]) > 0
+    record = next(record for record in caplog.records if record.message == 'Request profile')
+    assert record.data['view'] == 'HobbyViewSet.list'
+    assert record.data['query_count'] > 0
+    assert 'serializer_ms' in record.data
+
+
+@pytest.mark.parametrize('accept_encoding, streaming, encoding', [
+    ('gzip, deflate, br', False, 'br'),
+    ('gzip, deflate, br', True, 'gzip'),
+    ('gzip;q=1.0, br;q=0', False, 'gzip'),
+    ('*', False, 'br'),
+    ('identity', False, None),
+    ('', False, None),
+])
+def test_accepted_encoding(accept_encoding, streaming, encoding):
+    assert get_accepted_encoding(accept_encoding, streaming) == encoding
+
+
+def compress_response(content, accept_encoding, **extra):
+    request = RequestFactory().get('/api/v1/hobbies/', HTTP_ACCEPT_ENCODING=accept_encoding, **extra)
+    return CompressionMiddleware(lambda request: HttpResponse(content))(request)
+
+
+def test_compression():
+    content = b'{"name": "Jalkapallo"}' * 100
+    response = compress_response(content, 'gzip, br')
+    assert response['Content-Encoding'] == 'br'
+    assert response['Vary'] == 'Accept-Encoding'
+    assert brotli.decompress(response.content) == content
+    assert response['Content-Length'] == str(len(response.content))
+
+    response = compress_response(content, 'gzip')
+    assert response['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.content) == content
+
+    # Small responses are not worth compressing
+    response = compress_response(content[:settings.COMPRESSION_MIN_SIZE - 1], 'gzip, br')
+    assert not response.has_header('Content-Encoding')
+
+
+def test_compression_streaming():
+    request = RequestFactory().get('/media/foo.txt', HTTP_ACCEPT_ENCODING='gzip, br')
+    response = CompressionMiddleware(lambda request: StreamingHttpResponse([b'foo'] * 100))(request)
+    assert response['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(b''.join(response.streaming_content)) == b'foo' * 100
+
+
+def test_compressed_responses_are_cached(mocker):
+    content = b'{"name": "Compressed once"}' * 100
+    compress = mocker.spy(middleware, 'compress')
+    first_response = compress_response(content, 'br')
+    second_response = compress_response(content, 'br')
+    assert first_response.content == second_response.content
+    assert compress.call_count == 1
+
+    # Authenticated responses are not cached
+    compress_response(content, 'br', HTTP_AUTHORIZATION='Bearer token')
+    compress_response(content, 'br', HTTP_AUTHORIZATION='Bearer token')
+    assert compress.call_count == 3
@@ -1,7 +1,9 @@
 import datetime
 import pytest
 from django.urls import reverse
+from django.utils import timezone
 from freezegun import freeze_time
+from harrastuspassi import tasks
 from harrastuspassi.models import Benefit, Promotion
 from harrastuspassi.tests.conftest import FROZEN_DATE, FROZEN_DATETIME
 
@@ -44,6 +46,23 @@ def test_promotion_available_count(user_api_client, promotion, valid_benefit_dat
     assert response.data['non_field_errors'][0].code == 'invalid'
 
 
+@pytest.mark.django_db
+def test_sharded_promotion_available_count(user_api_client, promotion, valid_benefit_data):
+    """ A sharded promotion is used up when its shards are, before used_count is synced """
+    Promotion.objects.filter(pk=promotion.pk).update(available_count=2, used_count=0)
+    promotion.refresh_from_db()
+    promotion.enable_counter_shards(2)
+    url = reverse('benefit-list')
+    for _ in range(2):
+        assert user_api_client.post(url, data=valid_benefit_data, format='json').status_code == 201
+    promotion.refresh_from_db()
+    assert promotion.used_count == 0
+    response = user_api_client.post(url, data=valid_benefit_data, format='json')
+    assert response.status_code == 400
+    assert response.data['non_field_errors'][0] == 'All available promotions have been used'
+    assert Benefit.objects.filter(promotion=promotion).count() == 2
+
+
 @pytest.mark.django_db
 def test_benefit_api_unauthenticated_user(api_client, valid_benefit_data):
     """ Unauthenticated users should not be able to create a new benefit """
@@ -187,3 +206,32 @@ def test_promotions_location(api_client,
     assert promotion_near.pk == promotions[0]['id']
     assert promotion_midway.pk == promotions[1]['id']
     assert promotion_far.pk == promotions[2]['id']
+
+
+@pytest.mark.django_db
+def test_promotion_statistics(api_client, promotion):
+    for _ in range(3):
+        Benefit.objects.create(promotion=promotion)
+    yesterday = Benefit.objects.create(promotion=promotion)
+    Benefit.objects.filter(pk=yesterday.pk).update(created_at=yesterday.created_at - datetime.timedelta(days=1))
+    assert tasks.update_promotion_statistics(days=2) == 2
+
+    url = reverse('promotion-statistics', kwargs={'pk': promotion.pk})
+    response = api_client.get(url)
+    assert response.status_code == 200
+    assert response.data['used_count'] == 4
+    assert [day['used_count'] for day in response.data['daily']] == [1, 3]
+
+    today = timezone.localdate().isoformat()
+    response = api_client.get(f'{url}?start_date={today}')
+    assert response.data['daily'] == [{'date': today, 'used_count': 3}]
+
+
+@pytest.mark.django_db
+def test_benefit_list_is_paginated_in_v1(user_api_client, promotion):
+    Benefit.objects.create(promotion=promotion)
+    response = user_api_client.get(reverse('benefit-list', kwargs={'version': 'v1'}))
+    assert response.status_code == 200
+    assert response.data['count'] == 1
+    response = user_api_client.get(reverse('benefit-list', kwargs={'version': 'pre2'}))
+    assert len(response.data) == 1
@@ -0,0 +1,104 @@
+import datetime
+from collections import OrderedDict
+from decimal import Decimal
+from io import BytesIO
+
+import pytest
+from django.contrib.gis.geos import Point
+from django.urls import reverse
+from django.utils.translation import gettext_lazy
+from freezegun import freeze_time
+from harrastuspassi import settings
+from harrastuspassi.models import Hobby
+from harrastuspassi.parsers import MessagePackParser
+from harrastuspassi.renderers import FastJSONRenderer, MessagePackRenderer
+from harrastuspassi.tests.conftest import FROZEN_DATE
+from rest_framework.renderers import JSONRenderer
+from rest_framework_gis.fields import GeometryField
+
+
+def test_fast_json_renderer_matches_json_renderer():
+    data = [OrderedDict([
+        ('price_amount', Decimal('12.50')),
+        ('start_date', datetime.date(2022, 2, 22)),
+        ('created_at', datetime.datetime(2022, 2, 22, 12, 30, 15, 123456, tzinfo=datetime.timezone.utc)),
+        ('coordinates', GeometryField().to_representation(Point(24.94, 60.17))),
+        ('name', 'Jalkapallo ja jääkiekko'),
+        ('label', gettext_lazy('Root category')),
+        ('counts', {1: 2}),
+        ('empty', None),
+    ])]
+    assert FastJSONRenderer().render(data) == JSONRenderer().render(data)
+
+
+def test_fast_json_renderer_indent():
+    data = {'name': 'Jalkapallo'}
+    rendered = FastJSONRenderer().render(data, 'application/json; indent=4')
+    assert rendered == JSONRenderer().render(data, 'application/json; indent=4')
+    assert b'\n' in rendered
+
+
+def test_message_pack_round_trip():
+    data = [OrderedDict([
+        ('price_amount', Decimal('12.50')),
+        ('start_date', datetime.date(2022, 2, 22)),
+        ('start_time', datetime.time(9, 30)),
+        ('created_at', datetime.datetime(2022, 2, 22, 12, 30, 15, 123456, tzinfo=datetime.timezone.utc)),
+        ('coordinates', GeometryField().to_representation(Point(24.94, 60.17))),
+        ('name', 'Jalkapallo'),
+        ('empty', None),
+    ])]
+    rendered = MessagePackRenderer().render(data)
+    assert len(rendered) < len(JSONRenderer().render(data))
+    assert MessagePackParser().parse(BytesIO(rendered)) == [{
+        'price_amount': Decimal('12.50'),
+        'start_date': datetime.date(2022, 2, 22),
+        'start_time': datetime.time(9, 30),
+        'created_at': datetime.datetime(2022, 2, 22, 12, 30, 15, 123456, tzinfo=datetime.timezone.utc),
+        'coordinates': {'type': 'Point', 'coordinates': [24.94, 60.17]},
+        'name': 'Jalkapallo',
+        'empty': None,
+    }]
+
+
+@pytest.mark.django_db
+def test_hobby_event_list_message_pack(api_client, hobbyevent):
+    url = reverse('hobbyevent-list')
+    response = api_client.get(url, {'hobby': hobbyevent.hobby.pk}, HTTP_ACCEPT='application/msgpack')
+    assert response.status_code == 200
+    assert response['Content-Type'] == 'application/msgpack'
+    data = MessagePackParser().parse(BytesIO(response.content))
+    assert data[0]['start_date'] == datetime.date(2019, 1, 1)
+    assert data[0]['start_time'] == datetime.time(9, 0)
+
+    response = api_client.get(url, {'hobby': hobbyevent.hobby.pk, 'format': 'msgpack'})
+    assert MessagePackParser().parse(BytesIO(response.content)) == data
+
+
+@freeze_time(FROZEN_DATE)
+@pytest.mark.django_db(transaction=True)
+def test_hobby_event_listing_message_pack(api_client, monkeypatch, hobby_with_events):
+    # Saving the hobby creates its listings
+    monkeypatch.setattr(settings, 'HOBBY_EVENT_LISTING_ENABLED', True)
+    hobby_with_events.price_type = Hobby.TYPE_PAID
+    hobby_with_events.price_amount = Decimal('12.50')
+    hobby_with_events.save()
+    url = reverse('hobbyevent-list')
+    query = {'hobby': hobby_with_events.pk, 'include': 'hobby_detail', 'format': 'msgpack'}
+    responses = []
+    for listings_enabled in (False, True):
+        monkeypatch.setattr(settings, 'HOBBY_EVENT_LISTING_ENABLED', listings_enabled)
+        response = api_client.get(url, query)
+        assert response.status_code == 200
+        responses.append(sorted(MessagePackParser().parse(BytesIO(response.content)), key=lambda event: event['id']))
+    events, listing_events = responses
+    assert events[0]['hobby']['price_amount'] == Decimal('12.50')
+    assert listing_events == events
+
+
+@pytest.mark.django_db
+def test_hobby_create_message_pack(user_api_client, valid_hobby_data):
+    response = user_api_client.post(
+        reverse('hobby-list'), MessagePackRenderer().render(valid_hobby_data), content_type='application/msgpack')
+    assert response.status_code == 201
+    assert response.data['name'] == valid_hobby_data['name']
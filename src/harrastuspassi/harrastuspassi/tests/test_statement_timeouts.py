@@ -0,0 +1,97 @@
+import logging
+
+import pytest
+from django.db import connection, connections
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from prometheus_client import REGISTRY
+from harrastuspassi import db_router, settings
+from harrastuspassi.api import HobbyEventViewSet, OrganizerViewSet
+from harrastuspassi.models import Organizer
+
+
+def get_timeout_count(view):
+    return REGISTRY.get_sample_value('harrastuspassi_statement_timeouts_total', {'view': view}) or 0
+
+
+def test_statement_timeout_by_view(monkeypatch):
+    hobby_event_list = HobbyEventViewSet(action='list')
+    assert hobby_event_list.get_statement_timeout() == HobbyEventViewSet.statement_timeouts['list']
+    assert HobbyEventViewSet(action='retrieve').get_statement_timeout() == settings.STATEMENT_TIMEOUT
+
+    monkeypatch.setattr(settings, 'STATEMENT_TIMEOUTS', {'HobbyEventViewSet': 20})
+    assert hobby_event_list.get_statement_timeout() == 20
+    monkeypatch.setattr(settings, 'STATEMENT_TIMEOUTS', {'HobbyEventViewSet': 20, 'HobbyEventViewSet.list': None})
+    assert hobby_event_list.get_statement_timeout() is None
+
+
+@pytest.mark.django_db
+def test_statement_timeout_is_set(api_client, monkeypatch):
+    monkeypatch.setattr(settings, 'STATEMENT_TIMEOUTS', {'OrganizerViewSet.list': 2.5})
+    statement_timeouts = []
+
+    def get_queryset(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SHOW statement_timeout')
+            statement_timeouts.append(cursor.fetchone()[0])
+        return Organizer.objects.all()
+
+    monkeypatch.setattr(OrganizerViewSet, 'get_queryset', get_queryset)
+    assert api_client.get(reverse('organizer-list')).status_code == 200
+    assert statement_timeouts == ['2500ms']
+
+
+@pytest.fixture
+def replica(monkeypatch):
+    """ A second connection to the test database without ATOMIC_REQUESTS, used by anonymous reads """
+    monkeypatch.setitem(connections.databases, 'replica', dict(connection.settings_dict, ATOMIC_REQUESTS=False))
+    monkeypatch.setattr(db_router, 'get_replica_for_request', lambda request: 'replica')
+    yield connections['replica']
+    connections['replica'].close()
+    del connections['replica']
+
+
+@pytest.mark.django_db(transaction=True)
+def test_statement_timeout_is_set_on_replica(api_client, monkeypatch, replica):
+    monkeypatch.setattr(settings, 'STATEMENT_TIMEOUTS', {'OrganizerViewSet.list': 2.5})
+    statement_timeouts = []
+
+    def get_queryset(self):
+        with replica.cursor() as cursor:
+            cursor.execute('SHOW statement_timeout')
+            statement_timeouts.append(cursor.fetchone()[0])
+        return Organizer.objects.all()
+
+    monkeypatch.setattr(OrganizerViewSet, 'get_queryset', get_queryset)
+    with CaptureQueriesContext(connection) as primary_queries:
+        assert api_client.get(reverse('organizer-list')).status_code == 200
+    assert statement_timeouts == ['2500ms']
+    assert not replica.in_atomic_block
+    # The primary is not touched by the replica read
+    assert len(primary_queries) == 0
+
+
+@pytest.mark.django_db(transaction=True)
+def test_statement_timeout_without_atomic_requests_is_logged(api_client, monkeypatch, caplog):
+    monkeypatch.setitem(connection.settings_dict, 'ATOMIC_REQUESTS', False)
+    monkeypatch.setattr(settings, 'STATEMENT_TIMEOUTS', {'OrganizerViewSet.list': 2.5})
+    with caplog.at_level(logging.WARNING, logger='harrastuspassi.api'):
+        assert api_client.get(reverse('organizer-list')).status_code == 200
+    assert 'Statement timeout not set without ATOMIC_REQUESTS' in caplog.text
+
+
+@pytest.mark.django_db
+def test_cancelled_query_returns_503(api_client, monkeypatch):
+    monkeypatch.setattr(settings, 'STATEMENT_TIMEOUTS', {'OrganizerViewSet.list': 0.1})
+
+    def get_queryset(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_sleep(1)')
+        return Organizer.objects.all()
+
+    monkeypatch.setattr(OrganizerViewSet, 'get_queryset', get_queryset)
+    count = get_timeout_count('OrganizerViewSet.list')
+    response = api_client.get(reverse('organizer-list'))
+    assert response.status_code == 503
+    assert response['Retry-After'] == str(settings.STATEMENT_TIMEOUT_RETRY_AFTER)
+    assert get_timeout_count('OrganizerViewSet.list') == count + 1
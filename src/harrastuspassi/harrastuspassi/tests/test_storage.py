@@ -0,0 +1,86 @@
+import pytest
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from harrastuspassi.images import get_derivative_name
+from harrastuspassi.models import Hobby
+
+boto3 = pytest.importorskip('boto3')
+moto = pytest.importorskip('moto')
+
+BUCKET_NAME = 'harrastuspassi-test'
+DIGEST = 'a' * 64
+
+
+@pytest.fixture
+def s3_storage(settings):
+    """ MediaStorage as the default storage, against a bucket in moto's S3 stand-in """
+    settings.AWS_ACCESS_KEY_ID = 'testing'
+    settings.AWS_SECRET_ACCESS_KEY = 'testing'
+    settings.AWS_S3_REGION_NAME = 'us-east-1'
+    settings.AWS_STORAGE_BUCKET_NAME = BUCKET_NAME
+    with moto.mock_s3():
+        boto3.client('s3', region_name='us-east-1').create_bucket(Bucket=BUCKET_NAME)
+        settings.DEFAULT_FILE_STORAGE = 'harrastuspassi.storage.MediaStorage'
+        yield default_storage
+
+
+def get_object(name):
+    return boto3.client('s3', region_name='us-east-1').head_object(Bucket=BUCKET_NAME, Key=name)
+
+
+def test_content_addressed_files_are_immutable(s3_storage):
+    name = s3_storage.save(f'hobby_images/{DIGEST}.jpg', ContentFile(b'imported'))
+    assert name == f'hobby_images/{DIGEST}.jpg'
+    assert 'immutable' in get_object(name)['CacheControl']
+    assert get_object(name)['ContentType'] == 'image/jpeg'
+
+    name = s3_storage.save('hobby_images/uploaded.jpg', ContentFile(b'uploaded'))
+    assert 'immutable' not in get_object(name)['CacheControl']
+
+
+def test_files_are_not_overwritten(s3_storage):
+    first_name = s3_storage.save('hobby_images/uploaded.jpg', ContentFile(b'first'))
+    second_name = s3_storage.save('hobby_images/uploaded.jpg', ContentFile(b'second'))
+    assert first_name != second_name
+    with s3_storage.open(first_name) as first_file:
+        assert first_file.read() == b'first'
+
+
+def test_multipart_upload(s3_storage, monkeypatch):
+    monkeypatch.setattr(s3_storage, 'transfer_config', boto3.s3.transfer.TransferConfig(
+        multipart_threshold=5 * 1024 * 1024, multipart_chunksize=5 * 1024 * 1024))
+    content = b'x' * (11 * 1024 * 1024)
+    name = s3_storage.save('hobby_images/large.jpg', ContentFile(content))
+    # The ETag of a multipart upload ends with the number of parts
+    assert get_object(name)['ETag'].strip('"').endswith('-3')
+    assert s3_storage.size(name) == len(content)
+
+
+def test_gzip(s3_storage, monkeypatch):
+    monkeypatch.setattr(s3_storage, 'gzip', True)
+    content = b'body { color: black; }' * 100
+    name = s3_storage.save('hobby_images/style.css', ContentFile(content))
+    assert get_object(name)['ContentEncoding'].startswith('gzip')
+    assert get_object(name)['ContentLength'] < len(content)
+
+
+def test_custom_domain_url(s3_storage, settings):
+    settings.AWS_S3_CUSTOM_DOMAIN = 'cdn.example.com'
+    from harrastuspassi.storage import MediaStorage
+    assert MediaStorage().url(f'hobby_images/{DIGEST}.jpg') == f'https://cdn.example.com/hobby_images/{DIGEST}.jpg'
+
+
+@pytest.mark.django_db
+def test_clean_mediaroot_s3(s3_storage, hobby):
+    Hobby.objects.filter(pk=hobby.pk).update(cover_image='hobby_images/referenced.jpg')
+    referenced = s3_storage.save('hobby_images/referenced.jpg', ContentFile(b'foo'))
+    derivative = s3_storage.save(get_derivative_name(referenced, 300, 'jpeg'), ContentFile(b'foo'))
+    unreferenced = s3_storage.save('hobby_images/unreferenced.jpg', ContentFile(b'foo'))
+    cached = s3_storage.save('cache/foo.jpg', ContentFile(b'foo'))
+
+    call_command('clean_mediaroot', '--noinput')
+    assert s3_storage.exists(referenced)
+    assert s3_storage.exists(derivative)
+    assert s3_storage.exists(cached)
+    assert not s3_storage.exists(unreferenced)
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+import mimetypes
+import os
+from urllib.parse import quote
+
+from django.conf import settings as django_settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import require_safe
+from django.views.static import serve
+
+from harrastuspassi import settings
+from harrastuspassi.images import IMMUTABLE_MAX_AGE, is_content_addressed
+
+SERVING_DJANGO = 'django'
+SERVING_X_ACCEL_REDIRECT = 'x-accel-redirect'
+SERVING_X_SENDFILE = 'x-sendfile'
+
+
+@require_safe
+def serve_media(request, path):
+    """ Serves files from MEDIA_ROOT. Depending on HARRASTUSPASSI_MEDIA_SERVING, Django only checks the path
+        and the web server in front of it sends the file, so that downloads do not occupy application workers.
+    """
+    try:
+        full_path = safe_join(django_settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404('Not found')
+    if not os.path.isfile(full_path):
+        raise Http404('Not found')
+
+    if settings.MEDIA_SERVING == SERVING_X_ACCEL_REDIRECT:
+        response = HttpResponse(content_type=mimetypes.guess_type(full_path)[0] or 'application/octet-stream')
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_REDIRECT_LOCATION + quote(path)
+    elif settings.MEDIA_SERVING == SERVING_X_SENDFILE:
+        response = HttpResponse(content_type=mimetypes.guess_type(full_path)[0] or 'application/octet-stream')
+        response['X-Sendfile'] = full_path
+    else:
+        response = serve(request, path, document_root=django_settings.MEDIA_ROOT)
+
+    if is_content_addressed(path):
+        # The content of the file can never change without the name changing
+        patch_cache_control(response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, public=True, max_age=settings.MEDIA_CACHE_MAX_AGE)
+    return response
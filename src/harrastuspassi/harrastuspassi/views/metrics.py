@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+import hmac
+import ipaddress
+
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import CONTENT_TYPE_LATEST
+
+from harrastuspassi import settings
+from harrastuspassi.metrics import render_metrics
+
+
+def is_metrics_access_allowed(request) -> bool:
+    """ Requests with the bearer token HARRASTUSPASSI_METRICS_TOKEN, or from HARRASTUSPASSI_METRICS_ALLOWED_IPS """
+    if settings.METRICS_TOKEN:
+        scheme, _, token = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+        if scheme.lower() == 'bearer' and hmac.compare_digest(
+                token.strip().encode('utf-8'), settings.METRICS_TOKEN.encode('utf-8')):
+            return True
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network) for network in settings.METRICS_ALLOWED_IPS)
+
+
+def metrics_view(request):
+    # Scrapes query the database for the queue sizes, so they are not open to everyone
+    if not is_metrics_access_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(render_metrics(), content_type=CONTENT_TYPE_LATEST)